@@ -15,20 +15,32 @@ Formula (Implementation Contract v1.0):
 Usage:
     PYTHONPATH=. python scripts/batch_conviction_score.py --county Gaston --state NC
     PYTHONPATH=. python scripts/batch_conviction_score.py --county Gaston --state NC --dry-run
+    PYTHONPATH=. python scripts/batch_conviction_score.py --county Gaston --state NC --in-db
 """
 
 import argparse
 import json
+import queue
+import threading
 import time
+from dataclasses import dataclass, fields
 from datetime import datetime
 
+import numpy as np
 from dotenv import load_dotenv
 load_dotenv()
 
 import structlog
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
 
-from src.db import get_db_connection, migrate_add_conviction_columns
+from src.db import (
+    get_db_connection,
+    migrate_add_conviction_columns,
+    compute_conviction_scores,
+    get_conviction_summary,
+    copy_rows,
+    copy_rows_to_temp,
+)
 
 logger = structlog.get_logger("batch_conviction")
 
@@ -40,53 +52,125 @@ VAC_BONUS_MAX = 2.5
 MODEL_VERSION = "v1.0"
 
 
-def clamp(x, lo, hi):
-    return max(lo, min(x, hi))
+# Component bitmask: DS=4, MC=2, VAC=1. Results carry the int; labels are
+# only rendered for the DB write and printouts.
+_COMP_STRINGS = ["", "VAC", "MC", "MC,VAC", "DS", "DS,VAC", "DS,MC", "DS,MC,VAC"]
 
 
-def compute_conviction(ds_composite, mc_raw, mc_count, flag_vacancy, vac_conf, usps_error):
-    """
-    Compute conviction score per Implementation Contract v1.0.
+def components_label(mask: int) -> str | None:
+    """Render a component bitmask as the stored label ("DS,MC,VAC"), None if empty."""
+    return _COMP_STRINGS[mask] or None
 
-    Returns (conviction_score, base_score, vacancy_bonus, components_list)
-    All may be None if not rankable.
+
+def _compute_conviction_kernel(ds, mc_raw, mc_count, flag_vac, vac_conf, usps_err):
+    """
+    Scalar v1.0 arithmetic on plain floats/ints/bools (NaN = missing), so it
+    can be JIT-compiled. Returns (score, base, vac_bonus, component_mask)
+    unrounded; score/base are NaN when not rankable.
     """
-    # ds_component
-    ds_comp = None if ds_composite is None else clamp(ds_composite / 10.0, 0, 1)
+    has_ds = ds == ds
+    has_mc = mc_count > 0
 
-    # mc_component — NULL if no signals (missing coverage, not zero evidence)
-    mc_comp = None if (mc_count is None or mc_count == 0) else clamp(mc_raw / MC_CAP, 0, 1)
+    ds_comp = min(max(ds / 10.0, 0.0), 1.0) if has_ds else 0.0
+    mc_comp = min(max(mc_raw / MC_CAP, 0.0), 1.0) if has_mc else 0.0
 
-    # vacancy_bonus — only if flag_vacancy=True AND no usps_error
     vac_bonus = 0.0
-    if flag_vacancy and not usps_error:
-        vc = clamp(vac_conf if vac_conf is not None else 0.8, 0, 1)
-        vac_bonus = VAC_BONUS_MAX * vc
-
-    # base weight sum (reweighted — skip missing components)
-    base_sum = (W_DS if ds_comp is not None else 0) + (W_MC if mc_comp is not None else 0)
+    if flag_vac and not usps_err:
+        vc = vac_conf if vac_conf == vac_conf else 0.8
+        vac_bonus = VAC_BONUS_MAX * min(max(vc, 0.0), 1.0)
 
+    base_sum = (W_DS if has_ds else 0.0) + (W_MC if has_mc else 0.0)
     if base_sum == 0:
+        return np.nan, np.nan, vac_bonus, 0
+
+    base = 10 * (W_DS * ds_comp + W_MC * mc_comp) / base_sum
+    score = min(max(base + vac_bonus, 0.0), 10.0)
+    mask = (4 if has_ds else 0) | (2 if has_mc else 0) | (1 if vac_bonus > 0 else 0)
+    return score, base, vac_bonus, mask
+
+
+# numba is optional: with it the kernel is compiled (no fastmath — the NaN
+# checks above must survive); without it the same code runs as Python.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    _compute_conviction_kernel = njit(cache=True)(_compute_conviction_kernel)
+    _compute_conviction_kernel(1.0, 1.0, 1, True, 0.5, False)  # compile at import
+
+
+def compute_conviction(ds_composite, mc_raw, mc_count, flag_vacancy, vac_conf, usps_error):
+    """
+    Compute conviction score per Implementation Contract v1.0.
+
+    Returns (conviction_score, base_score, vacancy_bonus, components_list)
+    All may be None if not rankable.
+    """
+    score, base, vac_bonus, mask = _compute_conviction_kernel(
+        np.nan if ds_composite is None else float(ds_composite),
+        float(mc_raw or 0),
+        int(mc_count or 0),
+        bool(flag_vacancy),
+        np.nan if vac_conf is None else float(vac_conf),
+        bool(usps_error),
+    )
+    if score != score:
         return None, None, round(vac_bonus, 2), []
+    return round(score, 2), round(base, 2), round(vac_bonus, 2), _COMP_STRINGS[mask].split(",") if mask else []
 
-    base = 10 * ((W_DS * (ds_comp or 0)) + (W_MC * (mc_comp or 0))) / base_sum
-    score = round(clamp(base + vac_bonus, 0, 10), 2)
 
-    components = []
-    if ds_comp is not None:
-        components.append("DS")
-    if mc_comp is not None:
-        components.append("MC")
-    if vac_bonus > 0:
-        components.append("VAC")
+# Column order of the Phase A query — rows are indexed by position, not name
+_PARCEL_COLUMNS = (
+    "parcel_id", "distress_composite", "flag_vacancy", "vacancy_confidence",
+    "usps_error", "mc_raw_score", "mc_signal_count", "mc_signal_codes",
+)
 
-    return score, round(base, 2), round(vac_bonus, 2), components
+FETCH_CHUNK_SIZE = 10000
+PIPELINE_QUEUE_SIZE = 8  # scored chunks buffered between compute and COPY
 
 
-def fetch_parcel_data(conn, county: str, state: str):
+def _parcel_columns(rows: list[tuple]) -> dict:
+    """
+    Convert a batch of Phase A rows into parallel column arrays.
+
+    Missing distress_composite is NaN. Falsy vacancy_confidence (NULL or 0)
+    is NaN so the scorer applies the 0.8 default; usps_error is reduced to
+    a truthiness mask. mc_signal_codes arrives as a raw array_agg list and is
+    deduped/sorted here rather than in a per-group sort on the server.
+    """
+    n = len(rows)
+    (parcel_id, ds, flag_vac, vac_conf, usps_err,
+     mc_raw, mc_count, mc_codes) = zip(*rows) if rows else ((),) * len(_PARCEL_COLUMNS)
+    return {
+        "parcel_id": np.array(parcel_id, dtype=object),
+        "distress_composite": np.fromiter(
+            (np.nan if v is None else float(v) for v in ds), dtype=np.float64, count=n),
+        "flag_vacancy": np.fromiter((bool(v) for v in flag_vac), dtype=bool, count=n),
+        "vacancy_confidence": np.fromiter(
+            (float(v) if v else np.nan for v in vac_conf), dtype=np.float64, count=n),
+        "usps_error": np.fromiter((bool(v) for v in usps_err), dtype=bool, count=n),
+        "mc_raw_score": np.fromiter((float(v) if v else 0.0 for v in mc_raw), dtype=np.float64, count=n),
+        "mc_signal_count": np.fromiter((v or 0 for v in mc_count), dtype=np.int64, count=n),
+        "mc_signal_codes": np.array(
+            [",".join(sorted(set(v))) if v else None for v in mc_codes], dtype=object),
+    }
+
+
+def _concat_columns(chunks: list[dict]) -> dict:
+    """Concatenate per-batch column dicts into one set of column arrays."""
+    if not chunks:
+        return _parcel_columns([])
+    return {col: np.concatenate([c[col] for c in chunks]) for col in _PARCEL_COLUMNS}
+
+
+def iter_parcel_chunks(conn, county: str, state: str, chunk_size: int = FETCH_CHUNK_SIZE):
     """
     Phase A: Fetch all parcels with MC signal aggregates using canonical JOIN.
-    Returns list of dicts with DS + MC + USPS fields.
+
+    Streams rows through a server-side cursor and yields one set of column
+    arrays (see _parcel_columns) per fetchmany batch.
     """
     query = """
         SELECT
@@ -97,7 +181,7 @@ def fetch_parcel_data(conn, county: str, state: str):
             g.usps_error,
             COALESCE(SUM(st.base_weight * LEAST(GREATEST(ps.confidence, 0), 1)), 0) AS mc_raw_score,
             COUNT(ps.id) AS mc_signal_count,
-            STRING_AGG(DISTINCT st.code, ',' ORDER BY st.code) AS mc_signal_codes
+            array_agg(st.code) FILTER (WHERE st.code IS NOT NULL) AS mc_signal_codes
         FROM gis_parcels_core g
         JOIN counties c
             ON lower(c.name) = lower(g.county)
@@ -116,65 +200,230 @@ def fetch_parcel_data(conn, county: str, state: str):
         GROUP BY g.parcel_id, g.distress_composite, g.flag_vacancy,
                  g.vacancy_confidence, g.usps_error
     """
-    with conn.cursor() as cur:
+    with conn.cursor(name="conviction_fetch") as cur:
+        cur.itersize = chunk_size
         cur.execute(query, (county, state))
-        columns = [desc[0] for desc in cur.description]
-        rows = cur.fetchall()
-    return [dict(zip(columns, row)) for row in rows]
-
-
-def compute_all_scores(parcels: list[dict]) -> list[dict]:
-    """Phase B: Compute conviction scores for all parcels."""
-    results = []
-    for p in parcels:
-        score, base, vac_bonus, components = compute_conviction(
-            ds_composite=p["distress_composite"],
-            mc_raw=float(p["mc_raw_score"]) if p["mc_raw_score"] else 0,
-            mc_count=p["mc_signal_count"],
-            flag_vacancy=p["flag_vacancy"],
-            vac_conf=float(p["vacancy_confidence"]) if p["vacancy_confidence"] else None,
-            usps_error=p["usps_error"],
-        )
-        results.append({
-            "parcel_id": p["parcel_id"],
-            "conviction_score": score,
-            "conviction_base_score": base,
-            "conviction_vacancy_bonus": vac_bonus,
-            "conviction_mc_score": float(p["mc_raw_score"]) if p["mc_raw_score"] and p["mc_signal_count"] > 0 else None,
-            "conviction_mc_signals": p["mc_signal_count"] if p["mc_signal_count"] > 0 else None,
-            "conviction_mc_codes": p["mc_signal_codes"],
-            "conviction_components": ",".join(components) if components else None,
-        })
-    return results
-
-
-def flush_conviction_scores(results: list[dict], county: str, chunk_size: int = 5000):
-    """Phase C: Batch UPDATE gis_parcels_core with conviction scores."""
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield _parcel_columns(rows)
+
+
+def fetch_parcel_data(conn, county: str, state: str, chunk_size: int = FETCH_CHUNK_SIZE) -> dict:
+    """Phase A: Fetch the whole county as one set of column arrays."""
+    return _concat_columns(list(iter_parcel_chunks(conn, county, state, chunk_size)))
+
+
+def compute_conviction_arrays(ds_composite, mc_raw, mc_count, flag_vacancy, vac_conf, usps_error):
+    """
+    Vectorized compute_conviction over parallel 1-D arrays (NaN = missing).
+
+    Returns (score, base, vac_bonus, has_ds, has_mc, has_vac). score/base are
+    NaN where the parcel is not rankable; has_* are the component masks.
+    """
+    ds_comp = np.clip(ds_composite / 10.0, 0, 1)
+    has_ds = ~np.isnan(ds_comp)
+
+    has_mc = mc_count > 0
+    mc_comp = np.where(has_mc, np.clip(mc_raw / MC_CAP, 0, 1), 0.0)
+
+    vac_on = flag_vacancy & ~usps_error
+    vac_bonus = np.where(vac_on, VAC_BONUS_MAX * np.clip(np.nan_to_num(vac_conf, nan=0.8), 0, 1), 0.0)
+
+    base_sum = W_DS * has_ds + W_MC * has_mc
+    rankable = base_sum > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        base = 10 * (W_DS * np.nan_to_num(ds_comp) + W_MC * mc_comp) / base_sum
+    base = np.where(rankable, base, np.nan)
+    score = np.round(np.clip(base + vac_bonus, 0, 10), 2)
+
+    has_vac = rankable & (vac_bonus > 0)
+    return score, np.round(base, 2), np.round(vac_bonus, 2), has_ds & rankable, has_mc & rankable, has_vac
+
+
+@dataclass
+class ConvictionResults:
+    """
+    Phase B output as parallel column arrays (one slot per parcel).
+
+    Missing values: NaN in the float columns, 0 in conviction_mc_signals,
+    None in conviction_mc_codes. conviction_components is the DS/MC/VAC
+    bitmask (see components_label). Conversion to SQL NULLs and labels
+    happens only in copy_rows() / record().
+    """
+    parcel_id: np.ndarray
+    conviction_score: np.ndarray
+    conviction_base_score: np.ndarray
+    conviction_vacancy_bonus: np.ndarray
+    conviction_mc_score: np.ndarray
+    conviction_mc_signals: np.ndarray
+    conviction_mc_codes: np.ndarray
+    conviction_components: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.parcel_id)
+
+    @classmethod
+    def concat(cls, parts: list["ConvictionResults"]) -> "ConvictionResults":
+        if not parts:
+            return compute_all_scores(_parcel_columns([]))
+        return cls(**{f.name: np.concatenate([getattr(p, f.name) for p in parts])
+                      for f in fields(cls)})
+
+    def record(self, i: int) -> dict:
+        """One parcel's result as a dict of DB-ready values (None for NULL)."""
+        def opt(v):
+            return None if np.isnan(v) else float(v)
+        signals = int(self.conviction_mc_signals[i])
+        return {
+            "parcel_id": self.parcel_id[i],
+            "conviction_score": opt(self.conviction_score[i]),
+            "conviction_base_score": opt(self.conviction_base_score[i]),
+            "conviction_vacancy_bonus": float(self.conviction_vacancy_bonus[i]),
+            "conviction_mc_score": opt(self.conviction_mc_score[i]),
+            "conviction_mc_signals": signals if signals > 0 else None,
+            "conviction_mc_codes": self.conviction_mc_codes[i],
+            "conviction_components": components_label(int(self.conviction_components[i])),
+        }
+
+    def copy_rows(self):
+        """Rows in _CONVICTION_COPY_COLUMNS order for the COPY write."""
+        # tolist() once per column, then zip — no per-row NumPy scalar boxing
+        score = self.conviction_score.tolist()
+        base = self.conviction_base_score.tolist()
+        mc_score = self.conviction_mc_score.tolist()
+        signals = self.conviction_mc_signals.tolist()
+        labels = [_COMP_STRINGS[m] or None for m in self.conviction_components.tolist()]
+        return zip(self.parcel_id.tolist(), score, base, self.conviction_vacancy_bonus.tolist(),
+                   mc_score, [n if n > 0 else None for n in signals],
+                   self.conviction_mc_codes.tolist(), labels)
+
+
+def compute_all_scores(parcels: dict) -> ConvictionResults:
+    """Phase B: Compute conviction scores for all parcels (vectorized over column arrays)."""
+    mc_raw = parcels["mc_raw_score"]
+    mc_count = parcels["mc_signal_count"]
+    score, base, vac_bonus, has_ds, has_mc, has_vac = compute_conviction_arrays(
+        parcels["distress_composite"], mc_raw, mc_count, parcels["flag_vacancy"],
+        parcels["vacancy_confidence"], parcels["usps_error"])
+
+    comp_mask = ((has_ds.astype(np.uint8) << 2) | (has_mc.astype(np.uint8) << 1)
+                 | has_vac.astype(np.uint8))
+
+    return ConvictionResults(
+        parcel_id=parcels["parcel_id"],
+        conviction_score=score,
+        conviction_base_score=base,
+        conviction_vacancy_bonus=vac_bonus,
+        conviction_mc_score=np.where((mc_raw != 0) & (mc_count > 0), mc_raw, np.nan),
+        conviction_mc_signals=np.where(mc_count > 0, mc_count, 0),
+        conviction_mc_codes=parcels["mc_signal_codes"],
+        conviction_components=comp_mask,
+    )
+
+
+# Temp-table layout for the COPY-based conviction flush
+_CONVICTION_COPY_COLUMNS = [
+    ("parcel_id", "TEXT"),
+    ("conviction_score", "REAL"),
+    ("conviction_base_score", "REAL"),
+    ("conviction_vacancy_bonus", "REAL"),
+    ("conviction_mc_score", "REAL"),
+    ("conviction_mc_signals", "INTEGER"),
+    ("conviction_mc_codes", "TEXT"),
+    ("conviction_components", "TEXT"),
+]
+
+
+_CONVICTION_APPLY_SQL = """
+    UPDATE gis_parcels_core g SET
+        conviction_score = t.conviction_score,
+        conviction_base_score = t.conviction_base_score,
+        conviction_vacancy_bonus = t.conviction_vacancy_bonus,
+        conviction_mc_score = t.conviction_mc_score,
+        conviction_mc_signals = t.conviction_mc_signals,
+        conviction_mc_codes = t.conviction_mc_codes,
+        conviction_components = t.conviction_components,
+        conviction_date = NOW()
+    FROM tmp_conviction t
+    WHERE g.parcel_id = t.parcel_id AND g.county = %s
+"""
+
+
+def score_and_flush_pipelined(county: str, state: str,
+                              chunk_size: int = FETCH_CHUNK_SIZE) -> tuple[dict, ConvictionResults]:
+    """
+    Phases A-C overlapped: a producer thread streams parcel chunks from the
+    server-side cursor and scores them, while this thread COPYs each scored
+    chunk into the temp table as it arrives. One UPDATE ... FROM applies the
+    whole county at the end, so the write is still a single transaction.
+
+    Returns (parcels, results) for the summary and Phase D.
+    """
+    q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    # Set by the consumer on exit so a producer blocked on a full queue
+    # gives up instead of holding its cursor open forever
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        fetch_conn = chunks_iter = None
+        try:
+            fetch_conn = get_db_connection()
+            chunks_iter = iter_parcel_chunks(fetch_conn, county, state, chunk_size)
+            for cols in chunks_iter:
+                if not put((cols, compute_all_scores(cols))):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            if chunks_iter is not None:
+                chunks_iter.close()  # closes the server-side cursor
+            if fetch_conn is not None:
+                fetch_conn.close()
+
+    thread = threading.Thread(target=producer, name="conviction-producer", daemon=True)
+    thread.start()
+
+    chunks, results = [], []
+    n_rows = 0
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
-            for i in range(0, len(results), chunk_size):
-                chunk = results[i:i + chunk_size]
-                execute_batch(cur, """
-                    UPDATE gis_parcels_core SET
-                        conviction_score = %(conviction_score)s,
-                        conviction_base_score = %(conviction_base_score)s,
-                        conviction_vacancy_bonus = %(conviction_vacancy_bonus)s,
-                        conviction_mc_score = %(conviction_mc_score)s,
-                        conviction_mc_signals = %(conviction_mc_signals)s,
-                        conviction_mc_codes = %(conviction_mc_codes)s,
-                        conviction_components = %(conviction_components)s,
-                        conviction_date = NOW()
-                    WHERE parcel_id = %(parcel_id)s AND county = %(county)s
-                """, [{**r, "county": county} for r in chunk], page_size=500)
-                conn.commit()
-                logger.info("conviction_flush", chunk=i // chunk_size + 1,
-                            rows=len(chunk), total_so_far=min(i + chunk_size, len(results)))
+            copy_rows_to_temp(cur, "tmp_conviction", _CONVICTION_COPY_COLUMNS, ())
+            while True:
+                item = q.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                cols, chunk_results = item
+                copy_rows(cur, "tmp_conviction", chunk_results.copy_rows())
+                chunks.append(cols)
+                results.append(chunk_results)
+                n_rows += len(chunk_results)
+            cur.execute(_CONVICTION_APPLY_SQL, (county,))
+            updated = cur.rowcount
+        conn.commit()
+        logger.info("conviction_flush", rows=n_rows, updated=updated, chunks=len(chunks))
     finally:
         conn.close()
+        stop.set()
+        thread.join()
+    return _concat_columns(chunks), ConvictionResults.concat(results)
 
 
-def backfill_motivation_scores(county: str, state: str, parcels_data: list[dict]):
+def backfill_motivation_scores(county: str, state: str, parcels_data: dict):
     """
     Phase D: Backfill MC's motivation_scores table.
     County-scoped DELETE + INSERT (not ON CONFLICT — schema uses (parcel_id, computed_at) unique).
@@ -193,43 +442,82 @@ def backfill_motivation_scores(county: str, state: str, parcels_data: list[dict]
             deleted = cur.rowcount
             logger.info("motivation_scores_deleted", county=county, rows=deleted)
 
-            # Insert only parcels with MC signals
-            mc_parcels = [p for p in parcels_data if p["mc_signal_count"] > 0]
-            if mc_parcels:
-                execute_batch(cur, """
+            # Insert only parcels with MC signals — one multi-row VALUES
+            # statement per page instead of one INSERT...SELECT per parcel.
+            # county/state are pre-bound so VALUES %s is the only placeholder.
+            mc_idx = np.flatnonzero(parcels_data["mc_signal_count"] > 0)
+            if mc_idx.size:
+                county_filter = cur.mogrify(
+                    "lower(c.name) = lower(%s) AND c.state_code = %s", (county, state)
+                ).decode().replace("%", "%%")
+                rows = []
+                for i in mc_idx:
+                    raw = float(parcels_data["mc_raw_score"][i])
+                    codes = parcels_data["mc_signal_codes"][i]
+                    rows.append((
+                        parcels_data["parcel_id"][i],
+                        raw,
+                        int(parcels_data["mc_signal_count"][i]),
+                        json.dumps({
+                            "signals": (codes or "").split(","),
+                            "raw_score": raw,
+                            "model": MODEL_VERSION,
+                        }),
+                    ))
+                execute_values(cur, f"""
                     INSERT INTO motivation_scores (parcel_id, total_score, signal_count, score_breakdown, computed_at)
-                    SELECT p.id, %(mc_raw_score)s, %(mc_signal_count)s,
-                           %(score_breakdown)s::jsonb, NOW()
-                    FROM parcels p
+                    SELECT p.id, v.total_score, v.signal_count, v.breakdown::jsonb, NOW()
+                    FROM (VALUES %s) AS v(parcel_ext_id, total_score, signal_count, breakdown)
+                    JOIN parcels p ON p.parcel_id = v.parcel_ext_id
                     JOIN counties c ON p.county_id = c.id
-                    WHERE p.parcel_id = %(parcel_id)s
-                      AND lower(c.name) = lower(%(county)s)
-                      AND c.state_code = %(state)s
-                """, [{
-                    "parcel_id": p["parcel_id"],
-                    "mc_raw_score": float(p["mc_raw_score"]),
-                    "mc_signal_count": p["mc_signal_count"],
-                    "score_breakdown": json.dumps({
-                        "signals": (p["mc_signal_codes"] or "").split(","),
-                        "raw_score": float(p["mc_raw_score"]),
-                        "model": MODEL_VERSION,
-                    }),
-                    "county": county,
-                    "state": state,
-                } for p in mc_parcels], page_size=500)
+                    WHERE {county_filter}
+                """, rows, template="(%s, %s, %s, %s)", page_size=1000)
 
             conn.commit()
-            logger.info("motivation_scores_inserted", county=county, rows=len(mc_parcels))
+            logger.info("motivation_scores_inserted", county=county, rows=int(mc_idx.size))
     finally:
         conn.close()
 
 
+def run_in_db(args, start: float):
+    """Phases A-C as a single SQL UPDATE; summary is read back from the DB."""
+    print("  Phase A-C: Computing conviction scores in SQL...")
+    conn = get_db_connection()
+    try:
+        updated = compute_conviction_scores(conn, args.county, args.state, w_ds=W_DS, w_mc=W_MC,
+                                            mc_cap=MC_CAP, vac_bonus_max=VAC_BONUS_MAX)
+        summary = get_conviction_summary(conn, args.county, args.state)
+    finally:
+        conn.close()
+    print(f"  Written: {updated} rows")
+
+    print(f"  Coverage: {summary['ds_parcels']} DS | {summary['mc_parcels']} MC | "
+          f"{summary['vac_parcels']} USPS-vacant")
+    print(f"  Scored: {summary['scored']}/{summary['parcels']} (avg={summary['avg_score']:.2f}, "
+          f"min={summary['min_score']:.2f}, max={summary['max_score']:.2f})")
+    print(f"  Component distribution:")
+    for k, v in summary["components"].items():
+        print(f"    {k:<12} {v:>6} parcels")
+    print("  Phase D: Skipped (--in-db; run without it to backfill motivation_scores)")
+
+    elapsed = time.time() - start
+    print(f"\n=== Conviction Score Complete ===")
+    print(f"  Parcels:    {summary['parcels']}")
+    print(f"  Scored:     {summary['scored']}")
+    print(f"  MC joined:  {summary['mc_parcels']}")
+    print(f"  Vacant:     {summary['vac_parcels']}")
+    print(f"  Time:       {elapsed:.1f}s")
+    print(f"  Model:      {MODEL_VERSION}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Batch Conviction Score Fusion")
     parser.add_argument("--county", required=True)
     parser.add_argument("--state", default="NC")
     parser.add_argument("--dry-run", action="store_true", help="Compute but don't write")
     parser.add_argument("--skip-motivation", action="store_true", help="Skip motivation_scores backfill")
+    parser.add_argument("--in-db", action="store_true",
+                        help="Compute + write scores in one SQL UPDATE (no fetch/write-back; skips Phase D)")
     args = parser.parse_args()
 
     print(f"\n=== Conviction Score Fusion — {args.county}, {args.state} ===")
@@ -242,38 +530,49 @@ def main():
     migrate_add_conviction_columns(conn)
     conn.close()
 
-    # Phase A: Fetch + aggregate
-    print("  Phase A: Fetching parcels + MC signal aggregates...")
-    conn = get_db_connection()
-    parcels = fetch_parcel_data(conn, args.county, args.state)
-    conn.close()
-    print(f"  Loaded {len(parcels)} parcels")
+    if args.in_db and not args.dry_run:
+        run_in_db(args, start)
+        return
 
-    mc_parcels = sum(1 for p in parcels if p["mc_signal_count"] > 0)
-    ds_parcels = sum(1 for p in parcels if p["distress_composite"] is not None)
-    vac_parcels = sum(1 for p in parcels if p["flag_vacancy"])
-    print(f"  Coverage: {ds_parcels} DS | {mc_parcels} MC | {vac_parcels} USPS-vacant")
+    if args.dry_run:
+        # Phase A: Fetch + aggregate
+        print("  Phase A: Fetching parcels + MC signal aggregates...")
+        conn = get_db_connection()
+        parcels = fetch_parcel_data(conn, args.county, args.state)
+        conn.close()
 
-    # Phase B: Compute scores
-    print("  Phase B: Computing conviction scores...")
-    results = compute_all_scores(parcels)
+        # Phase B: Compute scores
+        print("  Phase B: Computing conviction scores...")
+        results = compute_all_scores(parcels)
+    else:
+        # Phases A-C: fetch/score chunks overlapped with the COPY into the temp table
+        print("  Phase A-C: Fetching, scoring and writing conviction scores (pipelined)...")
+        parcels, results = score_and_flush_pipelined(args.county, args.state)
+        print(f"  Written: {len(results)} rows")
+
+    n_parcels = len(parcels["parcel_id"])
+    print(f"  Loaded {n_parcels} parcels")
+
+    # Coverage straight off the column arrays — single C-level reductions
+    mc_parcels = np.count_nonzero(parcels["mc_signal_count"] > 0)
+    ds_parcels = n_parcels - np.count_nonzero(np.isnan(parcels["distress_composite"]))
+    vac_parcels = np.count_nonzero(parcels["flag_vacancy"])
+    print(f"  Coverage: {ds_parcels} DS | {mc_parcels} MC | {vac_parcels} USPS-vacant")
 
-    scored = sum(1 for r in results if r["conviction_score"] is not None)
-    scores = [r["conviction_score"] for r in results if r["conviction_score"] is not None]
-    if scores:
-        avg_score = sum(scores) / len(scores)
-        max_score = max(scores)
-        min_score = min(scores)
+    scores = results.conviction_score[~np.isnan(results.conviction_score)]
+    scored = scores.size
+    if scored:
+        avg_score = float(scores.mean())
+        max_score = float(scores.max())
+        min_score = float(scores.min())
     else:
         avg_score = max_score = min_score = 0
 
     # Component distribution
-    comp_dist = {}
-    for r in results:
-        key = r["conviction_components"] or "NULL"
-        comp_dist[key] = comp_dist.get(key, 0) + 1
+    masks, counts = np.unique(results.conviction_components, return_counts=True)
+    comp_dist = {components_label(int(m)) or "NULL": int(c) for m, c in zip(masks, counts)}
 
-    print(f"  Scored: {scored}/{len(parcels)} (avg={avg_score:.2f}, min={min_score:.2f}, max={max_score:.2f})")
+    print(f"  Scored: {scored}/{n_parcels} (avg={avg_score:.2f}, min={min_score:.2f}, max={max_score:.2f})")
     print(f"  Component distribution:")
     for k, v in sorted(comp_dist.items(), key=lambda x: -x[1]):
         print(f"    {k:<12} {v:>6} parcels")
@@ -281,17 +580,14 @@ def main():
     if args.dry_run:
         print("\n  [DRY RUN] — no writes performed")
         # Show sample results
-        for r in sorted(results, key=lambda x: -(x["conviction_score"] or 0))[:10]:
+        top = np.argsort(-np.nan_to_num(results.conviction_score), kind="stable")[:10]
+        for i in top:
+            r = results.record(i)
             print(f"    {r['parcel_id']:<15} score={r['conviction_score']}  base={r['conviction_base_score']}  "
                   f"vac_bonus={r['conviction_vacancy_bonus']}  mc={r['conviction_mc_score']}  "
                   f"components={r['conviction_components']}")
         return
 
-    # Phase C: Write conviction scores
-    print("  Phase C: Writing conviction scores to DB...")
-    flush_conviction_scores(results, args.county)
-    print(f"  Written: {len(results)} rows")
-
     # Phase D: Backfill motivation_scores
     if not args.skip_motivation:
         print("  Phase D: Backfilling motivation_scores...")
@@ -301,7 +597,7 @@ def main():
 
     elapsed = time.time() - start
     print(f"\n=== Conviction Score Complete ===")
-    print(f"  Parcels:    {len(parcels)}")
+    print(f"  Parcels:    {n_parcels}")
     print(f"  Scored:     {scored}")
     print(f"  MC joined:  {mc_parcels}")
     print(f"  Vacant:     {vac_parcels}")
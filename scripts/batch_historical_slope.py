@@ -21,30 +21,38 @@ Usage:
 """
 
 import argparse
+import math
+import queue
 import signal
 import time
 import threading
-from collections import deque
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 from dotenv import load_dotenv
 load_dotenv()
 
+import numpy as np
 import structlog
 
 from src.db import (
     get_db_connection,
+    PersistentConnection,
     migrate_add_composite_columns,
     batch_update_slope_results,
     batch_update_slope_safe,
     compute_composite_scores,
     get_parcels_needing_slope,
     get_parcels_missing_year,
+    migrate_add_county_naip_year_view,
+    refresh_county_naip_years,
 )
-from src.naip.baseline import naip_ndvi_fast, naip_ndvi_historical, compute_ndvi_slope
+from src.naip.baseline import naip_ndvi_fast, naip_ndvi_historical_batch, compute_ndvi_slopes
 from src.naip.planetary import discover_latest_naip_year
 from src.checkpoint import save_checkpoint, mark_complete
+from src.counters import ThreadCounters
+from src.flush_retry import RetryBuffer
 
 logger = structlog.get_logger("batch_slope")
 
@@ -52,99 +60,144 @@ logger = structlog.get_logger("batch_slope")
 # Keeps ndvi_slope_5yr semantically consistent across counties and time.
 MAX_VINTAGES = 6
 
+# Parcels are batched per NAIP quarter-quad (3.75' = 0.0625 deg) so one STAC
+# search and one COG open serve many parcels
+TILE_DEG = 0.0625
+TILE_GROUP_MAX = 200
+
 # Fallback years if STAC discovery fails (safety net)
 FALLBACK_HISTORICAL_YEARS = [2024, 2022, 2020, 2018, 2016, 2014, 2012]
 
-# Thread-safe results buffer
-results_buffer = deque()
-buffer_lock = threading.Lock()
+# Results queue: workers put() without a Python-level lock; a single flusher
+# thread drains it in flush_every-sized batches (None = stop sentinel)
+results_buffer = queue.SimpleQueue()
+FLUSH_MAX_WAIT = 5.0  # seconds a partial batch may wait before flushing
 shutdown_event = threading.Event()
 
-# Counters
-stats = {"processed": 0, "with_slope": 0, "no_history": 0, "errors": 0, "flushed": 0}
-stats_lock = threading.Lock()
+# Counters (per-thread, summed on read — no lock on the worker hot path)
+stats = ThreadCounters("processed", "with_slope", "no_history", "errors", "flushed")
+
+# Shared by every flush (only the flusher thread writes)
+_flush_conn = PersistentConnection()
 
 # Set by main() to use safe (non-destructive) update in rescan mode
 _use_safe_update = False
 
 
-def compute_slope_for_parcel(parcel: dict) -> dict | None:
-    """Fetch historical NDVI and compute slope for a single parcel."""
-    if shutdown_event.is_set():
-        return None
+def group_parcels_by_tile(parcels: list[dict]) -> list[list[dict]]:
+    """
+    Group parcels by NAIP quarter-quad cell so each group shares STAC items
+    and COGs. Large cells are split into TILE_GROUP_MAX chunks to keep the
+    thread pool busy and flushes steady.
+    """
+    tiles = defaultdict(list)
+    for parcel in parcels:
+        key = (math.floor(float(parcel["latitude"]) / TILE_DEG),
+               math.floor(float(parcel["longitude"]) / TILE_DEG))
+        tiles[key].append(parcel)
+
+    groups = []
+    for tile_parcels in tiles.values():
+        for i in range(0, len(tile_parcels), TILE_GROUP_MAX):
+            groups.append(tile_parcels[i:i + TILE_GROUP_MAX])
+    return groups
+
 
-    pid = parcel["parcel_id"]
-    lat = float(parcel["latitude"])
-    lng = float(parcel["longitude"])
-    county = parcel["county"]
+def _regression_points(parcel: dict, historical: list[dict]) -> tuple[list, list]:
+    """Build a parcel's (year, ndvi) regression points and the sorted years used."""
     current_ndvi = parcel.get("ndvi_score")
     current_date = parcel.get("ndvi_date")
 
-    try:
-        # Fetch historical NDVI — auto-detect all available years from STAC
-        historical = naip_ndvi_historical(lat, lng, years=None)
+    # Rolling window: keep only latest MAX_VINTAGES years
+    historical.sort(key=lambda h: h["year"], reverse=True)
+    historical = historical[:MAX_VINTAGES]
 
-        # Rolling window: keep only latest MAX_VINTAGES years
-        historical.sort(key=lambda h: h["year"], reverse=True)
-        historical = historical[:MAX_VINTAGES]
+    # Build regression points: (year, ndvi)
+    points = []
+    years_used = []
 
-        # Build regression points: (year, ndvi)
-        points = []
-        years_used = []
+    for h in historical:
+        points.append((h["year"], h["ndvi"]))
+        years_used.append(str(h["year"]))
 
-        for h in historical:
-            points.append((h["year"], h["ndvi"]))
-            years_used.append(str(h["year"]))
+    # Add current NDVI if we have it
+    if current_ndvi is not None and current_date:
+        try:
+            current_year = int(current_date[:4])
+            # Avoid duplicate year
+            if current_year not in [h["year"] for h in historical]:
+                points.append((current_year, current_ndvi))
+                years_used.append(str(current_year))
+        except (ValueError, TypeError):
+            pass
+
+    # Sort by year
+    points.sort(key=lambda p: p[0])
+    years_used.sort()
+    return points, years_used
+
+
+def compute_slopes_for_tile(group: list[dict]) -> int:
+    """
+    Fetch historical NDVI for a tile group in one batch, compute each
+    parcel's slope and queue the results for the flusher. Returns the
+    number of results queued.
+    """
+    if shutdown_event.is_set():
+        return 0
 
-        # Add current NDVI if we have it
-        if current_ndvi is not None and current_date:
-            try:
-                current_year = int(current_date[:4])
-                # Avoid duplicate year
-                if current_year not in [h["year"] for h in historical]:
-                    points.append((current_year, current_ndvi))
-                    years_used.append(str(current_year))
-            except (ValueError, TypeError):
-                pass
-
-        # Sort by year
-        points.sort(key=lambda p: p[0])
-        years_used.sort()
-
-        # Compute slope
-        slope = compute_ndvi_slope(points)
-
-        result = {
-            "parcel_id": pid,
-            "county": county,
+    try:
+        points = [(float(p["latitude"]), float(p["longitude"])) for p in group]
+        # Auto-detect all available years from STAC
+        histories = naip_ndvi_historical_batch(points, years=None)
+    except Exception as e:
+        logger.error("slope_tile_error", parcels=len(group), error=str(e))
+        stats.add("errors", len(group))
+        return 0
+
+    # Regression inputs per parcel, padded into (N, MAX_VINTAGES + 1) arrays
+    # so every slope in the group comes from one vectorized solve
+    prepared = []
+    for parcel, historical in zip(group, histories):
+        try:
+            prepared.append((parcel, *_regression_points(parcel, historical)))
+        except Exception as e:
+            logger.error("slope_parcel_error", parcel_id=parcel["parcel_id"], error=str(e))
+            stats.add("errors")
+    if not prepared:
+        return 0
+
+    years = np.full((len(prepared), MAX_VINTAGES + 1), np.nan)
+    ndvi = np.full_like(years, np.nan)
+    for i, (_, points, _) in enumerate(prepared):
+        for j, (year, value) in enumerate(points):
+            years[i, j] = year
+            ndvi[i, j] = np.nan if value is None else value
+    slopes = compute_ndvi_slopes(years, ndvi)
+
+    queued = with_slope = 0
+    for (parcel, points, years_used), slope in zip(prepared, slopes):
+        if slope is not None:
+            with_slope += 1
+        results_buffer.put({
+            "parcel_id": parcel["parcel_id"],
+            "county": parcel["county"],
             "ndvi_slope_5yr": slope,
             "ndvi_history_count": len(points),
             "ndvi_history_years": ",".join(years_used) if years_used else None,
-        }
-
-        with stats_lock:
-            stats["processed"] += 1
-            if slope is not None:
-                stats["with_slope"] += 1
-            else:
-                stats["no_history"] += 1
+        })
+        queued += 1
 
-        return result
-
-    except Exception as e:
-        logger.error("slope_parcel_error", parcel_id=pid, error=str(e))
-        with stats_lock:
-            stats["errors"] += 1
-        return None
+    stats.add("processed", queued)
+    stats.add("with_slope", with_slope)
+    stats.add("no_history", queued - with_slope)
+    return queued
 
 
-def flush_buffer(dry_run: bool = False):
-    """Flush results buffer to DB using a fresh connection (avoids idle timeout)."""
-    with buffer_lock:
-        if not results_buffer:
-            return
-        batch = list(results_buffer)
-        results_buffer.clear()
+def flush_buffer(batch: list[dict], dry_run: bool = False):
+    """Flush one batch to DB over the shared persistent connection."""
+    if not batch:
+        return
 
     if dry_run:
         for r in batch:
@@ -152,8 +205,7 @@ def flush_buffer(dry_run: bool = False):
             years_str = r['ndvi_history_years'] or '--'
             print(f"  [DRY] {r['parcel_id']} slope={slope_str} "
                   f"pts={r['ndvi_history_count']} years=[{years_str}]")
-        with stats_lock:
-            stats["flushed"] += len(batch)
+        stats.add("flushed", len(batch))
         return
 
     # Filter out None results
@@ -162,26 +214,58 @@ def flush_buffer(dry_run: bool = False):
         return
 
     try:
-        # Fresh connection per flush — Railway PostgreSQL kills idle connections
-        flush_conn = get_db_connection()
-        try:
-            updater = batch_update_slope_safe if _use_safe_update else batch_update_slope_results
-            updated = updater(flush_conn, valid)
-            with stats_lock:
-                stats["flushed"] += updated
-            logger.info("slope_buffer_flushed", batch_size=len(valid), updated=updated)
-        finally:
-            flush_conn.close()
+        _write_slope_batch(valid)
     except Exception as e:
         logger.error("slope_flush_failed", batch_size=len(valid), error=str(e))
-        with buffer_lock:
-            results_buffer.extendleft(valid)
+        # Retried in the background with backoff; results_buffer is untouched
+        retry_buffer.push(valid)
+
+
+def _write_slope_batch(batch: list[dict]):
+    """DB write for one slope batch. Raises on failure."""
+    # Persistent keepalive connection; reconnects once if Railway dropped it
+    updater = batch_update_slope_safe if _use_safe_update else batch_update_slope_results
+    updated = _flush_conn.run(updater, batch)
+    stats.add("flushed", updated)
+    logger.info("slope_buffer_flushed", batch_size=len(batch), updated=updated)
+
+
+retry_buffer = RetryBuffer(_write_slope_batch, name="slope-flush-retry")
+
+
+def flusher_loop(flush_every: int, dry_run: bool = False):
+    """
+    Single consumer of results_buffer: blocks for the first result, then
+    gathers up to flush_every (or FLUSH_MAX_WAIT seconds' worth) and flushes.
+    Exits after flushing whatever precedes the None sentinel.
+    """
+    while True:
+        item = results_buffer.get()
+        if item is None:
+            return
+        batch = [item]
+        deadline = time.monotonic() + FLUSH_MAX_WAIT
+        stop = False
+        while len(batch) < flush_every:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = results_buffer.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        flush_buffer(batch, dry_run=dry_run)
+        if stop:
+            return
 
 
 def print_progress(total: int, start_time: float):
     """Print progress line."""
-    with stats_lock:
-        s = dict(stats)
+    s = stats.snapshot()
     elapsed = time.time() - start_time
     rate = s["processed"] / elapsed if elapsed > 0 else 0
     remaining = total - s["processed"] - s["errors"]
@@ -286,58 +370,44 @@ def main():
     signal.signal(signal.SIGINT, handle_sigint)
 
     start_time = time.time()
-    est_calls = total * (MAX_VINTAGES + 1)  # +1 for STAC search per parcel
-    est_time_min = est_calls / (4 * args.workers) / 60
-    print(f"  ~{est_calls} API calls estimated, ~{est_time_min:.0f} min at {4*args.workers} calls/sec")
+    groups = group_parcels_by_tile(parcels)
+    print(f"  {total} parcels in {len(groups)} NAIP tile groups "
+          f"(1 STAC search + 1 read per COG per group)")
     print(f"  Workers: {args.workers} | Flush every: {args.flush_every}"
           f"{' | DRY RUN' if args.dry_run else ''}")
     print(f"  Starting at {datetime.now().strftime('%H:%M:%S')}...\n")
 
+    flusher = threading.Thread(target=flusher_loop, args=(args.flush_every, args.dry_run),
+                               name="slope-flusher")
+    flusher.start()
+
     with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures = {}
-        for parcel in parcels:
+        futures = []
+        for group in groups:
             if shutdown_event.is_set():
                 break
-            future = executor.submit(compute_slope_for_parcel, parcel)
-            futures[future] = parcel["parcel_id"]
+            futures.append(executor.submit(compute_slopes_for_tile, group))
 
-        collected = set()
+        last_checkpoint = 0
         for future in as_completed(futures):
             if shutdown_event.is_set():
+                # Workers queue their own results; in-flight groups finish
+                # (or return early) when the executor shuts down
+                print("\n  Waiting for in-flight tile groups...")
                 break
 
-            collected.add(id(future))
-            result = future.result()
-            if result:
-                with buffer_lock:
-                    results_buffer.append(result)
-
-                if len(results_buffer) >= args.flush_every:
-                    flush_buffer(dry_run=args.dry_run)
-
-            if stats["with_slope"] % 500 == 0 and stats["with_slope"] > 0:
-                save_checkpoint(f"slope_{args.county}", dict(stats), total,
+            if stats["with_slope"] // 500 > last_checkpoint:
+                last_checkpoint = stats["with_slope"] // 500
+                save_checkpoint(f"slope_{args.county}", stats.snapshot(), total,
                                 extra={"county": args.county, "state": args.state})
 
             print_progress(total, start_time)
 
-        # Drain on shutdown
-        if shutdown_event.is_set():
-            print("\n  Waiting for in-flight futures...")
-            for f in futures:
-                if id(f) in collected:
-                    continue
-                if f.done() and not f.cancelled():
-                    try:
-                        result = f.result(timeout=0.1)
-                        if result:
-                            with buffer_lock:
-                                results_buffer.append(result)
-                    except Exception:
-                        pass
-
-    # Final flush
-    flush_buffer(dry_run=args.dry_run)
+    # Final flush: everything queued before the sentinel is written
+    results_buffer.put(None)
+    flusher.join()
+    unwritten = retry_buffer.close()
+    _flush_conn.close()
 
     elapsed = time.time() - start_time
     print(f"\n\n=== Slope Computation Complete ===")
@@ -346,6 +416,8 @@ def main():
     print(f"  No history: {stats['no_history']}")
     print(f"  Errors:     {stats['errors']}")
     print(f"  Flushed:    {stats['flushed']}")
+    if unwritten:
+        print(f"  Unwritten (DB failures): {unwritten}")
     print(f"  Time:       {elapsed:.0f}s ({elapsed/60:.1f}m)")
     if stats['processed'] > 0:
         print(f"  Rate:       {stats['processed']/elapsed:.1f} parcels/sec")
@@ -360,7 +432,14 @@ def main():
         comp_conn.close()
         print(f"  Updated {count} parcels with composite scores.")
 
-    mark_complete(f"slope_{args.county}", dict(stats), total, elapsed)
+    # Keep the freshness check's per-county max-year view current
+    if not args.dry_run and stats["flushed"]:
+        view_conn = get_db_connection()
+        migrate_add_county_naip_year_view(view_conn)
+        refresh_county_naip_years(view_conn)
+        view_conn.close()
+
+    mark_complete(f"slope_{args.county}", stats.snapshot(), total, elapsed)
 
 
 if __name__ == "__main__":
@@ -12,23 +12,37 @@ Usage:
 """
 
 import argparse
+import queue
 import signal
 import time
 import threading
 from collections import deque
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 
 from dotenv import load_dotenv
 load_dotenv()
 
+import numpy as np
 import structlog
 
-from src.db import get_db_connection, migrate_add_scan_columns, batch_update_scan_results, get_unscanned_parcels
+from src.db import (
+    get_db_connection,
+    PersistentConnection,
+    get_pool,
+    run_pooled,
+    close_pool,
+    migrate_add_scan_columns,
+    batch_update_scan_results,
+    count_unscanned_parcels,
+    iter_unscanned_parcels,
+)
 from src.naip.baseline import naip_ndvi_fast
 from src.fema.flood import fema_flood
 from src.analysis.flags import generate_all_flags
 from src.checkpoint import save_checkpoint, mark_complete
+from src.flush_retry import RetryBuffer
+from src.counters import ThreadCounters
 
 logger = structlog.get_logger("batch_scan")
 
@@ -40,14 +54,66 @@ SIGNAL_WEIGHTS = {
     "structural_change": 2.5,
 }
 
+# Column order of the per-batch confidence matrix built in score_batch
+FLAG_CODES = tuple(SIGNAL_WEIGHTS)
+_FLAG_INDEX = {code: i for i, code in enumerate(FLAG_CODES)}
+_FLAG_WEIGHTS = np.array([SIGNAL_WEIGHTS[c] for c in FLAG_CODES])
+
+# distress_flags label per flag bitmask (bit i = FLAG_CODES[i]), sorted like the
+# old ",".join(sorted(codes))
+_FLAG_STRINGS = [
+    ",".join(sorted(c for i, c in enumerate(FLAG_CODES) if mask >> i & 1)) or None
+    for mask in range(1 << len(FLAG_CODES))
+]
+
 # Thread-safe results buffer
 results_buffer = deque()
 buffer_lock = threading.Lock()
 shutdown_event = threading.Event()
 
-# Counters
-stats = {"scanned": 0, "flagged": 0, "errors": 0, "flushed": 0}
-stats_lock = threading.Lock()
+# Parcels submitted ahead of the workers, per worker. Bounds memory to a few
+# pages of parcels while keeping the pool saturated.
+INFLIGHT_PER_WORKER = 4
+
+# Adaptive flush size (see tune_flush_threshold); starts at --flush-every
+FLUSH_MIN = 50
+FLUSH_MAX = 2000
+FLUSH_WRITE_SECONDS = 2.0
+FLUSH_SCAN_SECONDS = 10.0
+flush_threshold = 100
+scan_started: float | None = None
+
+# Full batches handed from the collector loop to the writer thread. Bounded so
+# a stalled DB applies backpressure instead of buffering the whole county.
+flush_queue = queue.Queue(maxsize=2)
+
+# Counters (per-thread, summed on read — no lock on the worker hot path)
+stats = ThreadCounters("scanned", "flagged", "errors", "flushed")
+
+# FEMA lookups run here so they overlap the NAIP call on the scan worker.
+# Sized to --workers in main().
+fema_executor: ThreadPoolExecutor | None = None
+
+
+# Fixed fields of an errored parcel's result (scan_date is stamped at flush)
+_ERROR_TEMPLATE = {
+    "ndvi_score": None,
+    "ndvi_date": None,
+    "ndvi_category": "error",
+    "fema_zone": None,
+    "fema_risk": None,
+    "fema_sfha": False,
+    "distress_score": None,
+    "distress_flags": None,
+    "flag_veg": False,
+    "flag_flood": False,
+    "flag_structural": False,
+    "flag_neglect": False,
+    "veg_confidence": None,
+    "flood_confidence": None,
+    "scan_pass": 1,
+    "sentinel_worthy": False,
+}
 
 
 def scan_single_parcel(parcel: dict) -> dict | None:
@@ -56,18 +122,21 @@ def scan_single_parcel(parcel: dict) -> dict | None:
         return None
 
     pid = parcel["parcel_id"]
-    lat = float(parcel["latitude"])
-    lng = float(parcel["longitude"])
+    lat = parcel["latitude"]  # float8 from the query, no per-row cast
+    lng = parcel["longitude"]
     county = parcel["county"]
 
     try:
+        # FEMA flood (1 API call, skip map export for speed) in flight while
+        # NAIP runs — per-parcel latency is max(rtt), not the sum
+        fema_future = fema_executor.submit(fema_flood, lat, lng, skip_map=True)
+
         # NAIP NDVI (1 API call)
         naip = naip_ndvi_fast(lat, lng)
 
-        # FEMA flood (1 API call, skip map export for speed)
         fema = None
         try:
-            fema = fema_flood(lat, lng, skip_map=True)
+            fema = fema_future.result()
         except Exception as e:
             logger.debug("fema_skip", parcel_id=pid, error=str(e))
 
@@ -87,13 +156,6 @@ def scan_single_parcel(parcel: dict) -> dict | None:
             fema=fema,
         )
 
-        # Compute distress score
-        score = 0.0
-        for flag in flags:
-            weight = SIGNAL_WEIGHTS.get(flag["signal_code"], 1.0)
-            score += weight * flag["confidence"]
-        score = round(min(score, 10.0), 2)
-
         # Determine sentinel_worthy
         sentinel_worthy = False
         if naip.get("ndvi") is not None and naip["ndvi"] > 0.50:
@@ -101,10 +163,8 @@ def scan_single_parcel(parcel: dict) -> dict | None:
         if flags:
             sentinel_worthy = True
 
-        # Flag booleans
-        flag_codes = {f["signal_code"] for f in flags}
-        flag_confs = {f["signal_code"]: f["confidence"] for f in flags}
-
+        # Score, flag booleans, confidences and scan_date are filled in per
+        # batch by write_batch() just before the write
         result = {
             "parcel_id": pid,
             "county": county,
@@ -114,61 +174,114 @@ def scan_single_parcel(parcel: dict) -> dict | None:
             "fema_zone": fema.get("flood_zone") if fema else None,
             "fema_risk": fema.get("risk_level") if fema else None,
             "fema_sfha": fema.get("is_sfha", False) if fema else False,
-            "distress_score": score,
-            "distress_flags": ",".join(sorted(flag_codes)) if flag_codes else None,
-            "flag_veg": "vegetation_overgrowth" in flag_codes,
-            "flag_flood": "flood_risk" in flag_codes,
-            "flag_structural": "structural_change" in flag_codes,
-            "flag_neglect": "vegetation_neglect" in flag_codes,
-            "veg_confidence": flag_confs.get("vegetation_overgrowth") or flag_confs.get("vegetation_neglect"),
-            "flood_confidence": flag_confs.get("flood_risk"),
-            "scan_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "flags": flags,
             "scan_pass": 1,
             "sentinel_worthy": sentinel_worthy,
         }
 
-        with stats_lock:
-            stats["scanned"] += 1
-            if flags:
-                stats["flagged"] += 1
+        stats.add("scanned")
+        if flags:
+            stats.add("flagged")
 
         return result
 
     except Exception as e:
         logger.error("scan_parcel_error", parcel_id=pid, error=str(e))
-        with stats_lock:
-            stats["errors"] += 1
+        stats.add("errors")
         # Return a minimal result so the parcel is marked as scanned (won't retry)
-        return {
-            "parcel_id": pid,
-            "county": county,
-            "ndvi_score": None,
-            "ndvi_date": None,
-            "ndvi_category": "error",
-            "fema_zone": None,
-            "fema_risk": None,
-            "fema_sfha": False,
-            "distress_score": None,
-            "distress_flags": None,
-            "flag_veg": False,
-            "flag_flood": False,
-            "flag_structural": False,
-            "flag_neglect": False,
-            "veg_confidence": None,
-            "flood_confidence": None,
-            "scan_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "scan_pass": 1,
-            "sentinel_worthy": False,
-        }
+        return {**_ERROR_TEMPLATE, "parcel_id": pid, "county": county}
+
+
+# Scored fields of a parcel with no flags (the common case)
+_UNFLAGGED_FIELDS = {
+    "distress_score": 0.0,
+    "distress_flags": None,
+    "flag_veg": False,
+    "flag_flood": False,
+    "flag_structural": False,
+    "flag_neglect": False,
+    "veg_confidence": None,
+    "flood_confidence": None,
+}
 
 
-def flush_buffer(dry_run: bool = False):
-    """Flush results buffer to DB using a fresh connection (avoids idle timeout)."""
+def score_batch(batch: list[dict]):
+    """
+    Fill distress_score, distress_flags, flag_* and *_confidence for a batch
+    from each result's raw "flags" list, as one (N, len(FLAG_CODES)) matrix
+    over the flagged rows only.
+
+    Confidence is NaN where a flag did not fire. Error results (no "flags"
+    key) and rows already scored by an earlier failed write are left as-is.
+    """
+    rows = []
+    for r in batch:
+        if "flags" not in r:
+            continue
+        if r["flags"]:
+            rows.append(r)
+        else:
+            # Most parcels fire no flag: copy the fixed unflagged fields
+            del r["flags"]
+            r.update(_UNFLAGGED_FIELDS)
+    if not rows:
+        return
+
+    confs = np.full((len(rows), len(FLAG_CODES)), np.nan)
+    for i, r in enumerate(rows):
+        for f in r.pop("flags"):
+            j = _FLAG_INDEX.get(f["signal_code"])
+            if j is not None:
+                confs[i, j] = f["confidence"]
+
+    fired = ~np.isnan(confs)
+    filled = np.where(fired, confs, 0.0)
+    scores = np.minimum(filled @ _FLAG_WEIGHTS, 10.0).round(2)
+    masks = fired @ (1 << np.arange(len(FLAG_CODES)))
+
+    over = confs[:, _FLAG_INDEX["vegetation_overgrowth"]]
+    neglect = confs[:, _FLAG_INDEX["vegetation_neglect"]]
+    # flag_confs.get("vegetation_overgrowth") or flag_confs.get("vegetation_neglect")
+    veg = np.where(np.nan_to_num(over) != 0, over, neglect)
+    flood = confs[:, _FLAG_INDEX["flood_risk"]]
+
+    # tolist() once per column — no per-row NumPy scalar boxing
+    fired_cols = fired.T.tolist()
+    columns = zip(scores.tolist(), masks.tolist(), *fired_cols, veg.tolist(), flood.tolist())
+    for r, (score, mask, f_over, f_neglect, f_flood, f_struct, v, fl) in zip(rows, columns):
+        r["distress_score"] = score
+        r["distress_flags"] = _FLAG_STRINGS[mask]
+        r["flag_veg"] = f_over
+        r["flag_flood"] = f_flood
+        r["flag_structural"] = f_struct
+        r["flag_neglect"] = f_neglect
+        r["veg_confidence"] = None if v != v else v
+        r["flood_confidence"] = None if fl != fl else fl
+
+
+def take_buffer() -> list[dict]:
+    """
+    Swap out the current results buffer and return its contents, one row per
+    parcel (last result wins) so the UPDATE ... FROM never sees duplicate keys.
+    """
+    global results_buffer
     with buffer_lock:
-        if not results_buffer:
-            return
-        batch = list(results_buffer)
-        results_buffer.clear()
+        pending = results_buffer
+        results_buffer = deque()
+    return list({(r["county"], r["parcel_id"]): r for r in pending}.values())
+
+
+def write_batch(batch: list[dict], dry_run: bool = False):
+    """Write one batch to DB over a pooled connection."""
+    if not batch:
+        return
+
+    score_batch(batch)
+
+    # One timestamp per batch — rows in a flush are seconds apart anyway
+    scan_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for r in batch:
+        r["scan_date"] = scan_date
 
     if dry_run:
         for r in batch:
@@ -177,31 +290,78 @@ def flush_buffer(dry_run: bool = False):
             score_str = f"{r['distress_score']:.1f}" if r['distress_score'] is not None else "--"
             print(f"  [DRY] {r['parcel_id']} NDVI={ndvi_str} cat={r['ndvi_category']} "
                   f"score={score_str} flags={flags_str}")
-        with stats_lock:
-            stats["flushed"] += len(batch)
+        stats.add("flushed", len(batch))
         return
 
     try:
-        # Fresh connection per flush — Railway PostgreSQL kills idle connections
-        flush_conn = get_db_connection()
-        try:
-            updated = batch_update_scan_results(flush_conn, batch)
-            with stats_lock:
-                stats["flushed"] += updated
-            logger.info("buffer_flushed", batch_size=len(batch), updated=updated)
-        finally:
-            flush_conn.close()
+        _write_scored_batch(batch)
     except Exception as e:
         logger.error("flush_failed", batch_size=len(batch), error=str(e))
-        # Put back in buffer for retry
-        with buffer_lock:
-            results_buffer.extendleft(batch)
+        # Retried in the background with backoff; results_buffer is untouched
+        retry_buffer.push(batch)
+
+
+def _write_scored_batch(batch: list[dict]):
+    """DB write for an already-scored batch. Raises on failure."""
+    t0 = time.monotonic()
+    # Pooled keepalive connection; a connection Railway dropped is replaced once
+    updated = run_pooled(batch_update_scan_results, batch)
+    write_dt = time.monotonic() - t0
+    stats.add("flushed", updated)
+    tune_flush_threshold(len(batch), write_dt)
+    logger.info("buffer_flushed", batch_size=len(batch), updated=updated,
+                write_ms=round(write_dt * 1000), next_threshold=flush_threshold)
+
+
+def tune_flush_threshold(rows: int, write_dt: float):
+    """
+    Re-size the flush threshold from the last write: about FLUSH_WRITE_SECONDS
+    of observed write throughput, but no more than FLUSH_SCAN_SECONDS of
+    scanning so a slow scan still persists regularly. Clamped to
+    [FLUSH_MIN, FLUSH_MAX]. Only the writer threads assign it; the collector
+    loop just reads it.
+    """
+    global flush_threshold
+    if write_dt <= 0 or scan_started is None:
+        return
+    target = rows / write_dt * FLUSH_WRITE_SECONDS
+    elapsed = time.time() - scan_started
+    scanned = stats["scanned"]
+    if elapsed > 0 and scanned > 0:
+        target = min(target, scanned / elapsed * FLUSH_SCAN_SECONDS)
+    flush_threshold = max(FLUSH_MIN, min(int(target), FLUSH_MAX))
+
+
+retry_buffer = RetryBuffer(_write_scored_batch, name="scan-flush-retry")
+
+
+def writer_loop(dry_run: bool = False):
+    """Writer thread: drain flush_queue until the None sentinel arrives."""
+    while True:
+        batch = flush_queue.get()
+        if batch is None:
+            return
+        write_batch(batch, dry_run=dry_run)
+
+
+def flush_buffer(dry_run: bool = False):
+    """Flush whatever is left in the results buffer synchronously."""
+    write_batch(take_buffer(), dry_run=dry_run)
+
+
+PROGRESS_INTERVAL = 0.25  # seconds between progress line redraws
+_last_progress = 0.0
 
 
-def print_progress(total: int, start_time: float):
-    """Print progress line."""
-    with stats_lock:
-        s = dict(stats)
+def print_progress(total: int, start_time: float, force: bool = False):
+    """Print progress line, at most once per PROGRESS_INTERVAL unless forced."""
+    global _last_progress
+    now = time.monotonic()
+    if not force and now - _last_progress < PROGRESS_INTERVAL:
+        return
+    _last_progress = now
+
+    s = stats.snapshot()
     elapsed = time.time() - start_time
     rate = s["scanned"] / elapsed if elapsed > 0 else 0
     remaining = total - s["scanned"] - s["errors"]
@@ -215,12 +375,15 @@ def print_progress(total: int, start_time: float):
 
 
 def main():
+    global fema_executor, flush_threshold, scan_started
+
     parser = argparse.ArgumentParser(description="Batch NDVI scan pipeline")
     parser.add_argument("--county", required=True, help="County name (e.g. Gaston)")
     parser.add_argument("--state", default="NC", help="State code")
     parser.add_argument("--limit", type=int, default=None, help="Max parcels to scan")
     parser.add_argument("--workers", type=int, default=20, help="Thread pool size")
-    parser.add_argument("--flush-every", type=int, default=100, help="Flush to DB every N results")
+    parser.add_argument("--flush-every", type=int, default=100,
+                        help="Initial flush size; adapts to write/scan rate after each write")
     parser.add_argument("--dry-run", action="store_true", help="Print results, don't write to DB")
     parser.add_argument("--property-class", default=None,
                         help="Filter by property_class (e.g. 'Residential 1 Family')")
@@ -237,16 +400,15 @@ def main():
     print("  Running migration...")
     migrate_add_scan_columns(conn)
 
-    # Load unscanned parcels
-    print("  Loading unscanned parcels...")
-    parcels = get_unscanned_parcels(conn, args.county, args.state, limit=args.limit,
-                                        property_class=args.property_class)
-    total = len(parcels)
+    # Count unscanned parcels; the rows themselves are streamed in pages below
+    print("  Counting unscanned parcels...")
+    total = count_unscanned_parcels(conn, args.county, args.state, limit=args.limit,
+                                    property_class=args.property_class)
     print(f"  Found {total} unscanned parcels")
 
-    # Release DB connection immediately — parcels are in memory now.
-    # Holding conn open blocks ALTER TABLE (ACCESS EXCLUSIVE) needed by
-    # other processes/migrations, causing deadlocks on long runs.
+    # Release DB connection immediately. Holding conn open blocks ALTER TABLE
+    # (ACCESS EXCLUSIVE) needed by other processes/migrations, causing
+    # deadlocks on long runs — pages are read in short transactions instead.
     conn.close()
 
     if total == 0:
@@ -260,36 +422,59 @@ def main():
 
     signal.signal(signal.SIGINT, handle_sigint)
 
+    # Size the flush pool to the worker count (first get_pool call wins)
+    if not args.dry_run:
+        get_pool(maxconn=args.workers + 2)
+
     start_time = time.time()
+    scan_started = start_time
+    flush_threshold = args.flush_every
+    last_checkpoint = 0
     print(f"  Starting scan at {datetime.now().strftime('%H:%M:%S')}...\n")
 
-    collected = set()  # Track collected future ids to avoid double-collect
+    # DB writes run on their own thread so result collection never waits on them
+    writer = threading.Thread(target=writer_loop, kwargs={"dry_run": args.dry_run},
+                              name="scan-writer", daemon=True)
+    writer.start()
+
+    fema_executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="fema")
+
+    reader = PersistentConnection()
+    parcel_iter = iter_unscanned_parcels(reader, args.county, args.state, limit=args.limit,
+                                         property_class=args.property_class)
+    max_inflight = args.workers * INFLIGHT_PER_WORKER
 
     with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures = {}
-        for parcel in parcels:
-            if shutdown_event.is_set():
-                break
-            future = executor.submit(scan_single_parcel, parcel)
-            futures[future] = parcel["parcel_id"]
-
-        for future in as_completed(futures):
-            if shutdown_event.is_set():
-                break
-
-            collected.add(id(future))
-            result = future.result()
-            if result:
-                with buffer_lock:
-                    results_buffer.append(result)
-
-                # Flush when buffer hits threshold
-                if len(results_buffer) >= args.flush_every:
-                    flush_buffer(dry_run=args.dry_run)
-
-            # Checkpoint every 1000 scans
-            if stats["scanned"] % 1000 == 0 and stats["scanned"] > 0:
-                save_checkpoint(f"ndvi_{args.county}", dict(stats), total,
+        pending = set()  # submitted futures not yet collected
+
+        def refill():
+            while len(pending) < max_inflight and not shutdown_event.is_set():
+                parcel = next(parcel_iter, None)
+                if parcel is None:
+                    return
+                pending.add(executor.submit(scan_single_parcel, parcel))
+
+        refill()
+        while pending and not shutdown_event.is_set():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                result = future.result()
+                if result:
+                    with buffer_lock:
+                        results_buffer.append(result)
+
+                    # Hand off to the writer when buffer hits threshold
+                    if len(results_buffer) >= flush_threshold:
+                        flush_queue.put(take_buffer())
+
+            refill()
+
+            # Checkpoint every 1000 scans (summed counters can skip exact multiples)
+            snapshot = stats.snapshot()
+            if snapshot["scanned"] // 1000 > last_checkpoint:
+                last_checkpoint = snapshot["scanned"] // 1000
+                save_checkpoint(f"ndvi_{args.county}", snapshot, total,
                                 extra={"county": args.county, "state": args.state})
 
             print_progress(total, start_time)
@@ -300,35 +485,45 @@ def main():
             print("\n  Waiting for in-flight futures to finish...")
 
     # Now executor has shut down — all futures are done or cancelled.
-    # Collect any we missed during the as_completed loop.
+    # Collect only the ones the collection loop never reached.
     if shutdown_event.is_set():
-        for f in futures:
-            if id(f) in collected:
-                continue
+        for f in pending:
             if f.done() and not f.cancelled():
                 try:
-                    result = f.result(timeout=0.1)
+                    result = f.result()
                     if result:
                         with buffer_lock:
                             results_buffer.append(result)
                 except Exception:
                     pass
 
-    # Final flush (includes anything collected during shutdown drain)
+    fema_executor.shutdown(wait=True)
+    reader.close()
+
+    # Let the writer finish queued batches, then flush the remainder
+    # (includes anything collected during shutdown drain)
+    flush_queue.put(None)
+    writer.join()
     flush_buffer(dry_run=args.dry_run)
+    unwritten = retry_buffer.close()
+    close_pool()
+    print_progress(total, start_time, force=True)
 
     elapsed = time.time() - start_time
+    final = stats.snapshot()  # exact: all worker threads have finished
     print(f"\n\n=== Scan Complete ===")
-    print(f"  Scanned: {stats['scanned']}")
-    print(f"  Flagged: {stats['flagged']}")
-    print(f"  Errors:  {stats['errors']}")
-    print(f"  Written: {stats['flushed']}")
+    print(f"  Scanned: {final['scanned']}")
+    print(f"  Flagged: {final['flagged']}")
+    print(f"  Errors:  {final['errors']}")
+    print(f"  Written: {final['flushed']}")
+    if unwritten:
+        print(f"  Unwritten (DB failures): {unwritten}")
     print(f"  Time:    {elapsed:.0f}s ({elapsed/60:.1f}m)")
-    if stats['scanned'] > 0:
-        print(f"  Rate:    {stats['scanned']/elapsed:.1f} parcels/sec")
-        print(f"  Flag %:  {stats['flagged']/stats['scanned']*100:.1f}%")
+    if final['scanned'] > 0:
+        print(f"  Rate:    {final['scanned']/elapsed:.1f} parcels/sec")
+        print(f"  Flag %:  {final['flagged']/final['scanned']*100:.1f}%")
 
-    mark_complete(f"ndvi_{args.county}", dict(stats), total, elapsed)
+    mark_complete(f"ndvi_{args.county}", final, total, elapsed)
 
 
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ Batch Sentinel-2 enrichment — Pass 1.5.
 
 Enriches sentinel_worthy parcels with monthly NDVI trends from Sentinel-2
 (fallback to Landsat). Rate-limited to respect CDSE quotas (10K req/month).
+A few worker threads share one token bucket, so CDSE round-trips and the
+CPU-side rescoring overlap without raising the total request rate.
 
 Usage:
     PYTHONPATH=. python scripts/batch_sentinel_enrich.py --county Gaston --state NC --limit 50 --dry-run
@@ -12,9 +14,12 @@ Usage:
 """
 
 import argparse
+import queue
 import signal
+import threading
 import time
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 from dotenv import load_dotenv
@@ -27,14 +32,23 @@ from src.db import (
     migrate_add_sentinel_columns,
     get_sentinel_worthy_parcels,
     batch_update_sentinel_results,
+    get_pool,
+    run_pooled,
+    close_pool,
 )
 from src.analysis.scanner import enrich_sentinel, rescore_with_sentinel
+from src.flush_retry import RetryBuffer
 
 logger = structlog.get_logger("batch_sentinel")
 
 # Thread-safe results buffer
 results_buffer = deque()
-shutdown_event = False
+buffer_lock = threading.Lock()
+shutdown_event = threading.Event()
+budget_exhausted = threading.Event()
+
+# Full batches handed from the collector loop to the writer thread
+flush_queue = queue.Queue(maxsize=2)
 
 # Counters
 stats = {
@@ -44,15 +58,156 @@ stats = {
     "flushed": 0,
     "cdse_requests": 0,
 }
+stats_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Parcels-per-minute limiter. Refills at rate/60 tokens per second, up to
+    `capacity`, so time spent on a slow parcel is credited to the next ones
+    instead of being lost. Thread-safe.
+
+    Also carries the adaptive backoff shared by all workers: each 429/503/500
+    doubles it (max 10) and forfeits that many tokens; each Sentinel-2 success
+    decays it by 10%.
+    """
+
+    def __init__(self, rate_per_min: float, capacity: float | None = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.backoff = 1.0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._last) * self.rate, self.capacity)
+        self._last = now
+
+    def acquire(self):
+        """Take one token, sleeping until it is available."""
+        with self._lock:
+            self._refill()
+            wait = (1.0 - self._tokens) / self.rate if self._tokens < 1.0 else 0.0
+            # Reserve now (may go negative) so concurrent callers queue up
+            self._tokens -= 1.0
+        if wait > 0:
+            time.sleep(wait)
+
+    def penalize(self, tokens: float):
+        """Drop `tokens` of credit, e.g. after a 429/503 from CDSE."""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+
+    def throttled(self) -> float:
+        """Record a rate-limit/server error: double backoff and forfeit it as tokens."""
+        with self._lock:
+            self.backoff = min(self.backoff * 2, 10.0)
+            backoff = self.backoff
+        self.penalize(backoff)
+        return backoff
+
+    def recovered(self):
+        """Record a successful CDSE request: decay backoff toward 1."""
+        with self._lock:
+            self.backoff = max(self.backoff * 0.9, 1.0)
+
+
+def enrich_single_parcel(parcel: dict, bucket: TokenBucket, months: int,
+                         max_requests: int | None) -> dict | None:
+    """
+    Enrich one parcel with Sentinel/Landsat trends and re-scored flags.
+    Returns DB-ready result dict, or None if skipped or failed.
+
+    The budget guard is checked before taking a token, so with N workers the
+    CDSE cap can be overshot by at most N-1 requests already in flight.
+    """
+    if shutdown_event.is_set() or budget_exhausted.is_set():
+        return None
+
+    if max_requests and stats["cdse_requests"] >= max_requests:
+        budget_exhausted.set()
+        return None
+
+    pid = parcel["parcel_id"]
+    lat = parcel["latitude"]  # float8 from the query, no per-row cast
+    lng = parcel["longitude"]
+    county = parcel["county"]
+
+    bucket.acquire()
+    if shutdown_event.is_set():
+        return None
 
+    try:
+        # Enrich with Sentinel (1 CDSE request, no RGB)
+        sentinel_result = enrich_sentinel(lat, lng, months=months, include_rgb=False)
 
-def flush_buffer(dry_run=False):
-    """Flush results buffer to DB using a fresh connection (avoids idle timeout)."""
-    if not results_buffer:
-        return
+        # Track CDSE usage
+        source = sentinel_result.get("sentinel_data_source")
+        if source == "Sentinel-2":
+            with stats_lock:
+                stats["cdse_requests"] += 1
+            bucket.recovered()
+        elif source == "Landsat":
+            with stats_lock:
+                stats["landsat_fallback"] += 1
 
-    batch = list(results_buffer)
-    results_buffer.clear()
+        # Re-score flags with Sentinel data
+        fema_data = {
+            "fema_zone": parcel.get("fema_zone"),
+            "fema_risk": parcel.get("fema_risk"),
+            "fema_sfha": parcel.get("fema_sfha"),
+        }
+        rescore = rescore_with_sentinel(
+            naip_ndvi=parcel.get("ndvi_score"),
+            fema_data=fema_data if parcel.get("fema_zone") else None,
+            sentinel_result=sentinel_result,
+        )
+
+        # Build DB-ready result
+        db_row = {
+            "parcel_id": pid,
+            "county": county,
+            **{k: v for k, v in sentinel_result.items() if not k.startswith("_")
+               and k != "errors"},
+            **rescore,
+        }
+
+        with stats_lock:
+            stats["enriched"] += 1
+        return db_row
+
+    except Exception as e:
+        logger.error("enrich_error", parcel_id=pid, error=str(e))
+        with stats_lock:
+            stats["errors"] += 1
+
+        # Check for rate limit / server errors — increase backoff
+        err_str = str(e).lower()
+        if "429" in err_str or "503" in err_str or "500" in err_str:
+            backoff = bucket.throttled()
+            logger.warning("backoff_increased", backoff=backoff, error=err_str)
+        return None
+
+
+def take_buffer() -> list[dict]:
+    """
+    Swap out the current results buffer and return its contents, one row per
+    parcel (last result wins) so the UPDATE ... FROM never sees duplicate keys.
+    """
+    global results_buffer
+    with buffer_lock:
+        pending = results_buffer
+        results_buffer = deque()
+    return list({(r["county"], r["parcel_id"]): r for r in pending}.values())
+
+
+def write_batch(batch: list[dict], dry_run: bool = False):
+    """Write one batch to DB over a pooled connection."""
+    if not batch:
+        return
 
     if dry_run:
         for r in batch:
@@ -65,49 +220,81 @@ def flush_buffer(dry_run=False):
             flags = r.get("distress_flags") or "--"
             print(f"  [DRY] {r['parcel_id']} trend={trend} slope={slope_str} "
                   f"src={src} score={score_str} flags={flags}")
-        stats["flushed"] += len(batch)
+        with stats_lock:
+            stats["flushed"] += len(batch)
         return
 
     try:
-        # Fresh connection per flush — Railway PostgreSQL kills idle connections
-        flush_conn = get_db_connection()
-        try:
-            updated = batch_update_sentinel_results(flush_conn, batch)
-            stats["flushed"] += updated
-            logger.info("buffer_flushed", batch_size=len(batch), updated=updated)
-        finally:
-            flush_conn.close()
+        _write_batch(batch)
     except Exception as e:
         logger.error("flush_failed", batch_size=len(batch), error=str(e))
-        # Put back for retry
-        results_buffer.extendleft(batch)
+        # Retried in the background with backoff; results_buffer is untouched
+        retry_buffer.push(batch)
+
+
+def _write_batch(batch):
+    """DB write for one batch. Raises on failure."""
+    # Pooled keepalive connection; a connection Railway dropped is replaced once
+    updated = run_pooled(batch_update_sentinel_results, batch)
+    with stats_lock:
+        stats["flushed"] += updated
+    logger.info("buffer_flushed", batch_size=len(batch), updated=updated)
+
+
+retry_buffer = RetryBuffer(_write_batch, name="sentinel-flush-retry")
+
+
+def writer_loop(dry_run: bool = False):
+    """Writer thread: drain flush_queue until the None sentinel arrives."""
+    while True:
+        batch = flush_queue.get()
+        if batch is None:
+            return
+        write_batch(batch, dry_run=dry_run)
+
+
+def flush_buffer(dry_run: bool = False):
+    """Flush whatever is left in the results buffer synchronously."""
+    write_batch(take_buffer(), dry_run=dry_run)
 
 
-def print_progress(total, start_time, max_requests):
-    """Print progress line."""
+PROGRESS_INTERVAL = 0.25  # seconds between progress line redraws
+_last_progress = 0.0
+
+
+def print_progress(total, start_time, max_requests, force: bool = False):
+    """Print progress line, at most once per PROGRESS_INTERVAL unless forced."""
+    global _last_progress
+    now = time.monotonic()
+    if not force and now - _last_progress < PROGRESS_INTERVAL:
+        return
+    _last_progress = now
+
+    with stats_lock:
+        s = dict(stats)
     elapsed = time.time() - start_time
-    rate = stats["enriched"] / elapsed * 60 if elapsed > 0 else 0
-    done = stats["enriched"] + stats["errors"]
+    rate = s["enriched"] / elapsed * 60 if elapsed > 0 else 0
+    done = s["enriched"] + s["errors"]
     remaining = total - done
     eta_min = remaining / (rate / 60) / 60 if rate > 0 else 0
 
     pct = done / total * 100 if total > 0 else 0
-    budget = f" | cdse={stats['cdse_requests']}/{max_requests}" if max_requests else ""
+    budget = f" | cdse={s['cdse_requests']}/{max_requests}" if max_requests else ""
     print(f"\r  [{done}/{total}] {pct:.0f}% | "
-          f"enriched={stats['enriched']} landsat={stats['landsat_fallback']} "
-          f"err={stats['errors']} flushed={stats['flushed']}"
+          f"enriched={s['enriched']} landsat={s['landsat_fallback']} "
+          f"err={s['errors']} flushed={s['flushed']}"
           f"{budget} | {rate:.0f}/min ETA {eta_min:.0f}m", end="", flush=True)
 
 
 def main():
-    global shutdown_event
-
     parser = argparse.ArgumentParser(description="Batch Sentinel enrichment — Pass 1.5")
     parser.add_argument("--county", required=True, help="County name (e.g. Gaston)")
     parser.add_argument("--state", default="NC", help="State code")
     parser.add_argument("--limit", type=int, default=None, help="Max parcels to enrich")
     parser.add_argument("--rate", type=int, default=40,
                         help="Target parcels per minute (default 40)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker threads sharing the rate limit (default min(4, rate/10))")
     parser.add_argument("--months", type=int, default=12,
                         help="Sentinel lookback months (default 12)")
     parser.add_argument("--flush-every", type=int, default=50,
@@ -118,8 +305,10 @@ def main():
                         help="Print results, don't write to DB")
     args = parser.parse_args()
 
+    workers = args.workers or max(1, min(4, args.rate // 10))
+
     print(f"\n=== Batch Sentinel Enrichment — {args.county}, {args.state} ===")
-    print(f"    Rate: {args.rate}/min | Months: {args.months} | "
+    print(f"    Rate: {args.rate}/min | Workers: {workers} | Months: {args.months} | "
           f"Flush every: {args.flush_every}"
           f"{' | DRY RUN' if args.dry_run else ''}")
     if args.max_requests:
@@ -127,9 +316,8 @@ def main():
 
     # Graceful shutdown
     def handle_sigint(sig, frame):
-        global shutdown_event
         print("\n\n  Ctrl+C — flushing remaining buffer...")
-        shutdown_event = True
+        shutdown_event.set()
 
     signal.signal(signal.SIGINT, handle_sigint)
 
@@ -152,88 +340,47 @@ def main():
         conn.close()
         return
 
+    # Writer thread + final flush + retry thread
+    if not args.dry_run:
+        get_pool(maxconn=3)
+
     start_time = time.time()
-    delay = 60.0 / args.rate  # seconds between parcels
-    backoff = 1.0  # adaptive backoff multiplier
+    bucket = TokenBucket(args.rate)
 
     print(f"  Starting enrichment at {datetime.now().strftime('%H:%M:%S')}...\n")
 
-    for i, parcel in enumerate(parcels):
-        if shutdown_event:
-            break
-
-        # Budget guard
-        if args.max_requests and stats["cdse_requests"] >= args.max_requests:
-            print(f"\n\n  CDSE budget cap reached ({args.max_requests} requests). Stopping.")
-            break
+    # DB writes run on their own thread so workers never wait on them
+    writer = threading.Thread(target=writer_loop, kwargs={"dry_run": args.dry_run},
+                              name="sentinel-writer", daemon=True)
+    writer.start()
 
-        pid = parcel["parcel_id"]
-        lat = float(parcel["latitude"])
-        lng = float(parcel["longitude"])
-        county = parcel["county"]
-
-        loop_start = time.monotonic()
-
-        try:
-            # Enrich with Sentinel (1 CDSE request, no RGB)
-            sentinel_result = enrich_sentinel(lat, lng, months=args.months,
-                                               include_rgb=False)
-
-            # Track CDSE usage
-            if sentinel_result.get("sentinel_data_source") == "Sentinel-2":
-                stats["cdse_requests"] += 1
-                backoff = max(backoff * 0.9, 1.0)  # reduce backoff on success
-            elif sentinel_result.get("sentinel_data_source") == "Landsat":
-                stats["landsat_fallback"] += 1
-
-            # Re-score flags with Sentinel data
-            fema_data = {
-                "fema_zone": parcel.get("fema_zone"),
-                "fema_risk": parcel.get("fema_risk"),
-                "fema_sfha": parcel.get("fema_sfha"),
-            }
-            rescore = rescore_with_sentinel(
-                naip_ndvi=parcel.get("ndvi_score"),
-                fema_data=fema_data if parcel.get("fema_zone") else None,
-                sentinel_result=sentinel_result,
-            )
-
-            # Build DB-ready result
-            db_row = {
-                "parcel_id": pid,
-                "county": county,
-                **{k: v for k, v in sentinel_result.items() if not k.startswith("_")
-                   and k != "errors"},
-                **rescore,
-            }
-
-            results_buffer.append(db_row)
-            stats["enriched"] += 1
-
-        except Exception as e:
-            logger.error("enrich_error", parcel_id=pid, error=str(e))
-            stats["errors"] += 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(enrich_single_parcel, parcel, bucket,
+                                   args.months, args.max_requests)
+                   for parcel in parcels]
 
-            # Check for rate limit / server errors — increase backoff
-            err_str = str(e).lower()
-            if "429" in err_str or "503" in err_str or "500" in err_str:
-                backoff = min(backoff * 2, 10.0)
-                logger.warning("backoff_increased", backoff=backoff, error=err_str)
+        for future in as_completed(futures):
+            result = future.result()
+            if result:
+                with buffer_lock:
+                    results_buffer.append(result)
 
-        # Flush when buffer hits threshold
-        if len(results_buffer) >= args.flush_every:
-            flush_buffer(dry_run=args.dry_run)
+                # Hand off to the writer when buffer hits threshold
+                if len(results_buffer) >= args.flush_every:
+                    flush_queue.put(take_buffer())
 
-        print_progress(total, start_time, args.max_requests)
+            print_progress(total, start_time, args.max_requests)
 
-        # Adaptive rate limiting
-        elapsed = time.monotonic() - loop_start
-        target_delay = delay * backoff
-        if elapsed < target_delay:
-            time.sleep(target_delay - elapsed)
+    if budget_exhausted.is_set():
+        print(f"\n\n  CDSE budget cap reached ({args.max_requests} requests). Stopped.")
 
-    # Final flush
+    # Let the writer finish queued batches, then flush the remainder
+    flush_queue.put(None)
+    writer.join()
     flush_buffer(dry_run=args.dry_run)
+    unwritten = retry_buffer.close()
+    close_pool()
+    print_progress(total, start_time, args.max_requests, force=True)
 
     elapsed = time.time() - start_time
     print(f"\n\n=== Enrichment Complete ===")
@@ -241,6 +388,8 @@ def main():
     print(f"  Landsat FB:  {stats['landsat_fallback']}")
     print(f"  Errors:      {stats['errors']}")
     print(f"  Written:     {stats['flushed']}")
+    if unwritten:
+        print(f"  Unwritten:   {unwritten} (DB failures)")
     print(f"  CDSE Reqs:   {stats['cdse_requests']}")
     print(f"  Time:        {elapsed:.0f}s ({elapsed/60:.1f}m)")
     if stats['enriched'] > 0:
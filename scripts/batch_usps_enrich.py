@@ -26,11 +26,13 @@ import atexit
 import json
 import os
 import queue
+import re
 import signal
 import sys
 import time
 import threading
-from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
 
 from dotenv import load_dotenv
@@ -40,40 +42,83 @@ import structlog
 
 from src.db import (
     get_db_connection,
+    get_pool,
+    run_pooled,
+    close_pool,
     migrate_add_usps_columns,
     get_parcels_needing_usps,
     batch_update_usps_results,
     save_usps_check,
 )
-from src.usps.vacancy import USPSVacancyChecker, split_situs
+from src.usps.vacancy import (
+    USPSVacancyChecker, VacancyResult, split_situs, _SKIP_CITY_WORDS, _STATE_CODES,
+)
 from src.analysis.flags import evaluate_usps_vacancy
+from src.counters import ThreadCounters
+from src.flush_retry import RetryBuffer
 
 logger = structlog.get_logger("batch_usps")
 
 LOCK_FILE = "/tmp/batch_usps_enrich.lock"
 BACKUP_DIR = "/tmp/usps_backups"
-
-# Thread-safe results buffer
-results_buffer = deque()
-buffer_lock = threading.Lock()
+REPLAY_CHUNK = 500  # backup rows per COPY + commit on --replay
+FLUSH_MAX_AGE = 300  # seconds between timed flushes from the monitor loop
+# Parcel fields read by pre_resolve_addresses
+_PHASE_A_FIELDS = ("parcel_id", "county", "situs_address", "mailing_city",
+                   "mailing_zip", "mailing_state", "latitude", "longitude")
+# Fast path for fully delimited situs ("123 MAIN ST, CHARLOTTE, NC 28202"),
+# compiled once at module load. Anything else goes through split_situs.
+_SITUS_RE = re.compile(
+    r"^\s*(?P<street>[^,]+?)\s*,\s*(?P<city>[^,]+?)\s*,\s*(?P<state>[A-Za-z]{2})"
+    r"(?:\s+(?P<zip>\d{5})(?:-\d{4})?)?\s*$"
+)
+# Phase A geocode progress: one line every 512 lookups, template bound once
+_GEO_PROGRESS_MASK = 511
+_geo_progress = "\r  Pre-resolve: geocoded {}/{} (nominatim={})".format
+# Concurrent Nominatim lookups in Phase A (request starts still capped at 1/sec)
+NOMINATIM_WORKERS = 3
+
+# Results buffer — SimpleQueue put/get are atomic, no explicit lock needed
+results_buffer = queue.SimpleQueue()
 shutdown_event = threading.Event()
 
 # Counters
-stats = {"checked": 0, "vacant": 0, "occupied": 0, "errors": 0,
-         "skipped_no_addr": 0, "flushed": 0}
-stats_lock = threading.Lock()
+stats = ThreadCounters("checked", "vacant", "occupied", "errors",
+                       "skipped_no_addr", "deduped", "flushed")
+
+
+def _json_default(v):
+    """Serialize datetimes as ISO strings in backup rows."""
+    if isinstance(v, datetime):
+        return v.isoformat()
+    raise TypeError(f"{type(v).__name__} is not JSON serializable")
+
+
+# One encoder reused for every backup row (datetime-safe via default=)
+_backup_encoder = json.JSONEncoder(default=_json_default)
+
+
+_backup_day: str | None = None
+_backup_path: str | None = None
+
+
+def _get_backup_path() -> str:
+    """Today's backup file; the directory and path are only rebuilt when the date changes."""
+    global _backup_day, _backup_path
+    today = time.strftime("%Y%m%d")
+    if today != _backup_day:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        _backup_path = os.path.join(BACKUP_DIR, f"usps_results_{today}.jsonl")
+        _backup_day = today
+    return _backup_path
 
 
 def _save_local_backup(db_batch: list[dict]):
     """Append results to a local JSON-lines file as DB outage insurance."""
-    os.makedirs(BACKUP_DIR, exist_ok=True)
-    backup_file = os.path.join(BACKUP_DIR, f"usps_results_{datetime.now().strftime('%Y%m%d')}.jsonl")
+    backup_file = _get_backup_path()
+    lines = [_backup_encoder.encode(row) + "\n" for row in db_batch]
     with open(backup_file, "a") as f:
-        for row in db_batch:
-            # Serialize datetime-safe
-            safe = {k: (v.isoformat() if isinstance(v, datetime) else v)
-                    for k, v in row.items()}
-            f.write(json.dumps(safe) + "\n")
+        f.writelines(lines)
     logger.info("usps_backup_saved", file=backup_file, records=len(db_batch))
 
 
@@ -93,7 +138,9 @@ def replay_backup(backup_file: str):
     print(f"  Replaying {len(records)} records from {backup_file}...")
     try:
         conn = get_db_connection()
-        updated = batch_update_usps_results(conn, records)
+        updated = 0
+        for i in range(0, len(records), REPLAY_CHUNK):
+            updated += batch_update_usps_results(conn, records[i:i + REPLAY_CHUNK])
         conn.close()
         print(f"  Replayed {updated} records to DB.")
         # Rename backup to mark as replayed
@@ -132,58 +179,103 @@ def release_lock():
         pass
 
 
+def _parse_situs(situs: str, state: str) -> dict:
+    """split_situs, short-circuited by _SITUS_RE for comma-delimited addresses."""
+    m = _SITUS_RE.match(situs)
+    if m:
+        street, city, st, zip_code = m.group("street", "city", "state", "zip")
+        st = st.upper()
+        # Same checks split_situs applies; anything else (UNINC, a ZIP in the
+        # city slot, a bad state) goes through it with the commas dropped
+        if st in _STATE_CODES and city.upper() not in _SKIP_CITY_WORDS and not city.isdigit():
+            return {"street": street, "city": city, "state": st, "zip_code": zip_code}
+        situs = situs.replace(",", " ")
+    return split_situs(situs, fallback_state=state)
+
+
 def pre_resolve_addresses(parcels: list[dict], state: str = "NC") -> tuple[list[dict], list[dict]]:
     """
     Phase A: Parse situs addresses and resolve missing city/zip via Nominatim.
-    Single-threaded to respect Nominatim 1 req/sec policy.
 
-    Returns (resolved, skipped) — resolved have street + (city OR zip).
+    Runs column-wise: every situs is parsed in one pass, then only the rows
+    left with neither city nor zip go to Nominatim, then the mailing-address
+    fallback fills what is still missing. Nominatim lookups run on a few
+    threads so round-trips overlap; geocode.py keeps request starts at 1/sec.
+
+    Returns (resolved, skipped). resolved rows carry only parcel_id, county
+    and the usps_* address fields check_single_parcel needs (street + city OR
+    zip); skipped is a list of (parcel_id, skip_reason) tuples.
     """
-    resolved = []
-    skipped = []
+    n = len(parcels)
+    # Columnar view of the fields Phase A reads — one dict probe per field per row
+    cols = {k: [p.get(k) for p in parcels] for k in _PHASE_A_FIELDS}
+    parcel_ids = cols["parcel_id"]
+
+    # Pass 1: parse situs for every parcel (pure CPU)
+    parsed = [_parse_situs(situs, state) if (situs or "").strip() else None
+              for situs in cols["situs_address"]]
+    streets = [(d.get("street") or "").strip() if d else "" for d in parsed]
+    cities = [d.get("city") if d else None for d in parsed]
+    zips = [d.get("zip_code") if d else None for d in parsed]
+    states = [(d.get("state") or state) if d else state for d in parsed]
+
+    # Pass 2: Nominatim only for rows with a street but neither city nor zip
+    need_geo = [i for i in range(n) if streets[i] and not cities[i] and not zips[i]]
     nominatim_calls = 0
+    if need_geo:
+        from src.usps.geocode import resolve_city_zip
 
-    for i, p in enumerate(parcels):
-        situs = p.get("situs_address", "")
-        if not situs or not situs.strip():
-            skipped.append({**p, "skip_reason": "no_situs"})
-            continue
-
-        # Parse situs
-        parsed = split_situs(situs, fallback_state=state)
-        street = parsed.get("street", "").strip()
-        city = parsed.get("city")
-        zip_code = parsed.get("zip_code")
-        parsed_state = parsed.get("state") or state
-
-        if not street:
-            skipped.append({**p, "skip_reason": "no_street"})
-            continue
+        lats, lngs = cols["latitude"], cols["longitude"]
 
-        # If both city and zip missing, try Nominatim
-        if not city and not zip_code:
+        def geocode(i: int) -> dict | None:
             try:
-                from src.usps.geocode import resolve_city_zip
-                geo = resolve_city_zip(
-                    street,
-                    p.get("county", ""),
-                    parsed_state,
-                    lat=float(p["latitude"]) if p.get("latitude") else None,
-                    lng=float(p["longitude"]) if p.get("longitude") else None,
+                return resolve_city_zip(
+                    streets[i],
+                    cols["county"][i] or "",
+                    states[i],
+                    lat=float(lats[i]) if lats[i] else None,
+                    lng=float(lngs[i]) if lngs[i] else None,
                 )
-                nominatim_calls += 1
-                city = geo.get("city") or city
-                zip_code = geo.get("zip") or zip_code
             except Exception as e:
-                logger.debug("nominatim_failed", parcel_id=p["parcel_id"], error=str(e))
+                logger.debug("nominatim_failed", parcel_id=parcel_ids[i], error=str(e))
+                return None
+
+        with ThreadPoolExecutor(max_workers=NOMINATIM_WORKERS,
+                                thread_name_prefix="nominatim") as pool:
+            futures = {pool.submit(geocode, i): i for i in need_geo}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                geo = future.result()
+                if geo:
+                    if geo.get("source") == "nominatim":
+                        nominatim_calls += 1
+                    cities[i] = geo.get("city") or cities[i]
+                    zips[i] = geo.get("zip") or zips[i]
+
+                if not done & _GEO_PROGRESS_MASK:
+                    print(_geo_progress(done, len(need_geo), nominatim_calls),
+                          end="", flush=True)
+
+    # Pass 3: mailing fallback + assemble, preserving input order
+    resolved = []
+    skipped = []
+    for i in range(n):
+        if parsed[i] is None:
+            skipped.append((parcel_ids[i], "no_situs"))
+            continue
+        street = streets[i]
+        if not street:
+            skipped.append((parcel_ids[i], "no_street"))
+            continue
+        city, zip_code, parsed_state = cities[i], zips[i], states[i]
 
         # Fallback: use mailing_city/mailing_zip from GIS data
         # Only when mailing_state matches property state (skip investor out-of-state)
         if not city and not zip_code:
-            mail_state = (p.get("mailing_state") or "").strip().upper()
+            mail_state = (cols["mailing_state"][i] or "").strip().upper()
             if mail_state == parsed_state.upper():
-                mail_city = (p.get("mailing_city") or "").strip()
-                mail_zip = (p.get("mailing_zip") or "").strip()[:5]  # Trim 9-digit zips
+                mail_city = (cols["mailing_city"][i] or "").strip()
+                mail_zip = (cols["mailing_zip"][i] or "").strip()[:5]  # Trim 9-digit zips
                 if mail_city or mail_zip:
                     city = mail_city or None
                     zip_code = mail_zip or None
@@ -192,30 +284,55 @@ def pre_resolve_addresses(parcels: list[dict], state: str = "NC") -> tuple[list[
 
         # Pre-call guard: need city OR zip
         if not city and not zip_code:
-            skipped.append({**p, "skip_reason": "no_city_no_zip"})
+            skipped.append((parcel_ids[i], "no_city_no_zip"))
             continue
 
         resolved.append({
-            **p,
+            "parcel_id": parcel_ids[i],
+            "county": cols["county"][i],
             "usps_street": street,
             "usps_city": city,
             "usps_state": parsed_state,
             "usps_zip": zip_code,
         })
 
-        if (i + 1) % 50 == 0:
-            print(f"\r  Pre-resolve: {i+1}/{len(parcels)} "
-                  f"(resolved={len(resolved)}, skipped={len(skipped)}, "
-                  f"nominatim={nominatim_calls})", end="", flush=True)
-
     print(f"\r  Pre-resolve complete: {len(resolved)} resolved, "
           f"{len(skipped)} skipped, {nominatim_calls} Nominatim calls")
 
     return resolved, skipped
 
 
-def check_single_parcel(parcel: dict, checker: USPSVacancyChecker) -> dict:
-    """Check a single pre-resolved parcel via USPS. Returns DB-ready result dict."""
+def dedupe_lookups(resolved: list[dict]) -> list[dict]:
+    """
+    Collapse parcels that share a normalized USPS address (multi-PIN lots,
+    condos without unit numbers) into one lookup each. The first parcel per
+    address is kept; the others ride along in its "siblings" list as
+    (parcel_id, county) and get the same result written back.
+    """
+    lookups: dict[tuple, dict] = {}
+    for p in resolved:
+        key = (" ".join(p["usps_street"].upper().split()),
+               (p.get("usps_city") or "").strip().upper(),
+               (p.get("usps_state") or "").upper(),
+               (p.get("usps_zip") or "").strip())
+        first = lookups.get(key)
+        if first is None:
+            lookups[key] = {**p, "siblings": []}
+        else:
+            first["siblings"].append((p["parcel_id"], p["county"]))
+    return list(lookups.values())
+
+
+@dataclass(slots=True)
+class UspsResult:
+    """One USPS check: the DB-ready row plus the raw result kept for audit."""
+    db_row: dict
+    raw: VacancyResult
+    account: int
+
+
+def check_single_parcel(parcel: dict, checker: USPSVacancyChecker) -> UspsResult:
+    """Check a single pre-resolved parcel via USPS."""
     pid = parcel["parcel_id"]
     county = parcel["county"]
 
@@ -238,7 +355,7 @@ def check_single_parcel(parcel: dict, checker: USPSVacancyChecker) -> dict:
     }
     flag = evaluate_usps_vacancy(usps_data)
 
-    return {
+    db_row = {
         "parcel_id": pid,
         "county": county,
         "usps_vacant": result.vacant,
@@ -253,10 +370,8 @@ def check_single_parcel(parcel: dict, checker: USPSVacancyChecker) -> dict:
         "usps_error": result.error,
         "flag_vacancy": flag["flag"],
         "vacancy_confidence": flag.get("confidence"),
-        # Keep raw result for audit
-        "_result": result,
-        "_account": checker.account,
     }
+    return UspsResult(db_row=db_row, raw=result, account=checker.account)
 
 
 def consumer_thread(work_queue: queue.Queue, checker: USPSVacancyChecker,
@@ -265,31 +380,37 @@ def consumer_thread(work_queue: queue.Queue, checker: USPSVacancyChecker,
     consecutive_errors = 0
 
     while not shutdown_event.is_set():
-        try:
-            parcel = work_queue.get(timeout=2)
-        except queue.Empty:
-            break  # Queue exhausted
+        parcel = work_queue.get()
+        if parcel is None:
+            work_queue.task_done()
+            break  # Sentinel: queue exhausted
 
         try:
             result = check_single_parcel(parcel, checker)
 
-            with buffer_lock:
-                results_buffer.append(result)
-
-            with stats_lock:
-                stats["checked"] += 1
-                if result["usps_error"]:
-                    stats["errors"] += 1
-                    consecutive_errors += 1
-                else:
-                    consecutive_errors = 0
-                    if result["usps_vacant"] is True:
-                        stats["vacant"] += 1
-                    elif result["usps_vacant"] is False:
-                        stats["occupied"] += 1
-
-            # Flush when buffer hits threshold
-            if len(results_buffer) >= flush_every:
+            results_buffer.put(result)
+            row = result.db_row
+            # Same address, same answer — fan out to parcels sharing it
+            for pid, county in parcel.get("siblings", ()):
+                results_buffer.put(UspsResult(
+                    db_row={**row, "parcel_id": pid, "county": county},
+                    raw=result.raw, account=result.account))
+
+            stats.add("checked")
+            stats.add("deduped", len(parcel.get("siblings", ())))
+            if row["usps_error"]:
+                stats.add("errors")
+                consecutive_errors += 1
+            else:
+                consecutive_errors = 0
+                if row["usps_vacant"] is True:
+                    stats.add("vacant")
+                elif row["usps_vacant"] is False:
+                    stats.add("occupied")
+
+            # Flush when buffer hits threshold (qsize is approximate; a
+            # concurrent flush just drains fewer rows)
+            if results_buffer.qsize() >= flush_every:
                 flush_buffer(dry_run=dry_run)
 
             # Safety: consecutive error circuit breaker
@@ -299,7 +420,8 @@ def consumer_thread(work_queue: queue.Queue, checker: USPSVacancyChecker,
                                consecutive=consecutive_errors)
                 print(f"\n  WARN: Account {checker.account} hit {consecutive_errors} "
                       f"consecutive errors — pausing 5 min")
-                time.sleep(300)
+                if shutdown_event.wait(300):
+                    break
                 consecutive_errors = 0
 
             if consecutive_errors >= 20:
@@ -317,65 +439,90 @@ def consumer_thread(work_queue: queue.Queue, checker: USPSVacancyChecker,
             work_queue.task_done()
 
 
+def drain_buffer() -> list[UspsResult]:
+    """Take everything currently in results_buffer."""
+    batch = []
+    try:
+        while True:
+            batch.append(results_buffer.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+_VACANT_LABELS = {True: "VACANT", False: "occupied", None: "unknown"}
+
+
 def flush_buffer(dry_run: bool = False):
-    """Flush results buffer to DB using a fresh connection."""
-    with buffer_lock:
-        if not results_buffer:
-            return
-        batch = list(results_buffer)
-        results_buffer.clear()
+    """Flush results buffer to DB over a pooled connection."""
+    batch = drain_buffer()
+    if not batch:
+        return
+
+    db_batch = [r.db_row for r in batch]
 
     if dry_run:
-        for r in batch:
-            vacant_str = ("VACANT" if r["usps_vacant"] else
-                          "occupied" if r["usps_vacant"] is False else
-                          "unknown")
+        lines = []
+        for r in db_batch:
+            vacant_str = _VACANT_LABELS.get(r["usps_vacant"], "unknown")
             conf = r.get("vacancy_confidence")
             conf_str = f"{conf:.2f}" if conf else "--"
             addr = r.get("usps_address") or "--"
             err = r.get("usps_error") or ""
-            print(f"  [DRY] {r['parcel_id']}  {vacant_str}  conf={conf_str}  "
-                  f"addr={addr}  {err}")
-        with stats_lock:
-            stats["flushed"] += len(batch)
+            lines.append(f"  [DRY] {r['parcel_id']}  {vacant_str}  conf={conf_str}  "
+                         f"addr={addr}  {err}\n")
+        _write_out("".join(lines))
+        stats.add("flushed", len(batch))
         return
 
-    # Strip internal fields before DB write
-    db_batch = []
-    for r in batch:
-        db_row = {k: v for k, v in r.items() if not k.startswith("_")}
-        db_batch.append(db_row)
-
     try:
-        flush_conn = get_db_connection()
-        try:
-            updated = batch_update_usps_results(flush_conn, db_batch)
-            with stats_lock:
-                stats["flushed"] += updated
-            logger.info("usps_buffer_flushed", batch_size=len(db_batch), updated=updated)
-        finally:
-            flush_conn.close()
+        _write_batch(db_batch)
     except Exception as e:
         logger.error("usps_flush_failed", batch_size=len(db_batch), error=str(e))
-        # Save to local JSON backup so we never lose data on DB outage
+        # Save to local JSON backup once so we never lose data on DB outage,
+        # then hand the rows to the retry thread instead of re-queueing them
         _save_local_backup(db_batch)
-        with buffer_lock:
-            results_buffer.extendleft(batch)
+        retry_buffer.push(db_batch)
+
+
+def _write_batch(db_batch: list[dict]):
+    """DB write for a flushed batch. Raises on failure."""
+    # Pooled keepalive connection; a connection Railway dropped is replaced once
+    updated = run_pooled(batch_update_usps_results, db_batch)
+    stats.add("flushed", updated)
+    logger.info("usps_buffer_flushed", batch_size=len(db_batch), updated=updated)
+
+
+# Failed flushes retry in the background with exponential backoff
+retry_buffer = RetryBuffer(_write_batch, max_backoff=300.0, name="usps-flush-retry")
+
+
+def _write_out(text: str):
+    """
+    Write pre-formatted text straight to stdout's byte buffer in one call,
+    skipping print()'s per-argument encoder pass so concurrent lines don't
+    interleave. Flushes the text layer first to keep ordering with print().
+    """
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:  # stdout replaced by a text-only stream
+        print(text, end="", flush=True)
+        return
+    sys.stdout.flush()
+    out.write(text.encode("ascii", "replace"))
+    out.flush()
 
 
 def print_progress(total: int, start_time: float):
     """Print progress line."""
-    with stats_lock:
-        s = dict(stats)
+    s = stats.snapshot()
     elapsed = time.time() - start_time
     rate = s["checked"] / elapsed * 3600 if elapsed > 0 else 0
     remaining = total - s["checked"]
     eta_min = remaining / (rate / 60) if rate > 0 else 0
 
-    print(f"\r  [{s['checked']}/{total}] "
-          f"vacant={s['vacant']} occ={s['occupied']} err={s['errors']} "
-          f"flushed={s['flushed']} | {rate:.0f}/hr ETA {eta_min:.0f}m",
-          end="", flush=True)
+    _write_out(f"\r  [{s['checked']}/{total}] "
+               f"vacant={s['vacant']} occ={s['occupied']} err={s['errors']} "
+               f"flushed={s['flushed']} | {rate:.0f}/hr ETA {eta_min:.0f}m")
 
 
 def main():
@@ -391,7 +538,7 @@ def main():
                         help="Min delay between USPS requests per account (sec)")
     parser.add_argument("--delay-max", type=int, default=65,
                         help="Max delay between USPS requests per account (sec)")
-    parser.add_argument("--flush-every", type=int, default=20,
+    parser.add_argument("--flush-every", type=int, default=100,
                         help="Flush to DB every N results")
     parser.add_argument("--cache-days", type=int, default=60,
                         help="Skip parcels checked within this many days")
@@ -453,16 +600,18 @@ def main():
     print(f"\n  Phase A: Pre-resolving {total_raw} addresses...")
     resolved, skipped = pre_resolve_addresses(parcels, state=args.state)
 
-    with stats_lock:
-        stats["skipped_no_addr"] = len(skipped)
+    stats.add("skipped_no_addr", len(skipped))
 
     if not resolved:
         print("  No resolvable addresses. Check situs_address data.")
         return
 
-    total = len(resolved)
+    lookups = dedupe_lookups(resolved)
+    total = len(lookups)
+    if total < len(resolved):
+        print(f"  Deduped: {len(resolved)} parcels share {total} unique addresses")
     est_hr = total / (len(account_nums) * 58)
-    print(f"\n  Phase B: USPS checking {total} parcels with {len(account_nums)} account(s)")
+    print(f"\n  Phase B: USPS checking {total} addresses with {len(account_nums)} account(s)")
     print(f"  Estimated time: ~{est_hr:.1f} hours")
 
     # Graceful shutdown
@@ -474,7 +623,7 @@ def main():
 
     # Build shared queue
     work_queue = queue.Queue()
-    for p in resolved:
+    for p in lookups:
         work_queue.put(p)
 
     # Create checker instances
@@ -495,9 +644,17 @@ def main():
         print("  ERROR: No valid USPS accounts. Check .env credentials.")
         return
 
+    # One flush connection per consumer thread + the final flush
+    if not args.dry_run:
+        get_pool(maxconn=len(checkers) + 1)
+
     start_time = time.time()
     print(f"  Starting at {datetime.now().strftime('%H:%M:%S')}...\n")
 
+    # One sentinel per consumer, queued behind the work
+    for _ in checkers:
+        work_queue.put(None)
+
     # Launch consumer threads
     threads = []
     for checker in checkers:
@@ -509,10 +666,15 @@ def main():
         t.start()
         threads.append(t)
 
-    # Monitor progress
+    # Monitor progress; also flush on a timer so a large --flush-every never
+    # holds more than FLUSH_MAX_AGE seconds of paid-quota results in memory
+    last_timed_flush = time.time()
     while any(t.is_alive() for t in threads):
-        time.sleep(5)
+        shutdown_event.wait(5)
         print_progress(total, start_time)
+        if time.time() - last_timed_flush >= FLUSH_MAX_AGE:
+            flush_buffer(dry_run=args.dry_run)
+            last_timed_flush = time.time()
         if shutdown_event.is_set():
             break
 
@@ -520,31 +682,36 @@ def main():
     for t in threads:
         t.join(timeout=30)
 
-    # Final flush
+    # Final flush, then one last attempt at anything the retry thread holds
     flush_buffer(dry_run=args.dry_run)
-
-    # Emergency backup if buffer still has unflushed data (DB still down)
-    with buffer_lock:
-        if results_buffer and not args.dry_run:
-            unflushed = [{k: v for k, v in r.items() if not k.startswith("_")}
-                         for r in results_buffer]
-            _save_local_backup(unflushed)
-            print(f"\n  WARNING: {len(unflushed)} records saved to local backup "
-                  f"(DB unreachable). Run --replay after DB recovery.")
+    unwritten = retry_buffer.close()
+    close_pool()
+
+    # Emergency backup if buffer still has unflushed data (e.g. a consumer
+    # outlived the join timeout)
+    leftover = drain_buffer()
+    if leftover and not args.dry_run:
+        _save_local_backup([r.db_row for r in leftover])
+        unwritten += len(leftover)
+    if unwritten:
+        print(f"\n  WARNING: {unwritten} records not written (DB unreachable); "
+              f"they are in the local backup. Run --replay after DB recovery.")
 
     elapsed = time.time() - start_time
+    final = stats.snapshot()
     print(f"\n\n=== USPS Enrichment Complete ===")
-    print(f"  Checked:   {stats['checked']}")
-    print(f"  Vacant:    {stats['vacant']}")
-    print(f"  Occupied:  {stats['occupied']}")
-    print(f"  Errors:    {stats['errors']}")
-    print(f"  Skipped:   {stats['skipped_no_addr']} (no resolvable address)")
-    print(f"  Flushed:   {stats['flushed']}")
+    print(f"  Checked:   {final['checked']}")
+    print(f"  Deduped:   {final['deduped']} (result shared from same address)")
+    print(f"  Vacant:    {final['vacant']}")
+    print(f"  Occupied:  {final['occupied']}")
+    print(f"  Errors:    {final['errors']}")
+    print(f"  Skipped:   {final['skipped_no_addr']} (no resolvable address)")
+    print(f"  Flushed:   {final['flushed']}")
     print(f"  Time:      {elapsed:.0f}s ({elapsed/60:.1f}m)")
-    if stats["checked"] > 0:
-        rate_hr = stats["checked"] / elapsed * 3600
+    if final["checked"] > 0:
+        rate_hr = final["checked"] / elapsed * 3600
         print(f"  Rate:      {rate_hr:.0f} checks/hr")
-        vacancy_rate = stats["vacant"] / stats["checked"] * 100
+        vacancy_rate = final["vacant"] / final["checked"] * 100
         print(f"  Vacancy %: {vacancy_rate:.1f}%")
 
 
@@ -13,38 +13,32 @@ Usage:
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from src.db import get_db_connection
+from src.db import get_db_connection, migrate_add_county_naip_year_view
 from src.naip.planetary import (
     STATE_PROBE_POINTS,
     discover_latest_naip_year,
     discover_all_available_years,
 )
 
+STAC_WORKERS = 10
+
 
 def get_county_max_years(conn, state_code: str) -> dict[str, dict]:
     """Get the max NAIP year in ndvi_history_years per county for a state.
 
-    Parses the comma-separated ndvi_history_years field, extracts max year.
+    Reads the precomputed mv_county_max_naip_year view (refreshed by
+    batch_historical_slope.py on completion).
     Returns {county: {"max_year": int, "parcels": int}}.
     """
     query = """
-        SELECT county,
-               MAX(split_part_year::int) AS max_year,
-               COUNT(*) AS parcels_with_slope
-        FROM (
-            SELECT county,
-                   UNNEST(string_to_array(ndvi_history_years, ',')) AS split_part_year
-            FROM gis_parcels_core
-            WHERE state_code = %s
-                AND ndvi_slope_5yr IS NOT NULL
-                AND ndvi_history_years IS NOT NULL
-        ) sub
-        WHERE split_part_year ~ '^\\d{4}$'
-        GROUP BY county
+        SELECT county, max_year, parcels
+        FROM mv_county_max_naip_year
+        WHERE state_code = %s
         ORDER BY county
     """
     with conn.cursor() as cur:
@@ -66,13 +60,19 @@ def main():
 
     print("\n=== NAIP Freshness Check ===\n")
 
+    # STAC probes are independent HTTP calls — run them concurrently
+    print(f"  Checking STAC for available years in {len(states)} state(s)"
+          f"{' (force refresh)' if args.force_refresh else ''}...\n")
+    with ThreadPoolExecutor(max_workers=STAC_WORKERS) as ex:
+        state_years = dict(zip(states, ex.map(
+            lambda s: discover_all_available_years(s, force_refresh=args.force_refresh),
+            states)))
+
     conn = get_db_connection()
+    migrate_add_county_naip_year_view(conn)
     stale_counties = []
 
-    for state in states:
-        print(f"  [{state}] Checking STAC for available years"
-              f"{' (force refresh)' if args.force_refresh else ''}...")
-        all_years = discover_all_available_years(state, force_refresh=args.force_refresh)
+    for state, all_years in state_years.items():
         latest = all_years[-1] if all_years else None
 
         if not latest:
@@ -3,7 +3,8 @@
 Batch geocode parcels using the US Census Geocoder.
 
 Free, no API key. Batch endpoint accepts CSV of up to 10,000 addresses.
-Backfills latitude/longitude into gis_parcels_core.
+Backfills latitude/longitude into gis_parcels_core. Non-dry runs first ensure
+the idx_gpc_missing_coords partial index (see db.migrate_add_geocode_index).
 
 Usage:
     python scripts/geocode_parcels.py --county Mecklenburg --state NC \
@@ -14,34 +15,77 @@ Usage:
 import argparse
 import csv
 import io
-import re
+import os
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
 
 from dotenv import load_dotenv
 load_dotenv()
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from psycopg2.extras import RealDictCursor
 
-from src.db import get_db_connection
+from src.db import get_db_connection, batch_update_parcel_coords, migrate_add_geocode_index
 
 CENSUS_BATCH_URL = "https://geocoding.geo.census.gov/geocoder/locations/addressbatch"
 BATCH_SIZE = 9000  # Census max is 10K, leave margin
+GEOCODE_WORKERS = int(os.environ.get("GEOCODE_WORKERS", "3"))  # concurrent batch POSTs
 
+# Situs tokens: street ... CITY STATE. A city runs back from the state to the
+# first street suffix/direction or number-bearing token (house, route, unit).
+_STATES = frozenset({"NC", "SC"})
+_STREET_SUFFIXES = frozenset({
+    "ST", "RD", "DR", "LN", "AVE", "BLVD", "HWY", "CT", "PL", "WAY", "CIR",
+    "TRL", "PKWY", "EXT", "N", "S", "E", "W", "NE", "NW", "SE", "SW",
+})
+_MAX_CITY_TOKENS = 3
 
+
+def _census_session() -> requests.Session:
+    """Keep-alive session with retry/backoff for the Census batch endpoint."""
+    s = requests.Session()
+    retry = Retry(total=3, backoff_factor=1.0,
+                  status_forcelist=[502, 503, 504],
+                  allowed_methods=["POST"])
+    s.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=GEOCODE_WORKERS,
+                                    max_retries=retry))
+    return s
+
+
+_session = _census_session()
+
+
+# Units/condos in one building share a situs string; returns an immutable tuple
+@lru_cache(maxsize=131072)
 def parse_situs_address(situs: str) -> tuple[str, str, str]:
     """
     Parse situs_address like '2665 OLANDO ST CHARLOTTE NC' into (street, city, state).
+
+    Multi-word cities ('123 MAIN ST MOUNT HOLLY NC') stay whole when a street
+    suffix or number marks where the street ends.
     """
     if not situs:
         return ("", "", "")
 
     situs = situs.strip()
 
-    # Pattern: street ... CITY STATE
-    match = re.match(r'^(.+?)\s+([A-Z]+)\s+(NC|SC)$', situs)
-    if match:
-        return (match.group(1).strip(), match.group(2).strip(), match.group(3).strip())
+    tokens = situs.split()
+    if len(tokens) >= 3 and tokens[-1] in _STATES:
+        end = len(tokens) - 1
+        start = end
+        while start > 1 and end - start < _MAX_CITY_TOKENS:
+            token = tokens[start - 1]
+            if token in _STREET_SUFFIXES or not token.isalpha():
+                break
+            start -= 1
+        else:
+            # No street boundary in reach: keep the one-word city
+            start = end - 1
+        start = min(start, end - 1)  # suffix right before the state is the city
+        return (" ".join(tokens[:start]), " ".join(tokens[start:end]), tokens[-1])
 
     # Fallback: try splitting on last two tokens
     parts = situs.rsplit(None, 2)
@@ -58,8 +102,9 @@ def geocode_batch(rows: list[dict]) -> dict[str, tuple[float, float]]:
     rows: list of dicts with 'parcel_id' and 'situs_address'
     Returns: {parcel_id: (lat, lng)} for matched addresses
     """
-    buf = io.StringIO()
-    writer = csv.writer(buf)
+    # Rows are encoded straight into one bytes buffer that is uploaded as-is
+    buf = io.BytesIO()
+    writer = csv.writer(io.TextIOWrapper(buf, encoding="utf-8", newline="", write_through=True))
 
     for row in rows:
         street, city, state = parse_situs_address(row["situs_address"])
@@ -68,24 +113,23 @@ def geocode_batch(rows: list[dict]) -> dict[str, tuple[float, float]]:
         writer.writerow([row["parcel_id"], street, city, state, ""])
 
     csv_content = buf.getvalue()
-    if not csv_content.strip():
+    if not csv_content:
         return {}
 
-    resp = requests.post(
+    results = {}
+    with _session.post(
         CENSUS_BATCH_URL,
         files={"addressFile": ("addresses.csv", csv_content, "text/csv")},
         data={"benchmark": "Public_AR_Current", "returntype": "locations"},
         timeout=120,
-    )
-    resp.raise_for_status()
+        stream=True,
+    ) as resp:
+        resp.raise_for_status()
+        resp.encoding = resp.encoding or "utf-8"
 
-    results = {}
-    for line in resp.text.strip().split("\n"):
-        if not line.strip():
-            continue
         # CSV format: "id","input_address","match_status","match_type","matched_address","coords","tiger_id","side"
-        reader = csv.reader(io.StringIO(line))
-        for fields in reader:
+        # Parsed line by line off the stream; blank lines come back as [].
+        for fields in csv.reader(resp.iter_lines(decode_unicode=True)):
             if len(fields) >= 6 and fields[2] == "Match":
                 parcel_id = fields[0].strip('"')
                 coords = fields[5].strip('"')
@@ -108,11 +152,11 @@ def run_geocode(county: str, state: str, limit: int = 7000,
                 dry_run: bool = False):
     """Geocode parcels missing coordinates and backfill into DB."""
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    if not dry_run:
+        migrate_add_geocode_index(conn)
 
-    # Build query for parcels WITHOUT coordinates
-    query = """
-        SELECT parcel_id, situs_address
+    # Filter for parcels WITHOUT coordinates
+    where = """
         FROM gis_parcels_core
         WHERE county = %s AND state_code = %s
             AND (latitude IS NULL OR longitude IS NULL)
@@ -121,86 +165,114 @@ def run_geocode(county: str, state: str, limit: int = 7000,
     params = [county, state]
 
     if property_class:
-        query += " AND property_class = %s"
+        where += " AND property_class = %s"
         params.append(property_class)
 
     if min_value is not None:
-        query += " AND total_value >= %s"
+        where += " AND total_value >= %s"
         params.append(min_value)
 
     if max_value is not None:
-        query += " AND total_value <= %s"
+        where += " AND total_value <= %s"
         params.append(max_value)
 
     if min_sqft is not None:
-        query += " AND sqft >= %s"
+        where += " AND sqft >= %s"
         params.append(min_sqft)
 
     if max_sqft is not None:
-        query += " AND sqft <= %s"
+        where += " AND sqft <= %s"
         params.append(max_sqft)
 
-    query += " ORDER BY parcel_id LIMIT %s"
-    params.append(limit)
-
-    cur.execute(query, params)
-    rows = [dict(r) for r in cur.fetchall()]
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*)" + where, params)
+        total = min(cur.fetchone()[0], limit)
+    conn.commit()
 
-    if not rows:
+    if not total:
         print(f"No parcels need geocoding for {county}, {state} with given filters")
         conn.close()
         return
 
-    print(f"Found {len(rows)} parcels to geocode in {county}, {state}")
+    print(f"Found {total} parcels to geocode in {county}, {state}")
+
+    def read_batches():
+        # Keyset pages of BATCH_SIZE in parcel_id order, each its own short
+        # read transaction, so only the batches in flight are in memory
+        after = ""
+        remaining = total
+        while remaining > 0:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT parcel_id, situs_address" + where
+                            + " AND parcel_id > %s ORDER BY parcel_id LIMIT %s",
+                            params + [after, min(BATCH_SIZE, remaining)])
+                batch = cur.fetchall()
+            conn.commit()
+            if not batch:
+                return
+            after = batch[-1]["parcel_id"]
+            remaining -= len(batch)
+            yield batch
 
     # Process in batches
     total_matched = 0
     total_updated = 0
+    total_read = 0
+    total_batches = (total + BATCH_SIZE - 1) // BATCH_SIZE
 
-    for batch_start in range(0, len(rows), BATCH_SIZE):
-        batch = rows[batch_start:batch_start + BATCH_SIZE]
-        batch_num = (batch_start // BATCH_SIZE) + 1
-        total_batches = (len(rows) + BATCH_SIZE - 1) // BATCH_SIZE
-
-        print(f"\nBatch {batch_num}/{total_batches}: {len(batch)} addresses...")
-
-        try:
-            results = geocode_batch(batch)
-            total_matched += len(results)
-            print(f"  Matched: {len(results)}/{len(batch)} ({len(results)/len(batch)*100:.1f}%)")
-
-            if not dry_run and results:
-                # Batch update lat/lng in DB
-                update_cur = conn.cursor()
-                for parcel_id, (lat, lng) in results.items():
-                    update_cur.execute("""
-                        UPDATE gis_parcels_core
-                        SET latitude = %s, longitude = %s
-                        WHERE county = %s AND state_code = %s AND parcel_id = %s
-                            AND latitude IS NULL
-                    """, (lat, lng, county, state, parcel_id))
-                    total_updated += update_cur.rowcount
-                conn.commit()
-                update_cur.close()
-                print(f"  Updated DB: {total_updated} rows")
-            elif dry_run:
-                # Show samples
-                samples = list(results.items())[:3]
-                for pid, (lat, lng) in samples:
-                    print(f"    {pid}: ({lat:.6f}, {lng:.6f})")
-
-        except Exception as e:
-            print(f"  ERROR: {e}")
-
-        # Rate limit between batches
-        if batch_start + BATCH_SIZE < len(rows):
+    def fetch(batch_num, batch):
+        # Rate limit: a worker pauses between its own successive batches
+        if batch_num > GEOCODE_WORKERS:
             time.sleep(2)
+        return geocode_batch(batch)
+
+    # Census processes a batch server-side for tens of seconds; keep a few
+    # in flight. DB reads and writes stay on this thread (one connection).
+    batch_iter = enumerate(read_batches(), 1)
+    with ThreadPoolExecutor(max_workers=GEOCODE_WORKERS) as executor:
+        pending = {}
+
+        def refill():
+            while len(pending) < GEOCODE_WORKERS:
+                item = next(batch_iter, None)
+                if item is None:
+                    return
+                pending[executor.submit(fetch, *item)] = item
+
+        refill()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch_num, batch = pending.pop(future)
+                total_read += len(batch)
+                print(f"\nBatch {batch_num}/{total_batches}: {len(batch)} addresses...")
+
+                try:
+                    results = future.result()
+                    total_matched += len(results)
+                    print(f"  Matched: {len(results)}/{len(batch)} ({len(results)/len(batch)*100:.1f}%)")
+
+                    if not dry_run and results:
+                        # Batch update lat/lng in DB (one COPY + one UPDATE per batch)
+                        total_updated += batch_update_parcel_coords(conn, county, state, results)
+                        print(f"  Updated DB: {total_updated} rows")
+                    elif dry_run:
+                        # Show samples
+                        samples = list(results.items())[:3]
+                        for pid, (lat, lng) in samples:
+                            print(f"    {pid}: ({lat:.6f}, {lng:.6f})")
+
+                except Exception as e:
+                    conn.rollback()  # keep the connection usable for the next page
+                    print(f"  ERROR: {e}")
+
+            refill()
 
     # Summary
-    match_rate = total_matched / len(rows) * 100 if rows else 0
+    match_rate = total_matched / total_read * 100 if total_read else 0
     print("\n" + "=" * 60)
     print(f"GEOCODING COMPLETE — {county}, {state}")
-    print(f"  Total addresses:  {len(rows)}")
+    print(f"  Total addresses:  {total_read}")
     print(f"  Matched:          {total_matched} ({match_rate:.1f}%)")
     if not dry_run:
         print(f"  DB rows updated:  {total_updated}")
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 """Planet refinement test on flagged parcels."""
 
+from concurrent.futures import ThreadPoolExecutor
+
 from dotenv import load_dotenv
 load_dotenv()
 
 from src.planet.client import planet_refine
+from src.pipeline.scan import PLANET_WORKERS
 from src.db import get_db_connection
 from psycopg2.extras import RealDictCursor
 
@@ -27,10 +30,16 @@ def main():
     print(f"Running Planet refinement on {len(flagged)} flagged parcels...\n")
     print("=" * 80)
 
+    def refine(p):
+        return planet_refine(float(p['latitude']), float(p['longitude']))
+
     results = []
-    for p in flagged:
+    # Refinements run concurrently; map() hands them back in score order
+    with ThreadPoolExecutor(max_workers=PLANET_WORKERS) as executor:
+        refined = list(executor.map(refine, flagged))
+
+    for p, pr in zip(flagged, refined):
         pid = p['parcel_id']
-        lat, lng = float(p['latitude']), float(p['longitude'])
         score = float(p['distress_score']) if p['distress_score'] else 0
         ndvi = float(p['ndvi_score']) if p['ndvi_score'] is not None else None
         addr = (p['situs_address'] or '--')[:35]
@@ -40,7 +49,6 @@ def main():
         ndvi_str = f"{ndvi:.3f}" if ndvi is not None else "NULL"
         print(f"\n{pid} | {addr} | {flags} | score={score:.1f} NDVI={ndvi_str} | {val}")
 
-        pr = planet_refine(lat, lng)
         results.append({"parcel": dict(p), "planet": pr})
 
         status = pr.get("status")
@@ -68,12 +76,22 @@ def main():
     print(f"\n{'='*80}")
     print("PLANET REFINEMENT SUMMARY")
     print(f"{'='*80}")
-    with_scenes = sum(1 for r in results if r["planet"].get("scene_count", 0) > 0)
-    with_latest = sum(1 for r in results if r["planet"].get("thumbnail_latest_url"))
-    with_pairs = sum(1 for r in results if r["planet"].get("thumbnail_earliest_url"))
-    with_change = sum(1 for r in results if r["planet"].get("change_score") is not None)
-    spans = [r["planet"]["temporal_span_days"] for r in results if r["planet"].get("temporal_span_days")]
-    changes = [r["planet"]["change_score"] for r in results if r["planet"].get("change_score") is not None]
+    # One pass over the refinements for every count and range below
+    with_scenes = with_latest = with_pairs = with_change = 0
+    spans, changes = [], []
+    for r in results:
+        pr = r["planet"]
+        if pr.get("scene_count", 0) > 0:
+            with_scenes += 1
+        if pr.get("thumbnail_latest_url"):
+            with_latest += 1
+        if pr.get("thumbnail_earliest_url"):
+            with_pairs += 1
+        if pr.get("change_score") is not None:
+            with_change += 1
+            changes.append(pr["change_score"])
+        if pr.get("temporal_span_days"):
+            spans.append(pr["temporal_span_days"])
 
     print(f"Total refined:      {len(results)}")
     print(f"With scenes:        {with_scenes}")
@@ -13,7 +13,9 @@ Usage:
 
 import argparse
 import json
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 
@@ -22,34 +24,45 @@ load_dotenv()
 
 import structlog
 
-from src.db import get_db_connection, get_parcels_with_coords
-from src.analysis.scanner import scan_free, scan_distress, scan_and_write
+from src.db import (
+    PersistentConnection,
+    get_db_connection,
+    count_parcels_with_coords,
+    iter_parcels_with_coords,
+)
+from src.analysis.scanner import scan_free, scan_distress, signals_from_flags
+from src.signals import write_scan_results
+from src.flush_retry import RetryBuffer
 
 logger = structlog.get_logger("county_scan")
 
 FLAGGED_DIR = Path("data/flagged")
+SIGNAL_FLUSH_EVERY = 200  # parcels per write_scan_results call in full mode
+# Parcels submitted ahead of the workers, per worker (see batch_ndvi_scan)
+INFLIGHT_PER_WORKER = 4
 
 
 def run_county_scan(county: str, state: str, scan_pass: str = "full",
                     limit: int | None = None, dry_run: bool = False,
                     resume_from: str | None = None, delay: float = 1.0,
+                    workers: int = 1,
                     sentinel_months: int = 12,
                     mailing_zip: str | None = None,
                     property_class: str | None = None,
                     min_value: float | None = None, max_value: float | None = None,
                     min_sqft: float | None = None, max_sqft: float | None = None):
     """Run distress scan for parcels in a county."""
-    conn = get_db_connection()
-
-    parcels = get_parcels_with_coords(
-        conn, county, state_code=state, limit=limit,
+    parcel_filters = dict(
         mailing_zip=mailing_zip, property_class=property_class,
         min_value=min_value, max_value=max_value,
         min_sqft=min_sqft, max_sqft=max_sqft,
+        resume_from=resume_from,
     )
+    conn = get_db_connection()
+    total = count_parcels_with_coords(conn, county, state, limit=limit, **parcel_filters)
     conn.close()
 
-    if not parcels:
+    if not total:
         print(f"No parcels found matching filters for {county}, {state}")
         return
 
@@ -65,25 +78,20 @@ def run_county_scan(county: str, state: str, scan_pass: str = "full",
         filters.append(f"sqft={min_sqft or 0}-{max_sqft or '∞'}")
     filter_str = f" [{', '.join(filters)}]" if filters else ""
 
-    print(f"Found {len(parcels)} parcels in {county}, {state}{filter_str}")
+    print(f"Found {total} parcels in {county}, {state}{filter_str}")
 
-    # Resume support
+    # Resume support: parcels stream in parcel_id order starting here
     if resume_from:
-        for i, p in enumerate(parcels):
-            if p["parcel_id"] == resume_from:
-                skip_count = i
-                parcels = parcels[i:]
-                print(f"Resuming from {resume_from} (skipped {skip_count} parcels)")
-                break
+        print(f"Resuming from {resume_from}")
 
     mode_label = {"1": "PASS 1 (NAIP+FEMA)", "full": "FULL SCAN"}[scan_pass]
     dry_label = " DRY RUN" if dry_run else ""
     print(f"Mode: {mode_label}{dry_label}")
-    print(f"Scanning {len(parcels)} parcels")
+    print(f"Scanning {total} parcels ({workers} workers)")
     print("-" * 60)
 
     stats = {
-        "total": len(parcels),
+        "total": total,
         "scanned": 0,
         "flagged": 0,
         "sentinel_worthy": 0,
@@ -94,78 +102,152 @@ def run_county_scan(county: str, state: str, scan_pass: str = "full",
 
     flagged_parcels = []
 
-    for i, parcel in enumerate(parcels):
-        parcel_id = parcel["parcel_id"]
+    def scan_parcel(i, parcel):
+        # Rate limit: each worker pauses between its own parcels
+        if i >= workers:
+            time.sleep(delay)
         lat = float(parcel["latitude"])
         lng = float(parcel["longitude"])
-
-        print(f"\n[{i+1}/{stats['total']}] {parcel_id} ({lat:.4f}, {lng:.4f})", end="")
-
+        if scan_pass == "1":
+            # Pass 1: Free scan only
+            return scan_free(lat, lng)
+        # Full scan (signals are buffered and written below)
+        return scan_distress(lat, lng, months=sentinel_months)
+
+    # Full-mode signals are written SIGNAL_FLUSH_EVERY parcels at a time on a
+    # short-lived connection, not one connection + write per parcel. A failed
+    # write is retried in the background with backoff rather than dropped.
+    pending_signals = []
+    pending_parcels = 0
+    written_lock = threading.Lock()
+
+    def write_signal_batch(batch: list[dict]):
+        conn = get_db_connection()
         try:
-            if scan_pass == "1":
-                # Pass 1: Free scan only
-                result = scan_free(lat, lng)
-                flags = result.get("flags", [])
-                score = result.get("distress_score", 0)
-                worthy = result.get("sentinel_worthy", False)
-
-                status_parts = [f"score={score:.2f}"]
-                if flags:
-                    status_parts.append(f"flags={[f['signal_code'] for f in flags]}")
-                if worthy:
-                    status_parts.append("SENTINEL_WORTHY")
-                print(f"  {' | '.join(status_parts)}")
-
-                if worthy:
-                    stats["sentinel_worthy"] += 1
-                    flagged_parcels.append({
-                        "parcel_id": parcel_id,
-                        "lat": lat,
-                        "lng": lng,
-                        "score": score,
-                        "flags": [f["signal_code"] for f in flags],
-                        "naip_ndvi": result.get("naip", {}).get("current_ndvi") if result.get("naip") else None,
-                        "fema_risk": result.get("fema", {}).get("risk_level") if result.get("fema") else None,
-                    })
-
-            else:
-                # Full scan
-                if dry_run:
-                    result = scan_distress(lat, lng, months=sentinel_months)
-                else:
-                    result = scan_and_write(
-                        lat=lat, lng=lng, parcel_id=parcel_id,
-                        county_name=county, state_code=state,
-                        months=sentinel_months,
-                    )
-                    db_status = result.get("db_write", {})
-                    if db_status.get("success", 0) > 0:
-                        stats["written"] += db_status["success"]
-
-                flags = result.get("flags", [])
-                score = result.get("distress_score", 0)
-                print(f"  score={score:.2f} flags={[f['signal_code'] for f in flags]}")
-
-            stats["scanned"] += 1
-            if flags:
-                stats["flagged"] += 1
-
-            if result.get("errors"):
-                for err in result["errors"]:
-                    logger.warning("scan_error", parcel_id=parcel_id, error=err)
-
-        except KeyboardInterrupt:
-            print(f"\n\nInterrupted at parcel {parcel_id}")
-            print(f"Resume with: --resume-from {parcel_id}")
-            break
-        except Exception as e:
-            stats["errors"] += 1
-            print(f"  ERROR: {e}")
-            logger.error("parcel_scan_failed", parcel_id=parcel_id, error=str(e))
-
-        # Rate limiting
-        if i < len(parcels) - 1:
-            time.sleep(delay)
+            success, fail = write_scan_results(conn, county, state, batch)
+        finally:
+            conn.close()
+        with written_lock:
+            stats["written"] += success
+        logger.info("signals_written", signals=len(batch), success=success, fail=fail)
+
+    retry_buffer = RetryBuffer(write_signal_batch, name="signal-flush-retry")
+
+    def flush_signals():
+        nonlocal pending_signals, pending_parcels
+        if pending_signals:
+            try:
+                write_signal_batch(pending_signals)
+            except Exception as e:
+                logger.error("signal_write_failed", parcels=pending_parcels, error=str(e))
+                retry_buffer.push(pending_signals)
+        pending_signals = []
+        pending_parcels = 0
+
+    # Parcels stream in keyset pages and are scanned `workers` at a time,
+    # with a bounded number submitted ahead; results are reported as they
+    # complete. On interrupt, the earliest parcel still in flight (or the
+    # next unread one) is the resume point.
+    reader = PersistentConnection()
+    parcel_iter = enumerate(iter_parcels_with_coords(reader, county, state, limit=limit,
+                                                     **parcel_filters))
+    max_inflight = workers * INFLIGHT_PER_WORKER
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = {}  # future -> (index, parcel)
+
+    def refill():
+        while len(pending) < max_inflight:
+            item = next(parcel_iter, None)
+            if item is None:
+                return
+            pending[executor.submit(scan_parcel, *item)] = item
+
+    try:
+        refill()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(finished, key=lambda f: pending[f][0]):
+                i, parcel = pending[future]
+                parcel_id = parcel["parcel_id"]
+                lat = float(parcel["latitude"])
+                lng = float(parcel["longitude"])
+
+                print(f"\n[{i+1}/{stats['total']}] {parcel_id} ({lat:.4f}, {lng:.4f})", end="")
+
+                try:
+                    result = future.result()
+
+                    if scan_pass == "1":
+                        flags = result.get("flags", [])
+                        score = result.get("distress_score", 0)
+                        worthy = result.get("sentinel_worthy", False)
+
+                        status_parts = [f"score={score:.2f}"]
+                        if flags:
+                            status_parts.append(f"flags={[f['signal_code'] for f in flags]}")
+                        if worthy:
+                            status_parts.append("SENTINEL_WORTHY")
+                        print(f"  {' | '.join(status_parts)}")
+
+                        if worthy:
+                            stats["sentinel_worthy"] += 1
+                            flagged_parcels.append({
+                                "parcel_id": parcel_id,
+                                "lat": lat,
+                                "lng": lng,
+                                "score": score,
+                                "flags": [f["signal_code"] for f in flags],
+                                "naip_ndvi": result.get("naip", {}).get("current_ndvi") if result.get("naip") else None,
+                                "fema_risk": result.get("fema", {}).get("risk_level") if result.get("fema") else None,
+                            })
+
+                    else:
+                        flags = result.get("flags", [])
+                        score = result.get("distress_score", 0)
+                        print(f"  score={score:.2f} flags={[f['signal_code'] for f in flags]}")
+
+                        if not dry_run and flags:
+                            pending_signals.extend(signals_from_flags(parcel_id, flags))
+                            pending_parcels += 1
+                            if pending_parcels >= SIGNAL_FLUSH_EVERY:
+                                flush_signals()
+
+                    stats["scanned"] += 1
+                    if flags:
+                        stats["flagged"] += 1
+
+                    if result.get("errors"):
+                        for err in result["errors"]:
+                            logger.warning("scan_error", parcel_id=parcel_id, error=err)
+
+                except Exception as e:
+                    stats["errors"] += 1
+                    print(f"  ERROR: {e}")
+                    logger.error("parcel_scan_failed", parcel_id=parcel_id, error=str(e))
+
+                # Only now is it safe to drop from the resume bookkeeping
+                del pending[future]
+
+            refill()
+
+    except KeyboardInterrupt:
+        # Drop queued parcels; the few in flight finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+        if pending:
+            resume_id = min(pending.values(), key=lambda item: item[0])[1]["parcel_id"]
+        else:
+            item = next(parcel_iter, None)
+            resume_id = item[1]["parcel_id"] if item else None
+        if resume_id:
+            print(f"\n\nInterrupted at parcel {resume_id}")
+            print(f"Resume with: --resume-from {resume_id}")
+    else:
+        executor.shutdown()
+    finally:
+        reader.close()
+
+    flush_signals()
+    unwritten = retry_buffer.close()
 
     # Save flagged parcels for pass 2
     if scan_pass == "1" and flagged_parcels:
@@ -185,6 +267,8 @@ def run_county_scan(county: str, state: str, scan_pass: str = "full",
         print(f"  Sentinel-worthy:  {stats['sentinel_worthy']}")
     if stats["written"]:
         print(f"  Signals written:  {stats['written']}")
+    if unwritten:
+        print(f"  Signals unwritten (DB failures): {unwritten}")
     print(f"  Errors:           {stats['errors']}")
     print(f"  Elapsed:          {elapsed:.0f}s ({elapsed/max(stats['scanned'],1):.1f}s/parcel)")
     print("=" * 60)
@@ -205,7 +289,8 @@ if __name__ == "__main__":
     parser.add_argument("--limit", type=int, help="Max parcels to scan")
     parser.add_argument("--dry-run", action="store_true", help="Scan only, don't write to DB")
     parser.add_argument("--resume-from", help="Resume from this parcel ID")
-    parser.add_argument("--delay", type=float, default=1.0, help="Seconds between parcels")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds between parcels (per worker)")
+    parser.add_argument("--workers", type=int, default=1, help="Parcels scanned concurrently (default 1, sequential)")
     parser.add_argument("--months", type=int, default=12, help="Sentinel lookback months")
 
     args = parser.parse_args()
@@ -218,6 +303,7 @@ if __name__ == "__main__":
         dry_run=args.dry_run,
         resume_from=args.resume_from,
         delay=args.delay,
+        workers=args.workers,
         sentinel_months=args.months,
         mailing_zip=args.mailing_zip,
         property_class=args.property_class,
@@ -317,6 +317,19 @@ def _build_summary(result: dict) -> str:
     return "\n".join(parts)
 
 
+def signals_from_flags(parcel_id: str, flags: list[dict]) -> list[dict]:
+    """Format a scan's flags as write_scan_results rows."""
+    return [
+        {
+            "parcel_id": parcel_id,
+            "signal_code": flag["signal_code"],
+            "confidence": flag["confidence"],
+            "evidence": flag["evidence"],
+        }
+        for flag in flags
+    ]
+
+
 def scan_and_write(lat: float, lng: float, parcel_id: str,
                    county_name: str, state_code: str,
                    months: int = 12) -> dict:
@@ -341,15 +354,7 @@ def scan_and_write(lat: float, lng: float, parcel_id: str,
         result["db_write"] = {"status": "skipped", "reason": "no_flags"}
         return result
 
-    # Format flags for the signal writer
-    scan_results = []
-    for flag in result["flags"]:
-        scan_results.append({
-            "parcel_id": parcel_id,
-            "signal_code": flag["signal_code"],
-            "confidence": flag["confidence"],
-            "evidence": flag["evidence"],
-        })
+    scan_results = signals_from_flags(parcel_id, result["flags"])
 
     try:
         conn = get_db_connection()
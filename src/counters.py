@@ -0,0 +1,48 @@
+"""
+Lock-free progress counters for threaded batch scripts.
+
+Each thread increments its own plain dict (via threading.local), so the hot
+path never takes a lock. Reads sum every thread's dict — slightly stale
+under concurrent writes, which is fine for progress lines and checkpoints.
+After worker threads are joined, reads are exact.
+
+Usage:
+    stats = ThreadCounters("processed", "errors")
+    stats.add("processed")          # in workers
+    stats["processed"]              # summed read
+    stats.snapshot()                # {"processed": ..., "errors": ...}
+"""
+
+import threading
+
+
+class ThreadCounters:
+    """Named integer counters, one private dict per thread, summed on read."""
+
+    def __init__(self, *keys: str):
+        self._keys = keys
+        self._local = threading.local()
+        self._tables = []
+        self._register_lock = threading.Lock()
+
+    def _mine(self) -> dict:
+        counts = getattr(self._local, "counts", None)
+        if counts is None:
+            # First use on this thread: the only time a lock is taken
+            counts = dict.fromkeys(self._keys, 0)
+            self._local.counts = counts
+            with self._register_lock:
+                self._tables.append(counts)
+        return counts
+
+    def add(self, key: str, n: int = 1) -> None:
+        """Increment `key` by n on the calling thread's counters."""
+        self._mine()[key] += n
+
+    def snapshot(self) -> dict:
+        """Current totals across all threads."""
+        tables = list(self._tables)
+        return {k: sum(t[k] for t in tables) for k in self._keys}
+
+    def __getitem__(self, key: str) -> int:
+        return sum(t[key] for t in list(self._tables))
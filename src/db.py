@@ -5,8 +5,11 @@ Connects to the shared Railway PostgreSQL instance used by Motivated Curator.
 Reads parcel data, writes distress signals.
 """
 
+import io
 import json
 import os
+import threading
+import time
 from datetime import datetime
 
 import psycopg2
@@ -19,12 +22,205 @@ load_dotenv()
 logger = structlog.get_logger("db")
 
 
+# TCP keepalives so long-lived connections survive Railway's idle-connection
+# reaper between flushes instead of being reopened each time.
+KEEPALIVE_KWARGS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+
 def get_db_connection():
-    """Create psycopg2 connection from DATABASE_URL env var."""
+    """Create psycopg2 connection from DATABASE_URL env var (with TCP keepalives)."""
     database_url = os.environ.get("DATABASE_URL")
     if not database_url:
         raise ValueError("DATABASE_URL environment variable not set")
-    return psycopg2.connect(database_url)
+    return psycopg2.connect(database_url, **KEEPALIVE_KWARGS)
+
+
+# Pooled connections idle longer than this are replaced rather than pinged —
+# Railway drops idle connections after a few minutes.
+POOL_RECYCLE_SECONDS = 240
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class _PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers when it was last returned to the pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+
+
+def get_pool(maxconn: int = 10):
+    """
+    Module-level ThreadedConnectionPool (keepalive connections), created on
+    first call. maxconn only applies to that first call.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from psycopg2.pool import ThreadedConnectionPool
+            database_url = os.environ.get("DATABASE_URL")
+            if not database_url:
+                raise ValueError("DATABASE_URL environment variable not set")
+            _pool = ThreadedConnectionPool(1, maxconn, database_url,
+                                           connection_factory=_PooledConnection,
+                                           **KEEPALIVE_KWARGS)
+        return _pool
+
+
+def _checkout(pool):
+    """
+    getconn() with recycle + pre-ping: a connection idle past
+    POOL_RECYCLE_SECONDS is closed and replaced, otherwise it is validated
+    with a single SELECT 1 round-trip (autocommit, so no transaction is left open).
+    """
+    for _ in range(2):
+        conn = pool.getconn()
+        if conn.closed or time.monotonic() - conn.last_used > POOL_RECYCLE_SECONDS:
+            pool.putconn(conn, close=True)
+            continue
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = False
+            return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logger.warning("db_pooled_connection_stale", error=str(e))
+            pool.putconn(conn, close=True)
+    # Replaced connection(s) are fresh from connect() — no ping needed
+    return pool.getconn()
+
+
+def _checkin(pool, conn, close: bool = False):
+    conn.last_used = time.monotonic()
+    pool.putconn(conn, close=close)
+
+
+def run_pooled(fn, *args, **kwargs):
+    """
+    Call fn(conn, *args) on a pooled connection and return its result.
+
+    Checkout recycles idle connections and pre-pings the rest. A connection
+    that still fails with OperationalError/InterfaceError is discarded from
+    the pool and the call is retried once on a fresh one.
+    """
+    pool = get_pool()
+    conn = _checkout(pool)
+    try:
+        try:
+            result = fn(conn, *args, **kwargs)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logger.warning("db_pooled_connection_lost_retrying", error=str(e))
+            _checkin(pool, conn, close=True)
+            conn = pool.getconn()
+            result = fn(conn, *args, **kwargs)
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        _checkin(pool, conn)
+        raise
+    _checkin(pool, conn)
+    return result
+
+
+def close_pool():
+    """Close every pooled connection (end of a batch run)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+class PersistentConnection:
+    """
+    One long-lived connection shared by a script's flush path.
+
+    run(fn, *args) calls fn(conn, *args) under a lock. If the server dropped
+    the connection (OperationalError/InterfaceError), it reconnects once and
+    retries, so callers pay the connect handshake only after a real drop.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = get_db_connection()
+        return self._conn
+
+    def _reset(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+        self._conn = None
+
+    def run(self, fn, *args, **kwargs):
+        with self._lock:
+            try:
+                return fn(self._connection(), *args, **kwargs)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                logger.warning("db_connection_lost_retrying", error=str(e))
+                self._reset()
+                return fn(self._connection(), *args, **kwargs)
+            except Exception:
+                # Leave the connection usable for the next call
+                if self._conn is not None and not self._conn.closed:
+                    self._conn.rollback()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+
+def _copy_text_value(value) -> str:
+    """Render one value as a COPY text-format field (None/NaN -> \\N)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, float) and value != value:
+        return "\\N"
+    text = str(value)
+    return (text.replace("\\", "\\\\").replace("\t", "\\t")
+                .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def copy_rows_to_temp(cur, table: str, columns: list[tuple[str, str]], rows) -> None:
+    """
+    Bulk-load rows into a temp table via COPY FROM STDIN.
+
+    Creates `table` with ON COMMIT DROP, so it only lives until the caller
+    commits. One COPY streams every row in a single wire message — no
+    per-row Parse/Bind/Execute like execute_batch.
+
+    columns: [(name, pg_type), ...]
+    rows: iterable of sequences in the same column order
+    """
+    col_defs = ", ".join(f"{name} {col_type}" for name, col_type in columns)
+    cur.execute(f"CREATE TEMP TABLE {table} ({col_defs}) ON COMMIT DROP")
+    copy_rows(cur, table, rows)
+
+
+def copy_rows(cur, table: str, rows) -> None:
+    """COPY rows into an existing table (e.g. to append further batches to a temp table)."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_text_value(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT text)", buf)
 
 
 def ensure_county(conn, name: str, state_code: str) -> str:
@@ -108,6 +304,49 @@ def write_signal(conn, parcel_uuid: str, signal_type_id: str,
         return result is not None
 
 
+_SIGNAL_COLUMNS = [
+    ("parcel_id", "UUID"),
+    ("signal_type_id", "UUID"),
+    ("signal_date", "DATE"),
+    ("confidence", "REAL"),
+    ("evidence", "JSONB"),
+]
+
+
+def batch_write_signals(conn, signals: list[tuple]) -> int:
+    """
+    Bulk version of write_signal for many (parcel, signal type) pairs.
+
+    signals: [(parcel_uuid, signal_type_id, signal_date, confidence, evidence), ...]
+    A pair listed twice keeps only its last entry, as sequential write_signal
+    calls would leave only the last one active.
+
+    COPYs the rows into a temp table, deactivates the matching active signals
+    with one UPDATE ... FROM, then inserts them with one INSERT ... SELECT.
+    Does not commit. Returns inserted row count.
+    """
+    if not signals:
+        return 0
+
+    latest = {(s[0], s[1]): s for s in signals}
+    with conn.cursor() as cur:
+        copy_rows_to_temp(cur, "tmp_parcel_signals", _SIGNAL_COLUMNS,
+                          ((p, t, d, c, json.dumps(e)) for p, t, d, c, e in latest.values()))
+        cur.execute("""
+            UPDATE parcel_signals s SET is_active = FALSE
+            FROM tmp_parcel_signals t
+            WHERE s.parcel_id = t.parcel_id AND s.signal_type_id = t.signal_type_id
+              AND s.is_active = TRUE
+        """)
+        cur.execute("""
+            INSERT INTO parcel_signals (parcel_id, signal_type_id, signal_date, confidence, evidence, is_active)
+            SELECT parcel_id, signal_type_id, signal_date, confidence, evidence, TRUE
+            FROM tmp_parcel_signals
+            ON CONFLICT DO NOTHING
+        """)
+        return cur.rowcount
+
+
 def backfill_coordinates_from_geometry(conn):
     """
     Auto-detect parcels missing lat/lng and backfill from parcels.geometry via PostGIS.
@@ -158,6 +397,65 @@ def backfill_coordinates_from_geometry(conn):
         return 0
 
 
+def migrate_add_geocode_index(conn):
+    """
+    Idempotent migration: partial index over parcels still missing coordinates.
+
+    Only un-geocoded rows are indexed, so it stays small as geocoding fills
+    the county in. It serves the keyset reads in geocode_parcels and the
+    `latitude IS NULL` join in batch_update_parcel_coords (that predicate
+    implies the index's OR), which would otherwise scan the county's rows.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_gpc_missing_coords
+            ON gis_parcels_core (county, state_code, parcel_id)
+            WHERE latitude IS NULL OR longitude IS NULL;
+        """)
+    conn.commit()
+    logger.info("migration_complete", table="gis_parcels_core", index="idx_gpc_missing_coords")
+
+
+_COORD_COLUMNS = [
+    ("parcel_id", "TEXT"),
+    ("latitude", "DOUBLE PRECISION"),
+    ("longitude", "DOUBLE PRECISION"),
+]
+
+
+def batch_update_parcel_coords(conn, county: str, state: str,
+                               coords: dict[str, tuple[float, float]]) -> int:
+    """
+    Bulk UPDATE geocoded lat/lng into gis_parcels_core for one county.
+
+    COPYs the batch into a temp table, then applies it with one
+    UPDATE ... FROM join and a single commit. Only fills rows where
+    latitude IS NULL. Returns updated row count. As in
+    batch_update_scan_results, the temp table is ANALYZEd before the join.
+    """
+    if not coords:
+        return 0
+
+    with conn.cursor() as cur:
+        copy_rows_to_temp(cur, "tmp_parcel_coords", _COORD_COLUMNS,
+                          ((pid, lat, lng) for pid, (lat, lng) in coords.items()))
+        cur.execute("ANALYZE tmp_parcel_coords")
+        cur.execute("""
+            UPDATE gis_parcels_core g
+            SET latitude = t.latitude, longitude = t.longitude
+            FROM tmp_parcel_coords t
+            WHERE g.county = %s AND g.state_code = %s
+              AND g.parcel_id = t.parcel_id
+              AND g.latitude IS NULL
+        """, (county, state))
+        updated = cur.rowcount
+    conn.commit()
+
+    logger.info("coords_batch_update_complete", county=county,
+                total_submitted=len(coords), updated=updated)
+    return updated
+
+
 def migrate_add_scan_columns(conn):
     """
     Idempotent migration: add scan result columns to gis_parcels_core.
@@ -211,10 +509,41 @@ def migrate_add_scan_columns(conn):
                 ON gis_parcels_core ({col});
             """)
 
+        # Keyset for iter_unscanned_parcels: each page is an index range scan
+        # on md5(parcel_id) instead of hashing and sorting every unscanned row
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_gpc_unscanned_md5
+            ON gis_parcels_core (county, md5(parcel_id))
+            WHERE scan_date IS NULL;
+        """)
+
     conn.commit()
     logger.info("migration_complete", table="gis_parcels_core", columns_added=len(columns))
 
 
+_SCAN_RESULT_COLUMNS = [
+    ("parcel_id", "TEXT"),
+    ("county", "TEXT"),
+    ("ndvi_score", "REAL"),
+    ("ndvi_date", "TEXT"),
+    ("ndvi_category", "TEXT"),
+    ("fema_zone", "TEXT"),
+    ("fema_risk", "TEXT"),
+    ("fema_sfha", "BOOLEAN"),
+    ("distress_score", "REAL"),
+    ("distress_flags", "TEXT"),
+    ("flag_veg", "BOOLEAN"),
+    ("flag_flood", "BOOLEAN"),
+    ("flag_structural", "BOOLEAN"),
+    ("flag_neglect", "BOOLEAN"),
+    ("veg_confidence", "REAL"),
+    ("flood_confidence", "REAL"),
+    ("scan_date", "TIMESTAMP"),
+    ("scan_pass", "SMALLINT"),
+    ("sentinel_worthy", "BOOLEAN"),
+]
+
+
 def batch_update_scan_results(conn, results: list[dict]) -> int:
     """
     Bulk UPDATE scan results into gis_parcels_core.
@@ -225,44 +554,32 @@ def batch_update_scan_results(conn, results: list[dict]) -> int:
         flag_veg, flag_flood, flag_structural, flag_neglect,
         veg_confidence, flood_confidence, scan_date, scan_pass, sentinel_worthy
 
-    Commits in 500-row chunks. Returns total updated count.
+    COPYs the batch into a temp table, then applies it with one
+    UPDATE ... FROM join and a single commit. Returns updated row count.
+    The temp table is ANALYZEd first so the join is planned against its
+    real size rather than the unanalyzed-table guess.
     """
     if not results:
         return 0
 
-    update_sql = """
-        UPDATE gis_parcels_core SET
-            ndvi_score = %(ndvi_score)s,
-            ndvi_date = %(ndvi_date)s,
-            ndvi_category = %(ndvi_category)s,
-            fema_zone = %(fema_zone)s,
-            fema_risk = %(fema_risk)s,
-            fema_sfha = %(fema_sfha)s,
-            distress_score = %(distress_score)s,
-            distress_flags = %(distress_flags)s,
-            flag_veg = %(flag_veg)s,
-            flag_flood = %(flag_flood)s,
-            flag_structural = %(flag_structural)s,
-            flag_neglect = %(flag_neglect)s,
-            veg_confidence = %(veg_confidence)s,
-            flood_confidence = %(flood_confidence)s,
-            scan_date = %(scan_date)s,
-            scan_pass = %(scan_pass)s,
-            sentinel_worthy = %(sentinel_worthy)s
-        WHERE parcel_id = %(parcel_id)s AND county = %(county)s
-    """
-
-    from psycopg2.extras import execute_batch
+    names = [name for name, _ in _SCAN_RESULT_COLUMNS]
+    set_clause = ",\n            ".join(f"{name} = t.{name}" for name in names[2:])
 
-    chunk_size = 500
-    for i in range(0, len(results), chunk_size):
-        chunk = results[i:i + chunk_size]
-        with conn.cursor() as cur:
-            execute_batch(cur, update_sql, chunk, page_size=100)
-        conn.commit()
+    with conn.cursor() as cur:
+        copy_rows_to_temp(cur, "tmp_scan_results", _SCAN_RESULT_COLUMNS,
+                          ([r[name] for name in names] for r in results))
+        cur.execute("ANALYZE tmp_scan_results")
+        cur.execute(f"""
+            UPDATE gis_parcels_core g SET
+            {set_clause}
+            FROM tmp_scan_results t
+            WHERE g.parcel_id = t.parcel_id AND g.county = t.county
+        """)
+        updated = cur.rowcount
+    conn.commit()
 
-    logger.info("batch_update_complete", total_submitted=len(results))
-    return len(results)
+    logger.info("batch_update_complete", total_submitted=len(results), updated=updated)
+    return updated
 
 
 def migrate_add_composite_columns(conn):
@@ -318,6 +635,48 @@ def migrate_add_composite_columns(conn):
                 columns_added=len(columns))
 
 
+def migrate_add_county_naip_year_view(conn):
+    """
+    Idempotent migration: create mv_county_max_naip_year, the per-county max
+    NAIP year in ndvi_history_years (plus parcel count) used by the freshness
+    check. Creating it scans gis_parcels_core once; afterwards readers hit
+    O(counties) rows and batch_historical_slope refreshes it on completion.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_county_max_naip_year AS
+            SELECT state_code, county,
+                   MAX(max_year) AS max_year,
+                   COUNT(*) AS parcels
+            FROM (
+                SELECT state_code, county,
+                       (SELECT MAX(y::int)
+                        FROM UNNEST(string_to_array(ndvi_history_years, ',')) AS y
+                        WHERE y ~ '^\\d{4}$') AS max_year
+                FROM gis_parcels_core
+                WHERE ndvi_slope_5yr IS NOT NULL
+                  AND ndvi_history_years IS NOT NULL
+            ) sub
+            WHERE max_year IS NOT NULL
+            GROUP BY state_code, county
+        """)
+        # Unique index lets REFRESH ... CONCURRENTLY run without blocking readers
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_county_max_naip_year
+            ON mv_county_max_naip_year (state_code, county);
+        """)
+    conn.commit()
+    logger.info("county_naip_year_view_ready", view="mv_county_max_naip_year")
+
+
+def refresh_county_naip_years(conn):
+    """Recompute mv_county_max_naip_year (call after slope results are written)."""
+    with conn.cursor() as cur:
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_county_max_naip_year")
+    conn.commit()
+    logger.info("county_naip_year_view_refreshed", view="mv_county_max_naip_year")
+
+
 def batch_update_slope_results(conn, results: list[dict]) -> int:
     """
     Bulk UPDATE NDVI slope + history into gis_parcels_core.
@@ -328,22 +687,29 @@ def batch_update_slope_results(conn, results: list[dict]) -> int:
     if not results:
         return 0
 
+    # One multi-row UPDATE ... FROM (VALUES ...) per page instead of one
+    # UPDATE per parcel. Casts keep all-NULL pages from typing as text.
     update_sql = """
-        UPDATE gis_parcels_core SET
-            ndvi_slope_5yr = %(ndvi_slope_5yr)s,
-            ndvi_history_count = %(ndvi_history_count)s,
-            ndvi_history_years = %(ndvi_history_years)s
-        WHERE parcel_id = %(parcel_id)s AND county = %(county)s
+        UPDATE gis_parcels_core g SET
+            ndvi_slope_5yr = v.ndvi_slope_5yr,
+            ndvi_history_count = v.ndvi_history_count,
+            ndvi_history_years = v.ndvi_history_years
+        FROM (VALUES %s) AS v(parcel_id, county, ndvi_slope_5yr,
+                              ndvi_history_count, ndvi_history_years)
+        WHERE g.parcel_id = v.parcel_id AND g.county = v.county
     """
 
-    from psycopg2.extras import execute_batch
+    from psycopg2.extras import execute_values
 
-    chunk_size = 500
-    for i in range(0, len(results), chunk_size):
-        chunk = results[i:i + chunk_size]
-        with conn.cursor() as cur:
-            execute_batch(cur, update_sql, chunk, page_size=100)
-        conn.commit()
+    with conn.cursor() as cur:
+        execute_values(
+            cur, update_sql,
+            [(r["parcel_id"], r["county"], r["ndvi_slope_5yr"],
+              r["ndvi_history_count"], r["ndvi_history_years"]) for r in results],
+            template="(%s, %s, %s::real, %s::smallint, %s::text)",
+            page_size=1000,
+        )
+    conn.commit()
 
     logger.info("slope_batch_update_complete", total_submitted=len(results))
     return len(results)
@@ -500,17 +866,22 @@ def batch_update_slope_safe(conn, results: list[dict]) -> int:
     if not results:
         return 0
 
-    update_sql = """
-        UPDATE gis_parcels_core SET
-            ndvi_slope_5yr = %(ndvi_slope_5yr)s,
-            ndvi_history_count = %(ndvi_history_count)s,
-            ndvi_history_years = %(ndvi_history_years)s
-        WHERE parcel_id = %(parcel_id)s AND county = %(county)s
-            AND %(ndvi_slope_5yr)s IS NOT NULL
-            AND %(ndvi_history_count)s >= COALESCE(ndvi_history_count, 0)
-    """
-
-    from psycopg2.extras import execute_batch
+    # Per-row rowcount is needed for the guard, so rows stay individual
+    # statements — but against a server-side prepared plan (parsed/planned
+    # once per connection) instead of re-sending and re-parsing the SQL.
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = 'slope_safe_update'")
+        if cur.fetchone() is None:
+            cur.execute("""
+                PREPARE slope_safe_update (text, text, real, smallint, text) AS
+                UPDATE gis_parcels_core SET
+                    ndvi_slope_5yr = $3,
+                    ndvi_history_count = $4,
+                    ndvi_history_years = $5
+                WHERE parcel_id = $1 AND county = $2
+                    AND $3 IS NOT NULL
+                    AND $4 >= COALESCE(ndvi_history_count, 0)
+            """)
 
     total_updated = 0
     chunk_size = 500
@@ -518,7 +889,10 @@ def batch_update_slope_safe(conn, results: list[dict]) -> int:
         chunk = results[i:i + chunk_size]
         with conn.cursor() as cur:
             for row in chunk:
-                cur.execute(update_sql, row)
+                cur.execute("EXECUTE slope_safe_update (%s, %s, %s, %s, %s)", (
+                    row["parcel_id"], row["county"], row["ndvi_slope_5yr"],
+                    row["ndvi_history_count"], row["ndvi_history_years"],
+                ))
                 total_updated += cur.rowcount
         conn.commit()
 
@@ -617,17 +991,10 @@ def set_planet_scan_date(conn, parcel_id: str, county: str):
     conn.commit()
 
 
-def get_unscanned_parcels(conn, county: str, state: str = None,
-                          limit: int = None,
-                          property_class: str = None) -> list[dict]:
-    """
-    Get parcels from gis_parcels_core that haven't been scanned yet.
-
-    Filters on scan_date IS NULL for resumability.
-    Returns list of dicts with parcel_id, latitude, longitude, county.
-    """
+def _unscanned_filter(county: str, state: str = None,
+                      property_class: str = None) -> tuple[str, list]:
+    """FROM/WHERE clause + params shared by the unscanned-parcel queries."""
     query = """
-        SELECT parcel_id, latitude, longitude, county, state_code
         FROM gis_parcels_core
         WHERE county = %s
             AND latitude IS NOT NULL AND longitude IS NOT NULL
@@ -643,6 +1010,21 @@ def get_unscanned_parcels(conn, county: str, state: str = None,
         query += " AND property_class = %s"
         params.append(property_class)
 
+    return query, params
+
+
+def get_unscanned_parcels(conn, county: str, state: str = None,
+                          limit: int = None,
+                          property_class: str = None) -> list[dict]:
+    """
+    Get parcels from gis_parcels_core that haven't been scanned yet.
+
+    Filters on scan_date IS NULL for resumability.
+    Returns list of dicts with parcel_id, latitude, longitude, county.
+    """
+    where, params = _unscanned_filter(county, state, property_class)
+    query = ("SELECT parcel_id, latitude::float8 AS latitude, longitude::float8 AS longitude,"
+             " county, state_code" + where)
     query += " ORDER BY md5(parcel_id)"
 
     if limit:
@@ -654,16 +1036,72 @@ def get_unscanned_parcels(conn, county: str, state: str = None,
         return [dict(row) for row in cur.fetchall()]
 
 
-def get_parcels_with_coords(conn, county_name: str, state_code: str = None,
-                            limit: int = None, offset: int = 0,
-                            mailing_zip: str = None,
-                            property_class: str = None,
-                            min_value: float = None, max_value: float = None,
-                            min_sqft: float = None, max_sqft: float = None) -> list[dict]:
-    """Get parcels with lat/lng from gis_parcels_core with optional filters."""
+def count_unscanned_parcels(conn, county: str, state: str = None,
+                            limit: int = None, property_class: str = None) -> int:
+    """COUNT(*) of the parcels iter_unscanned_parcels would yield (capped at limit)."""
+    where, params = _unscanned_filter(county, state, property_class)
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*)" + where, params)
+        total = cur.fetchone()[0]
+    conn.commit()
+    return min(total, limit) if limit else total
+
+
+def _unscanned_page(conn, county, state, property_class, after, page_size) -> list[dict]:
+    where, params = _unscanned_filter(county, state, property_class)
+    # float8 casts: rows arrive as Python floats, not Decimal
+    query = ("SELECT parcel_id, latitude::float8 AS latitude, longitude::float8 AS longitude,"
+             " county, state_code, md5(parcel_id) AS _key" + where)
+    if after is not None:
+        query += " AND md5(parcel_id) > %s"
+        params.append(after)
+    query += " ORDER BY md5(parcel_id) LIMIT %s"
+    params.append(page_size)
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        rows = [dict(row) for row in cur.fetchall()]
+    # End the read transaction so no lock is held between pages
+    conn.commit()
+    return rows
+
+
+def iter_unscanned_parcels(db: PersistentConnection, county: str, state: str = None,
+                           limit: int = None, property_class: str = None,
+                           page_size: int = 1000):
+    """
+    Stream unscanned parcels (same rows and order as get_unscanned_parcels)
+    in keyset pages of page_size, so only one page is in memory at a time.
+
+    Each page is its own short transaction on `db` rather than one named
+    cursor held open for the whole scan — a long-lived read transaction
+    would block ALTER TABLE from other processes/migrations. Pages walk
+    idx_gpc_unscanned_md5 (see migrate_add_scan_columns).
+    """
+    after = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = db.run(_unscanned_page, county, state, property_class, after, size)
+        if not page:
+            return
+        after = page[-1]["_key"]
+        for row in page:
+            del row["_key"]
+            yield row
+        if remaining is not None:
+            remaining -= len(page)
+        if len(page) < size:
+            return
+
+
+def _coords_filter(county_name: str, state_code: str = None,
+                   mailing_zip: str = None, property_class: str = None,
+                   min_value: float = None, max_value: float = None,
+                   min_sqft: float = None, max_sqft: float = None,
+                   resume_from: str = None) -> tuple[str, list]:
+    """FROM/WHERE clause + params shared by the parcels-with-coords queries."""
     query = """
-        SELECT parcel_id, latitude, longitude, owner_name, situs_address,
-               total_value, property_class, sqft, mailing_zip
         FROM gis_parcels_core
         WHERE county = %s AND latitude IS NOT NULL AND longitude IS NOT NULL
     """
@@ -697,7 +1135,29 @@ def get_parcels_with_coords(conn, county_name: str, state_code: str = None,
         query += " AND sqft <= %s"
         params.append(max_sqft)
 
-    query += " ORDER BY parcel_id"
+    if resume_from:
+        query += " AND parcel_id >= %s"
+        params.append(resume_from)
+
+    return query, params
+
+
+_COORDS_SELECT = """
+    SELECT parcel_id, latitude, longitude, owner_name, situs_address,
+           total_value, property_class, sqft, mailing_zip
+"""
+
+
+def get_parcels_with_coords(conn, county_name: str, state_code: str = None,
+                            limit: int = None, offset: int = 0,
+                            mailing_zip: str = None,
+                            property_class: str = None,
+                            min_value: float = None, max_value: float = None,
+                            min_sqft: float = None, max_sqft: float = None) -> list[dict]:
+    """Get parcels with lat/lng from gis_parcels_core with optional filters."""
+    where, params = _coords_filter(county_name, state_code, mailing_zip, property_class,
+                                   min_value, max_value, min_sqft, max_sqft)
+    query = _COORDS_SELECT + where + " ORDER BY parcel_id"
 
     if limit:
         query += " LIMIT %s OFFSET %s"
@@ -708,6 +1168,60 @@ def get_parcels_with_coords(conn, county_name: str, state_code: str = None,
         return [dict(row) for row in cur.fetchall()]
 
 
+def count_parcels_with_coords(conn, county_name: str, state_code: str = None,
+                              limit: int = None, **filters) -> int:
+    """COUNT(*) of the parcels iter_parcels_with_coords would yield (capped at limit)."""
+    where, params = _coords_filter(county_name, state_code, **filters)
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*)" + where, params)
+        total = cur.fetchone()[0]
+    conn.commit()
+    return min(total, limit) if limit else total
+
+
+def _coords_page(conn, county_name, state_code, filters, after, page_size) -> list[dict]:
+    where, params = _coords_filter(county_name, state_code, **filters)
+    query = _COORDS_SELECT + where
+    if after is not None:
+        query += " AND parcel_id > %s"
+        params.append(after)
+    query += " ORDER BY parcel_id LIMIT %s"
+    params.append(page_size)
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        rows = [dict(row) for row in cur.fetchall()]
+    # End the read transaction so no lock is held between pages
+    conn.commit()
+    return rows
+
+
+def iter_parcels_with_coords(db: PersistentConnection, county_name: str,
+                             state_code: str = None, limit: int = None,
+                             page_size: int = 1000, **filters):
+    """
+    Stream the rows get_parcels_with_coords would return, in parcel_id
+    keyset pages, so only one page is in memory at a time.
+
+    filters: the get_parcels_with_coords filters, plus resume_from
+    (start at this parcel_id, inclusive). Like iter_unscanned_parcels,
+    each page is its own short transaction on `db`.
+    """
+    after = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = db.run(_coords_page, county_name, state_code, filters, after, size)
+        if not page:
+            return
+        after = page[-1]["parcel_id"]
+        yield from page
+        if remaining is not None:
+            remaining -= len(page)
+        if len(page) < size:
+            return
+
+
 def migrate_add_sentinel_columns(conn):
     """
     Idempotent migration: add Sentinel enrichment columns to gis_parcels_core.
@@ -763,7 +1277,8 @@ def get_sentinel_worthy_parcels(conn, county: str, state: str = None,
     Returns parcel_id, lat, lng, county, plus existing NAIP/FEMA data for rescoring.
     """
     query = """
-        SELECT parcel_id, latitude, longitude, county, state_code,
+        SELECT parcel_id, latitude::float8 AS latitude, longitude::float8 AS longitude,
+               county, state_code,
                ndvi_score, fema_zone, fema_risk, fema_sfha, distress_score
         FROM gis_parcels_core
         WHERE county = %s
@@ -788,6 +1303,29 @@ def get_sentinel_worthy_parcels(conn, county: str, state: str = None,
         return [dict(row) for row in cur.fetchall()]
 
 
+_SENTINEL_RESULT_COLUMNS = [
+    ("parcel_id", "TEXT"),
+    ("county", "TEXT"),
+    ("sentinel_trend_direction", "TEXT"),
+    ("sentinel_trend_slope", "REAL"),
+    ("sentinel_latest_ndvi", "REAL"),
+    ("sentinel_months_data", "SMALLINT"),
+    ("sentinel_mean_ndvi", "REAL"),
+    ("sentinel_data_source", "TEXT"),
+    ("sentinel_chart_url", "TEXT"),
+    ("sentinel_scan_date", "TIMESTAMP"),
+    ("distress_score", "REAL"),
+    ("distress_flags", "TEXT"),
+    ("flag_veg", "BOOLEAN"),
+    ("flag_flood", "BOOLEAN"),
+    ("flag_structural", "BOOLEAN"),
+    ("flag_neglect", "BOOLEAN"),
+    ("veg_confidence", "REAL"),
+    ("flood_confidence", "REAL"),
+    ("scan_pass", "SMALLINT"),
+]
+
+
 def batch_update_sentinel_results(conn, results: list[dict]) -> int:
     """
     Bulk UPDATE Sentinel enrichment results + re-scored flags into gis_parcels_core.
@@ -795,44 +1333,31 @@ def batch_update_sentinel_results(conn, results: list[dict]) -> int:
     Uses monotonic scan_pass: GREATEST(COALESCE(scan_pass,0), new_pass)
     to avoid downgrading parcels that already have a higher pass level.
 
-    Commits in 500-row chunks. Returns total updated count.
+    COPYs the batch into a temp table, then applies it with one
+    UPDATE ... FROM join and a single commit. Returns updated row count.
     """
     if not results:
         return 0
 
-    update_sql = """
-        UPDATE gis_parcels_core SET
-            sentinel_trend_direction = %(sentinel_trend_direction)s,
-            sentinel_trend_slope = %(sentinel_trend_slope)s,
-            sentinel_latest_ndvi = %(sentinel_latest_ndvi)s,
-            sentinel_months_data = %(sentinel_months_data)s,
-            sentinel_mean_ndvi = %(sentinel_mean_ndvi)s,
-            sentinel_data_source = %(sentinel_data_source)s,
-            sentinel_chart_url = %(sentinel_chart_url)s,
-            sentinel_scan_date = %(sentinel_scan_date)s,
-            distress_score = %(distress_score)s,
-            distress_flags = %(distress_flags)s,
-            flag_veg = %(flag_veg)s,
-            flag_flood = %(flag_flood)s,
-            flag_structural = %(flag_structural)s,
-            flag_neglect = %(flag_neglect)s,
-            veg_confidence = %(veg_confidence)s,
-            flood_confidence = %(flood_confidence)s,
-            scan_pass = GREATEST(COALESCE(scan_pass, 0), %(scan_pass)s)
-        WHERE parcel_id = %(parcel_id)s AND county = %(county)s
-    """
-
-    from psycopg2.extras import execute_batch
+    names = [name for name, _ in _SENTINEL_RESULT_COLUMNS]
+    set_clause = ",\n            ".join(f"{name} = t.{name}" for name in names[2:-1])
 
-    chunk_size = 500
-    for i in range(0, len(results), chunk_size):
-        chunk = results[i:i + chunk_size]
-        with conn.cursor() as cur:
-            execute_batch(cur, update_sql, chunk, page_size=100)
-        conn.commit()
+    with conn.cursor() as cur:
+        copy_rows_to_temp(cur, "tmp_sentinel_results", _SENTINEL_RESULT_COLUMNS,
+                          ([r[name] for name in names] for r in results))
+        cur.execute(f"""
+            UPDATE gis_parcels_core g SET
+            {set_clause},
+            scan_pass = GREATEST(COALESCE(g.scan_pass, 0), t.scan_pass)
+            FROM tmp_sentinel_results t
+            WHERE g.parcel_id = t.parcel_id AND g.county = t.county
+        """)
+        updated = cur.rowcount
+    conn.commit()
 
-    logger.info("sentinel_batch_update_complete", total_submitted=len(results))
-    return len(results)
+    logger.info("sentinel_batch_update_complete", total_submitted=len(results),
+                updated=updated)
+    return updated
 
 
 def migrate_add_usps_columns(conn):
@@ -1115,6 +1640,25 @@ def get_parcels_needing_usps(conn, county: str, state: str = None,
 _USPS_TRANSIENT_ERRORS = {"rate_limited", "http_500", "http_502", "http_503", "http_504"}
 
 
+_USPS_RESULT_COLUMNS = [
+    ("parcel_id", "TEXT"),
+    ("county", "TEXT"),
+    ("outcome", "TEXT"),  # success | transient | permanent
+    ("usps_vacant", "BOOLEAN"),
+    ("usps_dpv_confirmed", "BOOLEAN"),
+    ("usps_address", "TEXT"),
+    ("usps_city", "TEXT"),
+    ("usps_zip", "TEXT"),
+    ("usps_zip4", "TEXT"),
+    ("usps_business", "BOOLEAN"),
+    ("usps_carrier_route", "TEXT"),
+    ("usps_address_mismatch", "BOOLEAN"),
+    ("usps_error", "TEXT"),
+    ("flag_vacancy", "BOOLEAN"),
+    ("vacancy_confidence", "REAL"),
+]
+
+
 def batch_update_usps_results(conn, results: list[dict]) -> int:
     """
     Batch-write USPS vacancy results to gis_parcels_core.
@@ -1123,74 +1667,84 @@ def batch_update_usps_results(conn, results: list[dict]) -> int:
     - Successful checks (no error): set usps_check_date = NOW()
     - Transient errors: do NOT set usps_check_date (eligible for retry)
     - Permanent errors: set usps_check_date with error populated
-    """
-    from psycopg2.extras import execute_batch
 
-    success_results = []
-    transient_results = []
-    permanent_results = []
+    COPYs the batch into a temp table tagged with each row's outcome, then
+    applies one UPDATE ... FROM per outcome and a single commit. Returns
+    updated row count.
+    """
+    if not results:
+        return 0
 
+    counts = {"success": 0, "transient": 0, "permanent": 0}
+    rows = []
     for r in results:
         err = r.get("usps_error")
         if not err:
-            success_results.append(r)
+            outcome = "success"
         elif err in _USPS_TRANSIENT_ERRORS:
-            transient_results.append(r)
+            outcome = "transient"
         else:
-            permanent_results.append(r)
+            outcome = "permanent"
+        counts[outcome] += 1
+        rows.append([r.get("parcel_id"), r.get("county"), outcome]
+                    + [r.get(name) for name, _ in _USPS_RESULT_COLUMNS[3:]])
 
     updated = 0
-
     with conn.cursor() as cur:
+        copy_rows_to_temp(cur, "tmp_usps_results", _USPS_RESULT_COLUMNS, rows)
+
         # Successful checks — set check_date
-        if success_results:
-            execute_batch(cur, """
-                UPDATE gis_parcels_core SET
-                    usps_vacant = %(usps_vacant)s,
-                    usps_dpv_confirmed = %(usps_dpv_confirmed)s,
-                    usps_address = %(usps_address)s,
-                    usps_city = %(usps_city)s,
-                    usps_zip = %(usps_zip)s,
-                    usps_zip4 = %(usps_zip4)s,
-                    usps_business = %(usps_business)s,
-                    usps_carrier_route = %(usps_carrier_route)s,
-                    usps_address_mismatch = %(usps_address_mismatch)s,
+        if counts["success"]:
+            cur.execute("""
+                UPDATE gis_parcels_core g SET
+                    usps_vacant = t.usps_vacant,
+                    usps_dpv_confirmed = t.usps_dpv_confirmed,
+                    usps_address = t.usps_address,
+                    usps_city = t.usps_city,
+                    usps_zip = t.usps_zip,
+                    usps_zip4 = t.usps_zip4,
+                    usps_business = t.usps_business,
+                    usps_carrier_route = t.usps_carrier_route,
+                    usps_address_mismatch = t.usps_address_mismatch,
                     usps_check_date = NOW(),
                     usps_error = NULL,
-                    flag_vacancy = %(flag_vacancy)s,
-                    vacancy_confidence = %(vacancy_confidence)s
-                WHERE parcel_id = %(parcel_id)s AND county = %(county)s
-            """, success_results, page_size=100)
-            updated += len(success_results)
+                    flag_vacancy = t.flag_vacancy,
+                    vacancy_confidence = t.vacancy_confidence
+                FROM tmp_usps_results t
+                WHERE t.outcome = 'success'
+                  AND g.parcel_id = t.parcel_id AND g.county = t.county
+            """)
+            updated += cur.rowcount
 
         # Transient errors — do NOT set check_date (retry next run)
-        if transient_results:
-            execute_batch(cur, """
-                UPDATE gis_parcels_core SET
-                    usps_error = %(usps_error)s,
+        if counts["transient"]:
+            cur.execute("""
+                UPDATE gis_parcels_core g SET
+                    usps_error = t.usps_error,
                     flag_vacancy = FALSE,
                     vacancy_confidence = NULL
-                WHERE parcel_id = %(parcel_id)s AND county = %(county)s
-            """, transient_results, page_size=100)
-            updated += len(transient_results)
+                FROM tmp_usps_results t
+                WHERE t.outcome = 'transient'
+                  AND g.parcel_id = t.parcel_id AND g.county = t.county
+            """)
+            updated += cur.rowcount
 
         # Permanent errors — set check_date to avoid re-hitting known bad addresses
-        if permanent_results:
-            execute_batch(cur, """
-                UPDATE gis_parcels_core SET
-                    usps_error = %(usps_error)s,
+        if counts["permanent"]:
+            cur.execute("""
+                UPDATE gis_parcels_core g SET
+                    usps_error = t.usps_error,
                     usps_check_date = NOW(),
                     flag_vacancy = FALSE,
                     vacancy_confidence = NULL
-                WHERE parcel_id = %(parcel_id)s AND county = %(county)s
-            """, permanent_results, page_size=100)
-            updated += len(permanent_results)
+                FROM tmp_usps_results t
+                WHERE t.outcome = 'permanent'
+                  AND g.parcel_id = t.parcel_id AND g.county = t.county
+            """)
+            updated += cur.rowcount
 
     conn.commit()
-    logger.info("usps_batch_update", total=len(results),
-                success=len(success_results),
-                transient=len(transient_results),
-                permanent=len(permanent_results))
+    logger.info("usps_batch_update", total=len(results), updated=updated, **counts)
     return updated
 
 
@@ -1234,8 +1788,137 @@ def migrate_add_conviction_columns(conn):
             CREATE INDEX IF NOT EXISTS idx_gpc_conviction_score
             ON gis_parcels_core (conviction_score DESC NULLS LAST);
         """)
+        # Serves the county-scoped UPDATE ... FROM joins on (county, parcel_id)
+        # used by the conviction flush and the other batch writers
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_gpc_county_parcel
+            ON gis_parcels_core (county, parcel_id);
+        """)
 
     conn.commit()
     if missing:
         logger.info("conviction_migration_complete", table="gis_parcels_core",
                     columns_added=len(missing))
+
+
+def compute_conviction_scores(conn, county: str, state: str, w_ds: float = 0.35,
+                              w_mc: float = 0.40, mc_cap: float = 7.0,
+                              vac_bonus_max: float = 2.5) -> int:
+    """
+    Compute conviction scores for a county entirely in SQL (no fetch/write-back).
+
+    Same contract as scripts/batch_conviction_score.compute_conviction:
+      - ds_component = clamp(distress_composite / 10, 0, 1), NULL if missing
+      - mc_component = clamp(mc_raw / mc_cap, 0, 1), NULL if no active signals
+      - vacancy bonus = vac_bonus_max × clamp(vacancy_confidence or 0.8, 0, 1)
+        when flag_vacancy and usps_error is empty
+      - base = reweighted average of present components; NULL if neither
+
+    Returns count of updated parcels.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            WITH mc AS (
+                SELECT
+                    g.parcel_id,
+                    COALESCE(SUM(st.base_weight * LEAST(GREATEST(ps.confidence, 0), 1)), 0) AS mc_raw,
+                    COUNT(ps.id) AS mc_count,
+                    STRING_AGG(DISTINCT st.code, ',' ORDER BY st.code) AS mc_codes
+                FROM gis_parcels_core g
+                JOIN counties c
+                    ON lower(c.name) = lower(g.county)
+                    AND c.state_code = g.state_code
+                LEFT JOIN parcels p
+                    ON p.county_id = c.id
+                    AND p.parcel_id = g.parcel_id
+                LEFT JOIN parcel_signals ps
+                    ON ps.parcel_id = p.id
+                    AND ps.is_active = true
+                    AND (ps.expires_at IS NULL OR ps.expires_at > NOW())
+                LEFT JOIN signal_types st
+                    ON st.id = ps.signal_type_id
+                    AND st.is_active = true
+                WHERE g.county = %(county)s AND g.state_code = %(state)s
+                GROUP BY g.parcel_id
+            ),
+            comp AS (
+                SELECT
+                    mc.*,
+                    -- GREATEST/LEAST skip NULLs, so missing inputs need explicit CASEs
+                    CASE WHEN g.distress_composite IS NOT NULL
+                         THEN LEAST(GREATEST(g.distress_composite / 10.0, 0), 1) END AS ds_comp,
+                    CASE WHEN mc.mc_count > 0
+                         THEN LEAST(GREATEST(mc.mc_raw / %(mc_cap)s, 0), 1) END AS mc_comp,
+                    CASE WHEN g.flag_vacancy AND COALESCE(g.usps_error, '') = ''
+                         THEN %(vac_max)s * LEAST(GREATEST(
+                             COALESCE(NULLIF(g.vacancy_confidence, 0), 0.8), 0), 1)
+                         ELSE 0 END AS vac_bonus
+                FROM mc
+                JOIN gis_parcels_core g
+                    ON g.parcel_id = mc.parcel_id
+                    AND g.county = %(county)s AND g.state_code = %(state)s
+            ),
+            scored AS (
+                SELECT
+                    comp.*,
+                    10 * (%(w_ds)s * COALESCE(ds_comp, 0) + %(w_mc)s * COALESCE(mc_comp, 0))
+                        / NULLIF(CASE WHEN ds_comp IS NULL THEN 0 ELSE %(w_ds)s END
+                                 + CASE WHEN mc_comp IS NULL THEN 0 ELSE %(w_mc)s END, 0) AS base
+                FROM comp
+            )
+            UPDATE gis_parcels_core g SET
+                conviction_score = CASE WHEN s.base IS NOT NULL
+                    THEN ROUND(CAST(LEAST(GREATEST(s.base + s.vac_bonus, 0), 10) AS NUMERIC), 2) END,
+                conviction_base_score = ROUND(CAST(s.base AS NUMERIC), 2),
+                conviction_vacancy_bonus = ROUND(CAST(s.vac_bonus AS NUMERIC), 2),
+                conviction_mc_score = CASE WHEN s.mc_count > 0 AND s.mc_raw <> 0 THEN s.mc_raw END,
+                conviction_mc_signals = NULLIF(s.mc_count, 0),
+                conviction_mc_codes = s.mc_codes,
+                conviction_components = CASE WHEN s.base IS NOT NULL THEN NULLIF(CONCAT_WS(',',
+                    CASE WHEN s.ds_comp IS NOT NULL THEN 'DS' END,
+                    CASE WHEN s.mc_comp IS NOT NULL THEN 'MC' END,
+                    CASE WHEN s.vac_bonus > 0 THEN 'VAC' END), '') END,
+                conviction_date = NOW()
+            FROM scored s
+            WHERE g.parcel_id = s.parcel_id
+              AND g.county = %(county)s AND g.state_code = %(state)s
+        """, {"county": county, "state": state, "w_ds": w_ds, "w_mc": w_mc,
+              "mc_cap": mc_cap, "vac_max": vac_bonus_max})
+        updated = cur.rowcount
+
+    conn.commit()
+    logger.info("conviction_scores_computed", county=county, state=state, updated=updated)
+    return updated
+
+
+def get_conviction_summary(conn, county: str, state: str) -> dict:
+    """
+    Coverage, score stats and component distribution for a county's stored
+    conviction scores. Used for the batch summary when scoring runs in SQL.
+    """
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT
+                COUNT(*) AS parcels,
+                COUNT(distress_composite) AS ds_parcels,
+                COUNT(conviction_mc_signals) AS mc_parcels,
+                COUNT(*) FILTER (WHERE flag_vacancy) AS vac_parcels,
+                COUNT(conviction_score) AS scored,
+                COALESCE(AVG(conviction_score), 0) AS avg_score,
+                COALESCE(MIN(conviction_score), 0) AS min_score,
+                COALESCE(MAX(conviction_score), 0) AS max_score
+            FROM gis_parcels_core
+            WHERE county = %s AND state_code = %s
+        """, (county, state))
+        summary = dict(cur.fetchone())
+
+        cur.execute("""
+            SELECT COALESCE(conviction_components, 'NULL') AS components, COUNT(*) AS n
+            FROM gis_parcels_core
+            WHERE county = %s AND state_code = %s
+            GROUP BY 1
+            ORDER BY 2 DESC
+        """, (county, state))
+        summary["components"] = {row["components"]: row["n"] for row in cur.fetchall()}
+
+    return summary
@@ -33,6 +33,7 @@ MODERATE_RISK_ZONES = {"B"}  # Zone B or X (shaded) = 0.2% annual chance
 
 CACHE_DIR = Path("data/cache/fema")
 CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days (flood zones change rarely)
+HTTP_POOL_MAXSIZE = 32  # keep-alive connections per host (batch scans run up to ~20 workers)
 
 
 class FEMAClient:
@@ -46,7 +47,8 @@ class FEMAClient:
     def _build_session(self) -> requests.Session:
         session = requests.Session()
         retry = Retry(total=3, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504])
-        adapter = HTTPAdapter(max_retries=retry)
+        # Shared across batch worker threads — keep one warm connection per worker
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
         session.mount("https://", adapter)
         session.mount("http://", adapter)
         return session
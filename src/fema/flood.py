@@ -6,6 +6,8 @@ flood risk assessment at a point.
 """
 
 import math
+import threading
+from collections import OrderedDict
 
 import structlog
 
@@ -15,6 +17,45 @@ from src.storage import upload_bytes, make_point_key
 logger = structlog.get_logger("fema.flood")
 
 
+# Module-level shared client so batch scans reuse one keep-alive session
+# (requests.Session is thread-safe for GETs)
+_shared_client = None
+
+
+def _get_shared_client() -> FEMAClient:
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = FEMAClient()
+    return _shared_client
+
+
+# In-memory zone lookup cache on a rounded-coordinate grid. NFHL flood zones
+# are polygons spanning many neighbouring parcels, so a batch scan of a
+# subdivision resolves most points from here instead of the API.
+ZONE_CACHE_PRECISION = 3  # decimal places (~110 m grid)
+ZONE_CACHE_MAX = 50_000
+_zone_cache: OrderedDict = OrderedDict()
+_zone_cache_lock = threading.Lock()
+
+
+def _query_flood_zone_cached(client: FEMAClient, lat: float, lng: float) -> dict:
+    """client.query_flood_zone memoized (LRU) by rounded lat/lng. Errors are not cached."""
+    key = (round(lat, ZONE_CACHE_PRECISION), round(lng, ZONE_CACHE_PRECISION))
+    with _zone_cache_lock:
+        zone_data = _zone_cache.get(key)
+        if zone_data is not None:
+            _zone_cache.move_to_end(key)
+            return zone_data
+
+    zone_data = client.query_flood_zone(lat, lng)
+    if not zone_data.get("error"):
+        with _zone_cache_lock:
+            _zone_cache[key] = zone_data
+            if len(_zone_cache) > ZONE_CACHE_MAX:
+                _zone_cache.popitem(last=False)
+    return zone_data
+
+
 def _make_bbox(lat: float, lng: float, buffer_meters: float = 200.0):
     """Create bbox for flood map tile (larger than NDVI — shows surrounding area)."""
     lat_offset = buffer_meters / 111_000
@@ -42,7 +83,7 @@ def fema_flood(lat: float, lng: float, skip_map: bool = False) -> dict:
             "errors": [],
         }
     """
-    client = FEMAClient()
+    client = _get_shared_client()
 
     result = {
         "lat": lat,
@@ -59,8 +100,8 @@ def fema_flood(lat: float, lng: float, skip_map: bool = False) -> dict:
         "errors": [],
     }
 
-    # Query flood zone
-    zone_data = client.query_flood_zone(lat, lng)
+    # Query flood zone (memoized on the rounded grid)
+    zone_data = _query_flood_zone_cached(client, lat, lng)
 
     if zone_data.get("error"):
         result["errors"].append(zone_data["error"])
@@ -0,0 +1,93 @@
+"""
+Background retry for failed DB flushes in batch scripts.
+
+A flush that fails (e.g. Railway dropped the connection) is handed to a
+RetryBuffer instead of being pushed back onto the live results buffer, so
+producers never wait on a failing database and later flushes don't grow.
+A single daemon thread retries queued batches oldest-first with
+exponential backoff (2, 4, 8 ... capped at max_backoff seconds).
+
+Usage:
+    retry = RetryBuffer(write_fn)   # write_fn(batch) raises on failure
+    retry.push(batch)               # after a failed flush
+    lost = retry.close()            # at shutdown: final attempt, rows unwritten
+"""
+
+import threading
+from collections import deque
+
+import structlog
+
+logger = structlog.get_logger("flush_retry")
+
+
+class RetryBuffer:
+    """FIFO of failed batches drained by one backoff-retry thread."""
+
+    def __init__(self, write_fn, max_backoff: float = 60.0, name: str = "flush-retry"):
+        self._write = write_fn
+        self.max_backoff = max_backoff
+        self._name = name
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+
+    def push(self, batch: list) -> None:
+        """Queue a failed batch for retry; returns immediately."""
+        with self._cond:
+            self._pending.append(batch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self._name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _loop(self):
+        attempt = 0
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if self._closing:
+                    return
+                batch = self._pending[0]
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                attempt += 1
+                delay = min(2 ** attempt, self.max_backoff)
+                logger.warning("flush_retry_failed", batch_size=len(batch),
+                               attempt=attempt, retry_in=delay, error=str(e))
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closing, timeout=delay)
+                continue
+
+            attempt = 0
+            with self._cond:
+                self._pending.popleft()
+            logger.info("flush_retry_ok", batch_size=len(batch))
+
+    def close(self) -> int:
+        """
+        Stop the retry thread and make one last synchronous attempt per
+        queued batch. Returns the number of rows that still could not be written.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+        lost = 0
+        while self._pending:
+            batch = self._pending.popleft()
+            try:
+                self._write(batch)
+            except Exception as e:
+                lost += len(batch)
+                logger.error("flush_retry_gave_up", batch_size=len(batch), error=str(e))
+        return lost
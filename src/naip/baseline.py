@@ -16,6 +16,7 @@ import math
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import structlog
 
 from src.naip.client import NAIPClient
@@ -155,6 +156,18 @@ def naip_ndvi_historical(lat: float, lng: float,
     return get_historical_ndvi(lat, lng, years=years)
 
 
+def naip_ndvi_historical_batch(points: list[tuple[float, float]],
+                               years: list[int] = None) -> list[list[dict]]:
+    """
+    naip_ndvi_historical for a group of nearby (lat, lng) points. Batch-safe.
+
+    Points should share a NAIP tile: one STAC search and one open per COG
+    serve the whole group. Returns one history list per point, in order.
+    """
+    from src.naip.planetary import get_historical_ndvi_batch
+    return get_historical_ndvi_batch(points, years=years)
+
+
 def compute_ndvi_slope(points: list[tuple[float, float]]) -> float | None:
     """
     Compute NDVI slope (change per year) via least-squares linear regression.
@@ -184,6 +197,37 @@ def compute_ndvi_slope(points: list[tuple[float, float]]) -> float | None:
     return round(slope, 6)
 
 
+def compute_ndvi_slopes(years: np.ndarray, ndvi: np.ndarray) -> list[float | None]:
+    """
+    Vectorized compute_ndvi_slope for many parcels at once.
+
+    Args:
+        years: (N, K) array of years, NaN where a parcel has fewer than K points
+        ndvi:  (N, K) array of NDVI values aligned with `years` (NaN = missing)
+
+    Returns:
+        list of N slopes with the same rules as compute_ndvi_slope
+        (None if < 2 points, 0.0 on a degenerate x range, else rounded to 6dp).
+    """
+    valid = ~(np.isnan(years) | np.isnan(ndvi))
+    n = valid.sum(axis=1)
+    x = np.where(valid, years, 0.0)
+    y = np.where(valid, ndvi, 0.0)
+
+    # Centered least squares: slope = sum((x-xm)(y-ym)) / sum((x-xm)^2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xm = x.sum(axis=1, keepdims=True) / n[:, None]
+        ym = y.sum(axis=1, keepdims=True) / n[:, None]
+        dx = np.where(valid, x - xm, 0.0)
+        dy = np.where(valid, y - ym, 0.0)
+        num = (dx * dy).sum(axis=1)
+        den = (dx * dx).sum(axis=1)
+        slopes = np.where(den == 0, 0.0, num / den)
+
+    return [None if count < 2 else round(float(slope), 6)
+            for count, slope in zip(n, slopes)]
+
+
 def naip_baseline(lat: float, lng: float, skip_historical: bool = False,
                   skip_image_export: bool = False) -> dict:
     """
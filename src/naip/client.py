@@ -31,6 +31,7 @@ NAIP_BASE_URL = "https://imagery.nationalmap.gov/arcgis/rest/services/USGSNAIPPl
 
 CACHE_DIR = Path("data/cache/naip")
 CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # 7 days
+HTTP_POOL_MAXSIZE = 32  # keep-alive connections per host (batch scans run up to ~20 workers)
 
 # Years to check for historical NAIP coverage (recent cycles)
 NAIP_YEARS_TO_CHECK = [2023, 2022, 2021, 2020, 2019, 2018, 2016, 2014, 2012]
@@ -53,7 +54,8 @@ class NAIPClient:
             backoff_factor=1.0,
             status_forcelist=[429, 500, 502, 503, 504],
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        # Shared across batch worker threads — keep one warm connection per worker
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
         session.mount("https://", adapter)
         session.mount("http://", adapter)
         return session
@@ -9,7 +9,8 @@ NAIP archive on Planetary Computer: 2010-2023, all states, free, no auth.
 COGs hosted on Azure Blob Storage, read via HTTP range requests (rasterio).
 
 Each COG read is ~2 seconds (connection setup + range request).
-For batch: 10 workers × 6 years = ~1.2 parcels/sec throughput.
+The per-year reads for one point run concurrently on a shared bounded
+pool, so a parcel costs ~1 read of latency instead of ~6.
 Results cached 7 days to avoid redundant reads.
 """
 
@@ -17,6 +18,7 @@ import hashlib
 import json
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
@@ -54,6 +56,12 @@ def _stac_session() -> requests.Session:
 
 _session = _stac_session()
 
+# Shared pool for per-year COG reads. Rasterio/GDAL reads block and release
+# the GIL, so threads (not asyncio) are what overlaps the range requests.
+# Bounded so N batch workers x K years can't open unbounded connections.
+COG_READ_WORKERS = 24
+_cog_pool = ThreadPoolExecutor(max_workers=COG_READ_WORKERS, thread_name_prefix="naip-cog")
+
 # Thread-safe transformer cache (CRS string → Transformer)
 _transformer_cache = {}
 _transformer_lock = threading.Lock()
@@ -155,6 +163,116 @@ def search_naip_items(lat: float, lng: float, years: list[int] = None) -> list[d
     return items
 
 
+def _point_in_geometry(geometry: dict, lng: float, lat: float) -> bool:
+    """Ray-casting point-in-polygon test against a GeoJSON (Multi)Polygon's outer rings."""
+    if not geometry:
+        return False
+    if geometry.get("type") == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry.get("type") == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return False
+    for rings in polygons:
+        ring = rings[0]
+        inside = False
+        j = len(ring) - 1
+        for i in range(len(ring)):
+            xi, yi = ring[i][0], ring[i][1]
+            xj, yj = ring[j][0], ring[j][1]
+            if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+        if inside:
+            return True
+    return False
+
+
+def search_naip_items_bbox(bbox: tuple[float, float, float, float]) -> list[dict]:
+    """
+    Search Planetary Computer STAC for all NAIP items intersecting a bbox.
+
+    One search serves every parcel in a tile group; callers pick items per
+    point with _point_in_geometry. Returns [{year, date, cog_url, geometry}]
+    sorted by datetime desc. Results cached 7 days.
+    """
+    bbox = tuple(round(v, 5) for v in bbox)
+    cache_key = _cache_key("stac_search_bbox", {"bbox": bbox})
+    cached = _get_cached(cache_key)
+    if cached:
+        return cached
+
+    payload = {
+        "collections": ["naip"],
+        "bbox": list(bbox),
+        "limit": 250,
+        "sortby": [{"field": "datetime", "direction": "desc"}],
+    }
+
+    features = []
+    try:
+        resp = _session.post(STAC_SEARCH_URL, json=payload, timeout=30)
+        resp.raise_for_status()
+        page = resp.json()
+        features.extend(page.get("features", []))
+        # Follow pagination (POST body carried on the next link)
+        for _ in range(10):
+            nxt = next((l for l in page.get("links", []) if l.get("rel") == "next"), None)
+            if not nxt:
+                break
+            resp = _session.post(nxt["href"], json=nxt.get("body", payload), timeout=30)
+            resp.raise_for_status()
+            page = resp.json()
+            features.extend(page.get("features", []))
+    except Exception as e:
+        logger.error("stac_bbox_search_failed", bbox=bbox, error=str(e))
+        return []
+
+    items = []
+    for feat in features:
+        props = feat.get("properties", {})
+        year_raw = props.get("naip:year")
+        cog_url = feat.get("assets", {}).get("image", {}).get("href")
+        if year_raw and cog_url:
+            items.append({
+                "year": int(year_raw) if isinstance(year_raw, str) else year_raw,
+                "date": props.get("datetime", "")[:10],
+                "cog_url": cog_url,
+                "geometry": feat.get("geometry"),
+            })
+
+    _set_cache(cache_key, items)
+    logger.info("stac_bbox_search_ok", bbox=bbox, items=len(items))
+    return items
+
+
+def _items_for_points(points: list[tuple[float, float]], years: list[int] = None) -> list[list[dict]]:
+    """Per-point NAIP items (first item per year, datetime desc) from one bbox search."""
+    if len(points) == 1:
+        lat, lng = points[0]
+        return [search_naip_items(lat, lng, years=years)]
+
+    lats = [p[0] for p in points]
+    lngs = [p[1] for p in points]
+    candidates = search_naip_items_bbox((min(lngs), min(lats), max(lngs), max(lats)))
+
+    per_point = []
+    for lat, lng in points:
+        seen_years = set()
+        items = []
+        for item in candidates:
+            year = item["year"]
+            # Same dedup rule as search_naip_items: first (most recent) item per year
+            if year in seen_years or not _point_in_geometry(item["geometry"], lng, lat):
+                continue
+            seen_years.add(year)
+            if years and year not in years:
+                continue
+            items.append(item)
+        per_point.append(items)
+    return per_point
+
+
 def discover_all_available_years(state_code: str, probe_point: tuple = None,
                                   force_refresh: bool = False) -> list[int]:
     """STAC search at a representative point → sorted list of all available NAIP years.
@@ -194,50 +312,74 @@ def read_ndvi_from_cog(lat: float, lng: float, cog_url: str,
 
     Returns {"ndvi": float|None, "red": float, "nir": float, "error": str|None}
     """
+    return read_ndvi_points_from_cog([(lat, lng)], cog_url, window_size)[0]
+
+
+def _ndvi_window(src, transformer, lat: float, lng: float, half: int) -> dict:
+    """NDVI over a (2*half+1)^2 window around one point of an open COG."""
     import numpy as np
 
-    half = window_size // 2
-    try:
-        with rasterio.open(cog_url) as src:
-            transformer = _get_transformer(src.crs)
-            x, y = transformer.transform(lng, lat)
-            row, col = src.index(x, y)
+    x, y = transformer.transform(lng, lat)
+    row, col = src.index(x, y)
 
-            # Clamp window to image bounds
-            r_start = max(0, row - half)
-            c_start = max(0, col - half)
-            r_end = min(src.height, row + half + 1)
-            c_end = min(src.width, col + half + 1)
+    # Clamp window to image bounds
+    r_start = max(0, row - half)
+    c_start = max(0, col - half)
+    r_end = min(src.height, row + half + 1)
+    c_end = min(src.width, col + half + 1)
 
-            if r_start >= r_end or c_start >= c_end:
-                return {"ndvi": None, "red": None, "nir": None,
-                        "error": "pixel_out_of_bounds"}
+    if r_start >= r_end or c_start >= c_end:
+        return {"ndvi": None, "red": None, "nir": None,
+                "error": "pixel_out_of_bounds"}
 
-            window = Window(c_start, r_start, c_end - c_start, r_end - r_start)
-            bands = src.read(window=window)
+    window = Window(c_start, r_start, c_end - c_start, r_end - r_start)
+    bands = src.read(window=window)
 
-            if bands.shape[0] < 4:
-                return {"ndvi": None, "red": None, "nir": None,
-                        "error": f"insufficient_bands: {bands.shape[0]}"}
+    if bands.shape[0] < 4:
+        return {"ndvi": None, "red": None, "nir": None,
+                "error": f"insufficient_bands: {bands.shape[0]}"}
 
-            red = bands[0].astype(np.float64)
-            nir = bands[3].astype(np.float64)
-            denom = nir + red
-            # Compute per-pixel NDVI, then average (avoids division artifacts)
-            valid = denom > 0
-            if not valid.any():
-                return {"ndvi": 0.0, "red": float(red.mean()), "nir": float(nir.mean()),
-                        "error": None}
+    red = bands[0].astype(np.float64)
+    nir = bands[3].astype(np.float64)
+    denom = nir + red
+    # Compute per-pixel NDVI, then average (avoids division artifacts)
+    valid = denom > 0
+    if not valid.any():
+        return {"ndvi": 0.0, "red": float(red.mean()), "nir": float(nir.mean()),
+                "error": None}
 
-            ndvi_pixels = np.where(valid, (nir - red) / denom, 0.0)
-            ndvi = float(ndvi_pixels[valid].mean())
+    ndvi_pixels = np.where(valid, (nir - red) / denom, 0.0)
+    ndvi = float(ndvi_pixels[valid].mean())
 
-            return {"ndvi": round(ndvi, 4), "red": float(red.mean()),
-                    "nir": float(nir.mean()), "error": None}
+    return {"ndvi": round(ndvi, 4), "red": float(red.mean()),
+            "nir": float(nir.mean()), "error": None}
+
+
+def read_ndvi_points_from_cog(points: list[tuple[float, float]], cog_url: str,
+                              window_size: int = 3) -> list[dict]:
+    """
+    Read NDVI at many (lat, lng) points from one NAIP COG.
+
+    Opens the COG once (one connection + header fetch) and reads a small
+    window per point, so parcels sharing a quarter-quad share the setup
+    cost. Returns one read_ndvi_from_cog-shaped dict per point, in order.
+    """
+    half = window_size // 2
+    try:
+        with rasterio.open(cog_url) as src:
+            transformer = _get_transformer(src.crs)
+            results = []
+            for lat, lng in points:
+                try:
+                    results.append(_ndvi_window(src, transformer, lat, lng, half))
+                except Exception as e:
+                    logger.warning("cog_read_failed", cog_url=cog_url[-60:], error=str(e))
+                    results.append({"ndvi": None, "red": None, "nir": None, "error": str(e)})
+            return results
 
     except Exception as e:
         logger.warning("cog_read_failed", cog_url=cog_url[-60:], error=str(e))
-        return {"ndvi": None, "red": None, "nir": None, "error": str(e)}
+        return [{"ndvi": None, "red": None, "nir": None, "error": str(e)} for _ in points]
 
 
 def get_historical_ndvi(lat: float, lng: float,
@@ -258,38 +400,92 @@ def get_historical_ndvi(lat: float, lng: float,
     if not items:
         return []
 
-    results = []
+    # Per-year cache check first; only misses go to the COG pool
+    slots = []
+    to_read = []
     for item in items:
-        year = item["year"]
-        cog_url = item["cog_url"]
-        date = item["date"]
-
-        # Check per-year cache
-        ck = _cache_key("ndvi_pc", {"lat": lat, "lng": lng, "year": year})
+        ck = _cache_key("ndvi_pc", {"lat": lat, "lng": lng, "year": item["year"]})
         cached = _get_cached(ck)
         if cached and cached.get("ndvi") is not None:
-            results.append(cached)
+            slots.append(cached)
             continue
+        slots.append(None)
+        to_read.append((len(slots) - 1, item, ck))
+
+    # Read all uncached years concurrently
+    futures = [(idx, item, ck, _cog_pool.submit(read_ndvi_from_cog, lat, lng, item["cog_url"]))
+               for idx, item, ck in to_read]
+
+    for idx, item, ck, future in futures:
+        slots[idx] = _record_pixel(ck, item, future.result(), lat, lng)
+
+    return [entry for entry in slots if entry is not None]
+
+
+def _record_pixel(ck: str, item: dict, pixel: dict, lat: float, lng: float) -> dict | None:
+    """Cache one per-year COG read; returns the history entry, or None on a miss."""
+    year = item["year"]
+    date = item["date"]
+
+    if pixel["ndvi"] is not None:
+        entry = {
+            "year": year,
+            "ndvi": pixel["ndvi"],
+            "date": date,
+        }
+        _set_cache(ck, entry)
+        logger.debug("pc_ndvi_read", year=year, ndvi=pixel["ndvi"],
+                     lat=lat, lng=lng)
+        return entry
+
+    # Cache the miss too to avoid re-reading a bad pixel
+    miss = {"year": year, "ndvi": None, "date": date,
+            "error": pixel.get("error")}
+    _set_cache(ck, miss)
+    logger.debug("pc_ndvi_miss", year=year, error=pixel.get("error"),
+                 lat=lat, lng=lng)
+    return None
+
+
+def get_historical_ndvi_batch(points: list[tuple[float, float]],
+                              years: list[int] = None) -> list[list[dict]]:
+    """
+    get_historical_ndvi for many nearby points at once.
+
+    Intended for parcels grouped by NAIP tile: one STAC bbox search covers
+    the group, and each (year, COG) is opened once and read at every point
+    that falls in it. Per-point results and caching match get_historical_ndvi.
+
+    Returns one history list per input point, in input order.
+    """
+    if not points:
+        return []
+
+    items_per_point = _items_for_points(points, years)
+
+    slots = []
+    reads = {}  # cog_url -> [(point_idx, slot_idx, item, cache_key)]
+    for pi, items in enumerate(items_per_point):
+        lat, lng = points[pi]
+        point_slots = []
+        for item in items:
+            ck = _cache_key("ndvi_pc", {"lat": lat, "lng": lng, "year": item["year"]})
+            cached = _get_cached(ck)
+            if cached and cached.get("ndvi") is not None:
+                point_slots.append(cached)
+                continue
+            point_slots.append(None)
+            reads.setdefault(item["cog_url"], []).append((pi, len(point_slots) - 1, item, ck))
+        slots.append(point_slots)
+
+    # One task per COG, each reading every point that needs it
+    futures = [(targets, _cog_pool.submit(read_ndvi_points_from_cog,
+                                          [points[pi] for pi, _, _, _ in targets], cog_url))
+               for cog_url, targets in reads.items()]
+
+    for targets, future in futures:
+        for (pi, si, item, ck), pixel in zip(targets, future.result()):
+            lat, lng = points[pi]
+            slots[pi][si] = _record_pixel(ck, item, pixel, lat, lng)
 
-        # Read from COG
-        pixel = read_ndvi_from_cog(lat, lng, cog_url)
-
-        if pixel["ndvi"] is not None:
-            entry = {
-                "year": year,
-                "ndvi": pixel["ndvi"],
-                "date": date,
-            }
-            _set_cache(ck, entry)
-            results.append(entry)
-            logger.debug("pc_ndvi_read", year=year, ndvi=pixel["ndvi"],
-                         lat=lat, lng=lng)
-        else:
-            # Cache the miss too to avoid re-reading a bad pixel
-            miss = {"year": year, "ndvi": None, "date": date,
-                    "error": pixel.get("error")}
-            _set_cache(ck, miss)
-            logger.debug("pc_ndvi_miss", year=year, error=pixel.get("error"),
-                         lat=lat, lng=lng)
-
-    return results
+    return [[entry for entry in point_slots if entry is not None] for point_slots in slots]
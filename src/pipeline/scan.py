@@ -0,0 +1,303 @@
+"""
+Sample-scan pipeline shared by scripts/diverse_test_scan.py and
+scripts/full_50_pipeline.py.
+
+Pass 1 streams a stratified Gaston County sample (SAMPLE_SQL), scans each
+parcel with NAIP + FEMA and writes results to gis_parcels_core as they
+complete. Pass 2 runs Planet refinement on the flagged ones. Reporting
+stays in the scripts.
+
+Usage:
+    parcels, results, updated, elapsed = run_pass1(conn)
+    summary = summarize_pass1(results)
+    for r, planet in refine_flagged(summary["flagged"], limit=10):
+        ...
+"""
+
+import os
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache, partial
+
+from src.analysis.flags import generate_all_flags
+from src.db import batch_update_scan_results
+from src.fema.flood import fema_flood
+from src.naip.baseline import naip_ndvi_fast
+from src.planet.client import planet_refine
+from src.point_cache import cached_point
+
+SIGNAL_WEIGHTS = {
+    "vegetation_overgrowth": 2.0,
+    "vegetation_neglect": 1.5,
+    "flood_risk": 1.5,
+    "structural_change": 2.5,
+}
+
+# Unknown signal codes weigh 1.0; distress_flags lists codes in sorted order
+_SIGNAL_WEIGHT = defaultdict(lambda: 1.0, SIGNAL_WEIGHTS)
+_FLAG_ORDER = tuple(sorted(SIGNAL_WEIGHTS))
+
+# scan_one passes no USPS data, so only these four codes can fire: track them
+# as a bitmask and look up the precomputed distress_flags string per mask
+VEG, NEGLECT, FLOOD, STRUCT = 1, 2, 4, 8
+_CODE_BIT = {"vegetation_overgrowth": VEG, "vegetation_neglect": NEGLECT,
+             "flood_risk": FLOOD, "structural_change": STRUCT}
+_FLAGS_BY_MASK = tuple(
+    ",".join(c for c in _FLAG_ORDER if _CODE_BIT[c] & mask) or None
+    for mask in range(16)
+)
+
+# Result fields for a parcel whose scan raised
+_ERROR_FIELDS = {
+    "ndvi_score": None, "ndvi_date": None, "ndvi_category": "error",
+    "fema_zone": None, "fema_risk": None, "fema_sfha": False,
+    "distress_score": None, "distress_flags": None,
+    "flag_veg": False, "flag_flood": False, "flag_structural": False, "flag_neglect": False,
+    "veg_confidence": None, "flood_confidence": None, "sentinel_worthy": False,
+}
+
+# Pass 1 is almost pure HTTP wait; size concurrency to the shared client
+# pools (HTTP_POOL_MAXSIZE=32), and run FEMA alongside NAIP per parcel.
+# naip_ndvi_fast only parses four band values from an identify response
+# (no raster decode), so threads, not processes, are the right pool here.
+# Override with SCAN_WORKERS / PLANET_WORKERS; past the pool size extra
+# workers just queue for a connection.
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", "32"))
+PLANET_WORKERS = int(os.environ.get("PLANET_WORKERS", "8"))
+WRITE_BATCH = 500  # Pass-1 rows per batch_update_scan_results call
+# Refinement searches the last month of scenes, so reuse it for a week;
+# re-runs while tuning thresholds then spend no Planet quota
+PLANET_CACHE_TTL = 7 * 86400
+REPORT_CLASSES = ("Vacant", "Residential 1 Family", "Mult-Sect Manufactured", "Vacant 10 Acres & Up")
+
+# One scan of the candidate rows: shuffle within each class bucket and keep
+# the first k of each, instead of three separately sorted UNION ALL branches
+SAMPLE_SQL = '''
+    WITH candidates AS (
+        SELECT parcel_id, latitude, longitude, county, property_class,
+               total_value, situs_address, SUBSTRING(mailing_zip FROM 1 FOR 5) as zip5,
+               CASE property_class WHEN 'Vacant' THEN 1
+                                   WHEN 'Residential 1 Family' THEN 2
+                                   ELSE 3 END AS bucket
+        FROM gis_parcels_core
+        WHERE county = 'Gaston' AND state_code = 'NC'
+          AND latitude IS NOT NULL AND scan_date IS NULL
+          AND property_class IN ('Vacant', 'Residential 1 Family',
+                                 'Mult-Sect Manufactured', 'Vacant 10 Acres & Up')
+    ), sampled AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY bucket ORDER BY RANDOM()) AS rn
+        FROM candidates
+    )
+    SELECT parcel_id, latitude, longitude, county, property_class,
+           total_value, situs_address, zip5
+    FROM sampled
+    WHERE rn <= CASE bucket WHEN 3 THEN 10 ELSE 20 END
+    ORDER BY bucket
+'''
+
+
+# One SAMPLE_SQL row, in its column order
+Parcel = namedtuple("Parcel", "parcel_id latitude longitude county property_class "
+                              "total_value situs_address zip5")
+
+
+@lru_cache(maxsize=4096)
+def _flags_for(ndvi: float | None, fema_key: tuple | None) -> tuple:
+    """
+    generate_all_flags as (signal_code, confidence) pairs, memoized on the
+    only inputs its evaluators read here: NAIP NDVI (no history) and FEMA
+    (zone, risk, sfha). Evidence is dropped; scan_one never reads it.
+    """
+    naip = None
+    if ndvi is not None:
+        naip = {"current_ndvi": ndvi, "mean_historical_ndvi": None, "errors": []}
+    fema = None
+    if fema_key is not None:
+        zone, risk, sfha = fema_key
+        fema = {"flood_zone": zone, "risk_level": risk, "is_sfha": sfha}
+    flags = generate_all_flags(naip=naip, sentinel=None, fema=fema)
+    return tuple((f["signal_code"], f["confidence"]) for f in flags)
+
+
+def scan_one(p: Parcel, scan_date: str, fema_executor: ThreadPoolExecutor):
+    pid = p.parcel_id
+    lat, lng = float(p.latitude), float(p.longitude)
+    # Fields shared by the success and error results
+    base = {
+        "parcel_id": pid,
+        "county": p.county,
+        "property_class": p.property_class,
+        "situs_address": p.situs_address,
+        "zip5": p.zip5,
+        "total_value": p.total_value,
+        "scan_date": scan_date,
+        "scan_pass": 1,
+        "lat": lat,
+        "lng": lng,
+    }
+    try:
+        # Memoized on disk and shared in flight: ~11 m for NAIP, ~110 m for flood polygons
+        fema_future = fema_executor.submit(cached_point, "fema", lat, lng, 3,
+                                           fema_flood, skip_map=True)
+        naip = cached_point("naip", lat, lng, 4, naip_ndvi_fast)
+        fema = None
+        try:
+            fema = fema_future.result()
+        except Exception:
+            pass
+
+        # The evaluators skip an errored NAIP/FEMA input exactly as if it were None
+        ndvi = None
+        if naip and naip.get("ndvi") is not None and not naip.get("error"):
+            ndvi = naip["ndvi"]
+        fema_key = None
+        if fema and not fema.get("errors"):
+            fema_key = (fema.get("flood_zone"), fema.get("risk_level", "unknown"),
+                        fema.get("is_sfha", False))
+
+        flags = _flags_for(ndvi, fema_key)
+
+        # One pass over the flags for both the weighted score and per-code confidence
+        score = 0.0
+        mask = 0
+        flag_confs = {}
+        for code, conf in flags:
+            score += _SIGNAL_WEIGHT[code] * conf
+            mask |= _CODE_BIT.get(code, 0)
+            flag_confs[code] = conf
+        score = round(min(score, 10.0), 2)
+
+        return {
+            **base,
+            "ndvi_score": naip.get("ndvi"),
+            "ndvi_date": naip.get("date"),
+            "ndvi_category": naip.get("category"),
+            "fema_zone": fema.get("flood_zone") if fema else None,
+            "fema_risk": fema.get("risk_level") if fema else None,
+            "fema_sfha": fema.get("is_sfha", False) if fema else False,
+            "distress_score": score,
+            "distress_flags": _FLAGS_BY_MASK[mask],
+            "flag_veg": bool(mask & VEG),
+            "flag_flood": bool(mask & FLOOD),
+            "flag_structural": bool(mask & STRUCT),
+            "flag_neglect": bool(mask & NEGLECT),
+            "veg_confidence": flag_confs.get("vegetation_overgrowth") or flag_confs.get("vegetation_neglect"),
+            "flood_confidence": flag_confs.get("flood_risk"),
+            "sentinel_worthy": bool(flags) or (naip.get("ndvi") is not None and naip["ndvi"] > 0.50),
+        }
+    except Exception as e:
+        return {**base, **_ERROR_FIELDS, "error": str(e)}
+
+
+def _refine_one(r) -> dict:
+    """Planet refinement for one flagged parcel; errors come back as {"error": ...}."""
+    try:
+        return cached_point("planet", float(r["lat"]), float(r["lng"]), 5,
+                            planet_refine, ttl=PLANET_CACHE_TTL)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def run_pass1(conn, on_selected=None, show_flagged: bool = False):
+    """
+    Pass 1: stream SAMPLE_SQL from a server-side cursor, scan every parcel
+    (NAIP + FEMA) and write results to gis_parcels_core WRITE_BATCH at a time.
+
+    Rows are submitted as they arrive, so scanning starts while the rest of
+    the selection is still streaming. on_selected(parcels) is called once
+    the selection is fully read, before the progress lines.
+
+    Returns (parcels, results, updated, elapsed_seconds).
+    """
+    start = time.time()
+    scan_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    parcels = []
+    results = []
+    flagged_so_far = 0
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="fema") as fema_executor, \
+            ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        scan = partial(scan_one, fema_executor=fema_executor)
+        futs = []
+        with conn.cursor(name="sample_parcels") as cur:
+            cur.itersize = 50
+            cur.execute(SAMPLE_SQL)
+            for row in cur:
+                p = Parcel(*row)
+                parcels.append(p)
+                futs.append(executor.submit(scan, p, scan_date))
+
+        if on_selected:
+            on_selected(parcels)
+
+        # Write as results land so writes overlap the remaining fetches and a
+        # crash keeps what was written. batch_update_scan_results COPYs just
+        # its own columns out of each result dict and applies one UPDATE ... FROM
+        updated = 0
+        pending = []
+        for f in as_completed(futs):
+            r = f.result()
+            results.append(r)
+            pending.append(r)
+            if len(pending) >= WRITE_BATCH:
+                updated += batch_update_scan_results(conn, pending)
+                pending.clear()
+            if r.get("distress_flags"):
+                flagged_so_far += 1
+            n = len(results)
+            if n % 10 == 0 or n == len(parcels):
+                print(f"  [{n}/{len(parcels)}] flagged={flagged_so_far}" if show_flagged
+                      else f"  [{n}/{len(parcels)}]")
+
+        updated += batch_update_scan_results(conn, pending)
+
+    return parcels, results, updated, time.time() - start
+
+
+def summarize_pass1(results: list[dict]) -> dict:
+    """
+    Every Pass-1 aggregate the scripts report, in one pass over results.
+
+    Returns {"flagged", "errors", "scores", "cats", "flag_counts", "by_class"};
+    by_class maps each REPORT_CLASSES entry to [n, flagged, ndvi_sum, ndvi_n].
+    """
+    flagged, errors, scores = [], [], []
+    cats = defaultdict(int)
+    flag_counts = {"veg": 0, "neglect": 0, "flood": 0, "structural": 0}
+    by_class = {pclass: [0, 0, 0.0, 0] for pclass in REPORT_CLASSES}
+    for r in results:
+        if r["distress_flags"]:
+            flagged.append(r)
+        if r.get("error") or r["ndvi_category"] == "error":
+            errors.append(r)
+        if r["distress_score"] and r["distress_score"] > 0:
+            scores.append(r["distress_score"])
+        cats[r["ndvi_category"] or "unknown"] += 1
+        if r["flag_veg"]: flag_counts["veg"] += 1
+        if r["flag_neglect"]: flag_counts["neglect"] += 1
+        if r["flag_flood"]: flag_counts["flood"] += 1
+        if r["flag_structural"]: flag_counts["structural"] += 1
+        cls = by_class.get(r.get("property_class"))
+        if cls is not None:
+            cls[0] += 1
+            if r["distress_flags"]:
+                cls[1] += 1
+            if r["ndvi_score"] is not None:
+                cls[2] += r["ndvi_score"]
+                cls[3] += 1
+    return {"flagged": flagged, "errors": errors, "scores": scores, "cats": cats,
+            "flag_counts": flag_counts, "by_class": by_class}
+
+
+def refine_flagged(flagged: list[dict], limit: int | None = None):
+    """
+    Pass 2: yield (result, planet) for flagged results in descending score
+    order (top `limit` if given), refining PLANET_WORKERS parcels at a time.
+
+    Each refinement is ~4 sequential Planet calls; map() yields in
+    submission order, so callers can print as results arrive.
+    """
+    ranked = sorted(flagged, key=lambda x: x["distress_score"] or 0, reverse=True)[:limit]
+    with ThreadPoolExecutor(max_workers=PLANET_WORKERS) as executor:
+        yield from zip(ranked, executor.map(_refine_one, ranked))
@@ -17,6 +17,7 @@ from datetime import datetime, timedelta
 
 import requests
 import structlog
+from requests.adapters import HTTPAdapter
 
 from src.storage import upload_bytes, make_point_key
 
@@ -24,6 +25,7 @@ logger = structlog.get_logger("planet.client")
 
 DATA_API = "https://api.planet.com/data/v1"
 TILES_API = "https://tiles.planet.com/data/v1"
+HTTP_POOL_MAXSIZE = 16  # keep-alive connections per host (Pass 2 refines up to 8 parcels at once)
 
 
 class PlanetClient:
@@ -32,6 +34,9 @@ class PlanetClient:
     def __init__(self):
         self.api_key = os.environ.get("Planet_API", "")
         self.session = requests.Session()
+        # No automatic retries: every Planet request counts against the quota
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_MAXSIZE)
+        self.session.mount("https://", adapter)
         if self.api_key:
             self.session.headers.update({
                 "Authorization": f"api-key {self.api_key}",
@@ -205,6 +210,18 @@ class PlanetClient:
             return None
 
 
+# Module-level shared client so concurrent refinements reuse one keep-alive
+# session (requests.Session is thread-safe for these GET/POST calls)
+_shared_client = None
+
+
+def _get_shared_client() -> PlanetClient:
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = PlanetClient()
+    return _shared_client
+
+
 def planet_search(lat: float, lng: float, months_back: int = 18) -> dict:
     """
     High-level: search Planet scenes at a point and return summary.
@@ -212,7 +229,7 @@ def planet_search(lat: float, lng: float, months_back: int = 18) -> dict:
     Returns dict with scene availability, counts, date range.
     If no API key, returns upgrade_required status.
     """
-    client = PlanetClient()
+    client = _get_shared_client()
 
     if not client.available:
         return {
@@ -283,7 +300,7 @@ def planet_refine(lat: float, lng: float, months_back: int = 18) -> dict:
     Budget: 4 API calls per parcel (2 searches + 2 thumbs).
     At 5K flagged parcels = 20K of 30K trial budget.
     """
-    client = PlanetClient()
+    client = _get_shared_client()
 
     if not client.available:
         return {
@@ -0,0 +1,93 @@
+"""
+Disk memo for per-point lookups (NAIP NDVI, FEMA zone, Planet refinement)
+in sample scans.
+
+Neighbouring parcels share a NAIP pixel window and a flood polygon, and
+re-running the same sample re-fetches every point. Results are stored as
+one JSON file per quantized (lat, lng) under data/cache/points, following
+the naip_pc STAC cache layout. Results carrying an error are not cached.
+
+Concurrent misses on the same quantized point are collapsed in-process:
+the first caller runs fn, the rest wait for and share its result, so a
+cluster of neighbouring parcels scanned at once costs one fetch.
+
+Usage:
+    naip = cached_point("naip", lat, lng, 4, naip_ndvi_fast)
+    fema = cached_point("fema", lat, lng, 3, fema_flood, skip_map=True)
+    planet = cached_point("planet", lat, lng, 5, planet_refine, ttl=7 * 86400)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+import structlog
+
+logger = structlog.get_logger("point_cache")
+
+CACHE_DIR = Path("data/cache/points")
+CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days
+
+# cache file -> Future of the fetch currently running for that point
+_inflight: dict[Path, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _cache_file(prefix: str, lat: float, lng: float, precision: int) -> Path:
+    key = f"{prefix}:{round(lat, precision)}:{round(lng, precision)}"
+    return CACHE_DIR / f"{prefix}_{hashlib.sha256(key.encode()).hexdigest()[:16]}.json"
+
+
+def _cacheable(result: dict) -> bool:
+    """Errors, and Planet's no-API-key placeholder, are never written to disk."""
+    return (bool(result) and not result.get("error") and not result.get("errors")
+            and result.get("status") != "upgrade_required")
+
+
+def cached_point(prefix: str, lat: float, lng: float, precision: int, fn,
+                 *, ttl: int = CACHE_TTL_SECONDS, **kwargs) -> dict:
+    """
+    Return fn(lat, lng, **kwargs), memoized on disk by (prefix, lat, lng)
+    rounded to `precision` decimals (5 ~ 1 m, 4 ~ 11 m, 3 ~ 110 m).
+    Entries older than `ttl` seconds are refetched.
+    """
+    cache_file = _cache_file(prefix, lat, lng, precision)
+    try:
+        if time.time() - cache_file.stat().st_mtime <= ttl:
+            return json.loads(cache_file.read_text())
+    except (OSError, json.JSONDecodeError):
+        pass
+
+    with _inflight_lock:
+        pending = _inflight.get(cache_file)
+        if pending is None:
+            pending = _inflight[cache_file] = Future()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        return pending.result()
+
+    try:
+        result = fn(lat, lng, **kwargs)
+        if _cacheable(result):
+            try:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                tmp = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps(result, default=str))
+                os.replace(tmp, cache_file)
+            except OSError as e:
+                logger.warning("point_cache_write_failed", prefix=prefix, error=str(e))
+    except BaseException as e:
+        pending.set_exception(e)
+        raise
+    else:
+        pending.set_result(result)
+    finally:
+        with _inflight_lock:
+            del _inflight[cache_file]
+    return result
@@ -15,7 +15,7 @@ from src.db import (
     sync_parcels_from_gis,
     get_signal_type_id,
     batch_get_parcel_uuids,
-    write_signal,
+    batch_write_signals,
 )
 
 logger = structlog.get_logger("signals")
@@ -98,7 +98,9 @@ def write_scan_results(conn, county_name: str, state_code: str,
         confidence: float (0.0 - 1.0)
         evidence: dict (JSONB payload)
 
-    Returns (success_count, failure_count).
+    Returns (success_count, failure_count). If the batch write itself fails,
+    the transaction is rolled back and the error re-raised so the caller can
+    retry the batch.
     """
     if not results:
         return (0, 0)
@@ -119,49 +121,41 @@ def write_scan_results(conn, county_name: str, state_code: str,
     # 5. Cache signal type IDs
     signal_type_cache = {}
 
-    success = 0
     failure = 0
+    rows = []
 
     for result in results:
-        try:
-            parcel_id = result["parcel_id"]
-            signal_code = result["signal_code"]
-
-            # Resolve parcel UUID
-            parcel_uuid = parcel_uuid_map.get(parcel_id)
-            if not parcel_uuid:
-                logger.warning("parcel_uuid_not_found", parcel_id=parcel_id)
-                failure += 1
-                continue
-
-            # Resolve signal type ID
-            if signal_code not in signal_type_cache:
-                signal_type_cache[signal_code] = get_signal_type_id(conn, signal_code)
-            signal_type_id = signal_type_cache[signal_code]
-
-            if not signal_type_id:
-                logger.warning("signal_type_not_found", code=signal_code)
-                failure += 1
-                continue
-
-            # Write signal
-            written = write_signal(
-                conn,
-                parcel_uuid=parcel_uuid,
-                signal_type_id=signal_type_id,
-                signal_date=result.get("signal_date", date.today()),
-                confidence=result["confidence"],
-                evidence=result["evidence"],
-            )
-
-            if written:
-                success += 1
-            else:
-                failure += 1
-
-        except Exception as e:
-            logger.error("write_signal_failed", parcel_id=result.get("parcel_id"), error=str(e))
+        parcel_id = result["parcel_id"]
+        signal_code = result["signal_code"]
+
+        # Resolve parcel UUID
+        parcel_uuid = parcel_uuid_map.get(parcel_id)
+        if not parcel_uuid:
+            logger.warning("parcel_uuid_not_found", parcel_id=parcel_id)
+            failure += 1
+            continue
+
+        # Resolve signal type ID
+        if signal_code not in signal_type_cache:
+            signal_type_cache[signal_code] = get_signal_type_id(conn, signal_code)
+        signal_type_id = signal_type_cache[signal_code]
+
+        if not signal_type_id:
+            logger.warning("signal_type_not_found", code=signal_code)
             failure += 1
+            continue
+
+        rows.append((parcel_uuid, signal_type_id, result.get("signal_date", date.today()),
+                     result["confidence"], result["evidence"]))
+
+    # 6. Write all signals in one COPY + UPDATE + INSERT
+    try:
+        success = batch_write_signals(conn, rows)
+    except Exception as e:
+        conn.rollback()
+        logger.error("write_signals_failed", count=len(rows), error=str(e))
+        raise
+    failure += len(rows) - success
 
     conn.commit()
     logger.info("scan_results_written", success=success, failure=failure)
@@ -6,12 +6,22 @@ gis_parcels_core only have street + county + state — no city or ZIP. This
 module fills the gap using the free Nominatim API.
 
 Usage policy: https://operations.osmfoundation.org/policies/nominatim/
-  - Max 1 request/sec (enforced via time.sleep)
+  - Max 1 request/sec (start times spaced via _wait_for_slot, safe across threads)
   - Must set a unique User-Agent
   - No bulk geocoding (we cache aggressively)
+
+Positive results are also persisted to an on-disk SQLite cache
+(~/.cache/usps_geocode.sqlite, override with USPS_GEOCODE_CACHE) so repeat
+runs and re-scans of the same county skip Nominatim entirely.
 """
 
+import atexit
+import hashlib
 import math
+import os
+import re
+import sqlite3
+import threading
 import time
 from typing import Optional
 
@@ -28,13 +38,101 @@ _MIN_INTERVAL = 1.0  # seconds between requests (Nominatim policy)
 # Negative results (confidence=none) expire after 10 minutes
 _cache: dict[str, tuple[dict, float]] = {}
 _NEGATIVE_TTL = 600  # 10 minutes
-_last_request: float = 0
+_next_slot: float = 0
+_slot_lock = threading.Lock()
+
+# Persistent cache: blake2b(street|county|state) -> (city, zip, confidence, ts)
+GEOCODE_CACHE_PATH = os.getenv(
+    "USPS_GEOCODE_CACHE", os.path.expanduser("~/.cache/usps_geocode.sqlite"))
+GEOCODE_CACHE_TTL = 90 * 86400  # 90 days
+_DISK_COMMIT_EVERY = 50
+_disk_conn: Optional[sqlite3.Connection] = None
+_disk_lock = threading.Lock()
+_disk_uncommitted = 0
 
 
 def _cache_key(street: str, county: str, state: str) -> str:
     return f"{street.strip().upper()}|{county.strip().upper()}|{state.strip().upper()}"
 
 
+def _disk_key(street: str, county: str, state: str) -> str:
+    street = re.sub(r"\s+", " ", street).strip().upper()
+    raw = f"{street}|{county.strip().upper()}|{state.strip().upper()}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _get_disk_cache() -> Optional[sqlite3.Connection]:
+    """Open the SQLite cache on first use. Returns None if it can't be opened."""
+    global _disk_conn
+    if _disk_conn is None:
+        try:
+            os.makedirs(os.path.dirname(GEOCODE_CACHE_PATH), exist_ok=True)
+            conn = sqlite3.connect(GEOCODE_CACHE_PATH, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS geo("
+                         "key TEXT PRIMARY KEY, city TEXT, zip TEXT, confidence TEXT, ts INTEGER)")
+            conn.commit()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("geocode_cache_unavailable", path=GEOCODE_CACHE_PATH, error=str(e))
+            return None
+        _disk_conn = conn
+        atexit.register(close_disk_cache)
+    return _disk_conn
+
+
+def _disk_get(key: str) -> Optional[dict]:
+    with _disk_lock:
+        conn = _get_disk_cache()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT city, zip, confidence FROM geo WHERE key = ? AND ts > ?",
+                           (key, int(time.time()) - GEOCODE_CACHE_TTL)).fetchone()
+    if row is None:
+        return None
+    return {"city": row[0], "zip": row[1], "source": "cache", "confidence": row[2]}
+
+
+def _disk_put(key: str, city: Optional[str], zipcode: Optional[str], confidence: str) -> None:
+    global _disk_uncommitted
+    with _disk_lock:
+        conn = _get_disk_cache()
+        if conn is None:
+            return
+        conn.execute("INSERT OR REPLACE INTO geo(key, city, zip, confidence, ts) VALUES (?, ?, ?, ?, ?)",
+                     (key, city, zipcode, confidence, int(time.time())))
+        _disk_uncommitted += 1
+        if _disk_uncommitted >= _DISK_COMMIT_EVERY:
+            conn.commit()
+            _disk_uncommitted = 0
+
+
+def close_disk_cache() -> None:
+    """Commit pending inserts and close the SQLite cache."""
+    global _disk_conn, _disk_uncommitted
+    with _disk_lock:
+        if _disk_conn is not None:
+            _disk_conn.commit()
+            _disk_conn.close()
+            _disk_conn = None
+            _disk_uncommitted = 0
+
+
+def _wait_for_slot() -> None:
+    """
+    Block until this thread may send the next Nominatim request.
+
+    Each caller reserves a start time _MIN_INTERVAL after the previous one,
+    so concurrent callers overlap their round-trips while request starts
+    stay at most 1/sec globally.
+    """
+    global _next_slot
+    with _slot_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot)
+        _next_slot = slot + _MIN_INTERVAL
+    if slot > now:
+        time.sleep(slot - now)
+
+
 def _haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     """Haversine distance in meters between two points."""
     R = 6371000
@@ -69,23 +167,26 @@ def resolve_city_zip(
             "confidence": "exact" | "ambiguous" | "none",
         }
     """
-    global _last_request
-
     key = _cache_key(street, county, state)
-    if key in _cache:
-        cached_result, cached_at = _cache[key]
-        # Expire negative results after TTL
+    entry = _cache.get(key)  # one lookup: another thread may evict the key
+    if entry is not None:
+        cached_result, cached_at = entry
+        # Expire negative results after TTL; another thread may already have
         if cached_result.get("confidence") == "none" and (time.time() - cached_at) > _NEGATIVE_TTL:
-            del _cache[key]
+            _cache.pop(key, None)
         else:
             out = cached_result.copy()
             out["source"] = "cache"
             return out
 
+    disk_key = _disk_key(street, county, state)
+    cached = _disk_get(disk_key)
+    if cached is not None:
+        _cache[key] = (cached, time.time())
+        return cached.copy()
+
     # Rate limit: 1 req/sec
-    elapsed = time.time() - _last_request
-    if elapsed < _MIN_INTERVAL:
-        time.sleep(_MIN_INTERVAL - elapsed)
+    _wait_for_slot()
 
     params = {
         "street": street,
@@ -104,7 +205,6 @@ def resolve_city_zip(
             headers={"User-Agent": USER_AGENT},
             timeout=10,
         )
-        _last_request = time.time()
         resp.raise_for_status()
         results = resp.json()
     except Exception as e:
@@ -147,6 +247,8 @@ def resolve_city_zip(
         "confidence": confidence,
     }
     _cache[key] = (result, time.time())
+    if confidence != "none":
+        _disk_put(disk_key, city, zipcode, confidence)
 
     logger.info("nominatim_resolved",
                 street=street, county=county, state=state,
@@ -33,6 +33,8 @@ Usage:
 """
 from __future__ import annotations
 
+import fcntl
+import json
 import os
 import random
 import time
@@ -55,6 +57,11 @@ ADDRESS_URL = "https://apis.usps.com/addresses/v3/address"
 DELAY_MIN = int(os.environ.get("USPS_CHAIN_DELAY_MIN", 30))
 DELAY_MAX = int(os.environ.get("USPS_CHAIN_DELAY_MAX", 55))
 
+# OAuth tokens are cached on disk per client_id so short repeat runs skip the
+# token round-trip. Set USPS_TOKEN_CACHE="" to disable.
+TOKEN_CACHE_PATH = os.environ.get(
+    "USPS_TOKEN_CACHE", os.path.expanduser("~/.cache/usps_tokens.json"))
+
 # 429 backoff: start here, double each consecutive 429, cap at max
 BACKOFF_START = 120      # 2 min
 BACKOFF_MAX = 900        # 15 min
@@ -104,6 +111,34 @@ def _get_credentials(account: int = 1) -> tuple[str, str]:
     return client_id, client_secret
 
 
+def _locked_token_cache(update=None) -> dict:
+    """
+    Read the on-disk token cache under an exclusive flock, optionally
+    applying `update(cache)` and writing it back before the lock is released.
+    Returns the cache dict ({} if disabled or unreadable).
+    """
+    if not TOKEN_CACHE_PATH:
+        return {}
+    try:
+        os.makedirs(os.path.dirname(TOKEN_CACHE_PATH), exist_ok=True)
+        fd = os.open(TOKEN_CACHE_PATH, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                cache = json.loads(f.read() or "{}")
+            except ValueError:
+                cache = {}
+            if update is not None:
+                update(cache)
+                f.seek(0)
+                f.truncate()
+                json.dump(cache, f)
+            return cache
+    except OSError as e:
+        logger.warning("usps_token_cache_unavailable", path=TOKEN_CACHE_PATH, error=str(e))
+        return {}
+
+
 # US state abbreviations for situs address parsing
 _STATE_CODES = {
     "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA",
@@ -114,6 +149,24 @@ _STATE_CODES = {
     "DC",
 }
 
+# Ambiguous tokens: both a state code AND a common street suffix
+# e.g. "CT" = Connecticut OR Court, "IN" = Indiana OR a preposition
+_AMBIGUOUS_STATE_SUFFIX = frozenset({"CT", "IN", "AL", "ME", "OR"})
+
+# Street suffixes used for city/street boundary detection
+_STREET_SUFFIXES = frozenset({
+    "ST", "AVE", "AV", "RD", "DR", "LN", "CT", "CIR", "BLVD",
+    "WAY", "PL", "TRL", "LOOP", "HWY", "PKY", "PKWY", "COVE",
+    "CV", "RUN", "PATH", "PASS", "PT", "PIKE", "SQ", "TER",
+    "TERR", "ALY", "ROW", "WALK", "XING", "EXT", "BND", "CRES",
+    "GRV", "HOLW", "IS", "KNL", "LK", "LNDG", "MALL", "MNR",
+    "MDW", "MDWS", "ML", "MLS", "OVAL", "PARK", "PLZ", "RIDGE",
+    "RDG", "SHR", "SPG", "SPUR", "TRCE", "VLY", "VW", "VISTA",
+})
+
+# Non-city tokens that can sit where the city would be, e.g. "UNINC"
+_SKIP_CITY_WORDS = frozenset({"UNINC", "UNINCORP", "UNINCORPORATED", "COUNTY", "TWP", "TOWNSHIP"})
+
 
 def split_situs(
     situs: str,
@@ -147,21 +200,6 @@ def split_situs(
     if not parts:
         return {"street": situs.strip(), "city": fallback_city, "state": fallback_state, "zip_code": zip_code}
 
-    # Ambiguous tokens: both a state code AND a common street suffix
-    # e.g. "CT" = Connecticut OR Court, "IN" = Indiana OR a preposition
-    _AMBIGUOUS_STATE_SUFFIX = {"CT", "IN", "AL", "ME", "OR"}
-
-    # Street suffixes used for city/street boundary detection
-    street_suffixes = {
-        "ST", "AVE", "AV", "RD", "DR", "LN", "CT", "CIR", "BLVD",
-        "WAY", "PL", "TRL", "LOOP", "HWY", "PKY", "PKWY", "COVE",
-        "CV", "RUN", "PATH", "PASS", "PT", "PIKE", "SQ", "TER",
-        "TERR", "ALY", "ROW", "WALK", "XING", "EXT", "BND", "CRES",
-        "GRV", "HOLW", "IS", "KNL", "LK", "LNDG", "MALL", "MNR",
-        "MDW", "MDWS", "ML", "MLS", "OVAL", "PARK", "PLZ", "RIDGE",
-        "RDG", "SHR", "SPG", "SPUR", "TRCE", "VLY", "VW", "VISTA",
-    }
-
     # Check if last token is a 2-letter state code
     if len(parts) >= 3 and parts[-1].upper() in _STATE_CODES:
         state = parts[-1].upper()
@@ -178,8 +216,7 @@ def split_situs(
         city_candidate = parts[-2].upper()
 
         # Skip non-city tokens like "UNINC"
-        skip_words = {"UNINC", "UNINCORP", "UNINCORPORATED", "COUNTY", "TWP", "TOWNSHIP"}
-        if city_candidate in skip_words or city_candidate.isdigit():
+        if city_candidate in _SKIP_CITY_WORDS or city_candidate.isdigit():
             street = " ".join(parts[:-2])
             return {"street": street, "city": fallback_city, "state": state, "zip_code": zip_code}
 
@@ -188,7 +225,7 @@ def split_situs(
         idx = len(parts) - 2  # start just before state
         while idx > 0:
             token = parts[idx].upper().rstrip(",.")
-            if token in street_suffixes:
+            if token in _STREET_SUFFIXES:
                 break
             city_parts.insert(0, parts[idx])
             idx -= 1
@@ -248,10 +285,17 @@ class USPSVacancyChecker:
         self._session.headers["User-Agent"] = "DistressScanner/1.0"
 
     def _authenticate(self) -> None:
-        """Get or refresh OAuth2 bearer token."""
+        """Get or refresh OAuth2 bearer token (reusing a cached one if still valid)."""
         if self._token and time.time() < self._token_expires - 60:
             return  # token still valid
 
+        cached = _locked_token_cache().get(self._client_id)
+        if cached and time.time() < cached["exp"] - 60:
+            self._token = cached["token"]
+            self._token_expires = cached["exp"]
+            logger.info("usps_token_reused", account=self.account)
+            return
+
         resp = self._session.post(
             TOKEN_URL,
             json={
@@ -267,6 +311,16 @@ class USPSVacancyChecker:
         self._token_expires = time.time() + data.get("expires_in", 3600)
         logger.info("usps_authenticated", account=self.account)
 
+        def store(cache):
+            cache[self._client_id] = {"token": self._token, "exp": self._token_expires}
+        _locked_token_cache(store)
+
+    def _drop_token(self) -> None:
+        """Forget a token the API rejected, in memory and in the disk cache."""
+        self._token = None
+        self._token_expires = 0
+        _locked_token_cache(lambda cache: cache.pop(self._client_id, None))
+
     def _random_delay(self) -> None:
         """Wait a random duration between requests. Not fixed, not predictable."""
         if self._last_request <= 0:
@@ -359,6 +413,16 @@ class USPSVacancyChecker:
                 headers={"Authorization": f"Bearer {self._token}"},
                 timeout=30,
             )
+            if resp.status_code == 401:
+                # Cached/revoked token — mint a fresh one and retry once
+                self._drop_token()
+                self._authenticate()
+                resp = self._session.get(
+                    ADDRESS_URL,
+                    params=params,
+                    headers={"Authorization": f"Bearer {self._token}"},
+                    timeout=30,
+                )
             self._last_request = time.time()
             self._request_count += 1
 
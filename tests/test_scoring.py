@@ -4,3 +4,136 @@
 def test_placeholder():
     """Placeholder — real scoring tests added in Phase C."""
     assert 1 + 1 == 2
+
+
+def test_vectorized_conviction_matches_scalar():
+    """compute_all_scores (NumPy) agrees with the scalar compute_conviction reference."""
+    from scripts.batch_conviction_score import _parcel_columns, compute_all_scores, compute_conviction
+
+    parcels = []
+    for i, (ds, mc_raw, mc_count, vac, conf, err) in enumerate([
+        (None, None, 0, False, None, None),      # not rankable
+        (None, None, 0, True, 0.9, None),        # not rankable, vacancy only
+        (7.3, None, 0, False, None, None),       # DS only
+        (None, 3.5, 2, False, None, None),       # MC only
+        (12.0, 9.0, 3, True, None, None),        # clamped, default confidence
+        (4.0, 1.2, 1, True, 0, None),            # zero confidence -> default
+        (4.0, 1.2, 1, True, 0.5, "timeout"),     # usps_error suppresses bonus
+        (0.0, 0, 0, True, 1.4, None),            # DS zero + clamped confidence
+    ]):
+        parcels.append({
+            "parcel_id": f"P{i}", "distress_composite": ds, "mc_raw_score": mc_raw,
+            "mc_signal_count": mc_count, "flag_vacancy": vac, "vacancy_confidence": conf,
+            "usps_error": err, "mc_signal_codes": None,
+        })
+
+    rows = [(p["parcel_id"], p["distress_composite"], p["flag_vacancy"], p["vacancy_confidence"],
+             p["usps_error"], p["mc_raw_score"], p["mc_signal_count"], p["mc_signal_codes"])
+            for p in parcels]
+    results = compute_all_scores(_parcel_columns(rows))
+    for i, p in enumerate(parcels):
+        r = results.record(i)
+        score, base, vac_bonus, components = compute_conviction(
+            ds_composite=p["distress_composite"],
+            mc_raw=float(p["mc_raw_score"]) if p["mc_raw_score"] else 0,
+            mc_count=p["mc_signal_count"],
+            flag_vacancy=p["flag_vacancy"],
+            vac_conf=float(p["vacancy_confidence"]) if p["vacancy_confidence"] else None,
+            usps_error=p["usps_error"],
+        )
+        assert r["conviction_score"] == score
+        assert r["conviction_base_score"] == base
+        assert r["conviction_vacancy_bonus"] == vac_bonus
+        assert r["conviction_components"] == (",".join(components) or None)
+
+
+def test_vectorized_ndvi_slopes_match_scalar():
+    """compute_ndvi_slopes agrees with compute_ndvi_slope on ragged NaN-padded rows."""
+    import numpy as np
+    from src.naip.baseline import compute_ndvi_slope, compute_ndvi_slopes
+
+    rows = [
+        [],
+        [(2020, 0.4)],
+        [(2014, 0.35), (2020, 0.52)],
+        [(2012, 0.30), (2014, 0.33), (2016, 0.31), (2018, 0.40), (2020, 0.45), (2022, 0.41)],
+    ]
+    years = np.full((len(rows), 7), np.nan)
+    ndvi = np.full_like(years, np.nan)
+    for i, points in enumerate(rows):
+        for j, (year, value) in enumerate(points):
+            years[i, j], ndvi[i, j] = year, value
+
+    for points, slope in zip(rows, compute_ndvi_slopes(years, ndvi)):
+        expected = compute_ndvi_slope(points)
+        if expected is None:
+            assert slope is None
+        else:
+            assert abs(slope - expected) < 1e-6
+
+
+def test_score_batch_matches_per_parcel_scoring():
+    """score_batch (NumPy) reproduces the old per-parcel weighted-sum scoring."""
+    from scripts.batch_ndvi_scan import SIGNAL_WEIGHTS, score_batch
+
+    flag_sets = [
+        [],
+        [("vegetation_overgrowth", 0.72)],
+        [("vegetation_neglect", 0.45), ("flood_risk", 0.9)],
+        [("vegetation_overgrowth", 1.0), ("structural_change", 1.0), ("flood_risk", 0.9),
+         ("vegetation_neglect", 0.3)],                                   # clamped at 10
+    ]
+    batch = [{"parcel_id": f"P{i}", "flags": [{"signal_code": c, "confidence": x} for c, x in fs]}
+             for i, fs in enumerate(flag_sets)]
+    score_batch(batch)
+
+    for r, fs in zip(batch, flag_sets):
+        confs = dict(fs)
+        score = round(min(sum(SIGNAL_WEIGHTS[c] * x for c, x in fs), 10.0), 2)
+        assert "flags" not in r
+        assert r["distress_score"] == score
+        assert r["distress_flags"] == (",".join(sorted(confs)) or None)
+        assert r["flag_veg"] == ("vegetation_overgrowth" in confs)
+        assert r["flag_neglect"] == ("vegetation_neglect" in confs)
+        assert r["flag_flood"] == ("flood_risk" in confs)
+        assert r["flag_structural"] == ("structural_change" in confs)
+        assert r["veg_confidence"] == (confs.get("vegetation_overgrowth") or confs.get("vegetation_neglect"))
+        assert r["flood_confidence"] == confs.get("flood_risk")
+
+
+def test_fema_zone_cache_reuses_rounded_point():
+    """Two lookups on the same rounded grid point hit the FEMA client once."""
+    from src.fema import flood
+
+    class FakeClient:
+        calls = 0
+
+        def query_flood_zone(self, lat, lng):
+            FakeClient.calls += 1
+            return {"flood_zone": "X", "risk_level": "low", "is_sfha": False}
+
+    flood._zone_cache.clear()
+    client = FakeClient()
+    first = flood._query_flood_zone_cached(client, 35.26241, -81.18712)
+    second = flood._query_flood_zone_cached(client, 35.26238, -81.18709)
+    flood._zone_cache.clear()
+
+    assert FakeClient.calls == 1
+    assert first == second
+
+
+def test_parse_situs_fast_path_falls_back_on_bad_fields():
+    """Comma-delimited situs with a non-city or bad state goes through split_situs."""
+    from scripts.batch_usps_enrich import _parse_situs
+
+    assert _parse_situs("123 MAIN ST, CHARLOTTE, NC 28202", "NC") == {
+        "street": "123 MAIN ST", "city": "CHARLOTTE", "state": "NC", "zip_code": "28202"}
+
+    uninc = _parse_situs("45 OAK CT, UNINC, NC 28012", "NC")
+    assert uninc["city"] is None and uninc["state"] == "NC"
+
+    zip_city = _parse_situs("718 NORTON DR, 28052, NC", "NC")
+    assert zip_city["city"] is None and zip_city["street"] == "718 NORTON DR"
+
+    bad_state = _parse_situs("12 ELM RD, BELMONT, XX 28012", "NC")
+    assert bad_state["state"] == "NC" and bad_state["zip_code"] == "28012"